@@ -0,0 +1,121 @@
+import time
+from datetime import date
+import sqlalchemy as sa
+from models import ArchivedTransactionLog, MonthlyBalanceSummary, TransactionLog
+from versions import bump_version
+
+# Logs archived per transaction; each batch holds the write lock only briefly
+COMPACT_BATCH_SIZE = 5000
+
+def _month(timestamp):
+    return date(timestamp.year, timestamp.month, 1)
+
+def summarize_logs(rows):
+    """
+    Fold logs, in (timestamp, id) order, into per-account, per-month
+    summaries keyed by (account_id, month).
+    """
+    months = {}
+    for row in rows:
+        key = (row.account_id, _month(row.timestamp))
+        summary = months.get(key)
+        if summary is None:
+            months[key] = {
+                'account_id': row.account_id,
+                'month': key[1],
+                'opening_balance': row.previous_balance,
+                'closing_balance': row.new_balance,
+                'net_change': row.change_amount,
+                'log_count': 1,
+                'first_logged_at': row.timestamp,
+                'last_logged_at': row.timestamp,
+            }
+        else:
+            summary['closing_balance'] = row.new_balance
+            summary['net_change'] += row.change_amount
+            summary['log_count'] += 1
+            summary['last_logged_at'] = row.timestamp
+    return months
+
+def _merge_summaries(conn, months):
+    """Add a batch's monthly summaries to the stored ones, inserting new months."""
+    S = MonthlyBalanceSummary.__table__
+    existing = conn.execute(
+        sa.select(S).where(sa.tuple_(S.c.account_id, S.c.month).in_(list(months)))
+    ).mappings().all()
+
+    for stored in existing:
+        summary = months.pop((stored['account_id'], stored['month']))
+        values = {
+            'net_change': stored['net_change'] + summary['net_change'],
+            'log_count': stored['log_count'] + summary['log_count'],
+        }
+        # A batch normally continues a month, but take whichever end is
+        # earlier or later in case logs were written out of order.
+        if summary['first_logged_at'] < stored['first_logged_at']:
+            values['opening_balance'] = summary['opening_balance']
+            values['first_logged_at'] = summary['first_logged_at']
+        if summary['last_logged_at'] >= stored['last_logged_at']:
+            values['closing_balance'] = summary['closing_balance']
+            values['last_logged_at'] = summary['last_logged_at']
+        conn.execute(
+            sa.update(S)
+            .where(S.c.account_id == stored['account_id'], S.c.month == stored['month'])
+            .values(**values)
+        )
+
+    if months:
+        conn.execute(sa.insert(S), list(months.values()))
+
+def compact_batch(conn, cutoff, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Archive up to batch_size of the oldest logs before cutoff in the
+    caller's transaction.
+
+    The logs are copied to the archive table, folded into the monthly
+    summaries and deleted from transaction_logs. Returns the number
+    archived; 0 means nothing before cutoff is left.
+    """
+    T = TransactionLog.__table__
+    rows = conn.execute(
+        sa.select(T).where(T.c.timestamp < cutoff).order_by(T.c.timestamp, T.c.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    conn.execute(sa.insert(ArchivedTransactionLog.__table__), [dict(row._mapping) for row in rows])
+    _merge_summaries(conn, summarize_logs(rows))
+    conn.execute(sa.delete(T).where(T.c.id.in_([row.id for row in rows])))
+    bump_version(conn)
+    return len(rows)
+
+def compact_logs(engine, cutoff, batch_size=COMPACT_BATCH_SIZE, pause=0.0, max_batches=None, progress=None):
+    """
+    Archive every log before cutoff, one short transaction per batch.
+
+    Committing each batch separately keeps the app online: readers are
+    never blocked and writers wait at most one batch. pause seconds are
+    slept between batches to leave room for them. progress(archived), if
+    given, is called after each batch. Returns the total archived.
+    """
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            archived = compact_batch(conn, cutoff, batch_size)
+        if not archived:
+            break
+        total += archived
+        batches += 1
+        if progress is not None:
+            progress(total)
+        if pause:
+            time.sleep(pause)
+    return total
+
+def monthly_summaries(conn, account_id):
+    """An account's archived monthly summaries, oldest month first."""
+    S = MonthlyBalanceSummary.__table__
+    return conn.execute(
+        sa.select(S).where(S.c.account_id == account_id).order_by(S.c.month)
+    ).mappings().all()
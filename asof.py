@@ -0,0 +1,196 @@
+from datetime import datetime, time, timedelta, timezone
+import sqlalchemy as sa
+from models import Account, ArchivedTransactionLog, BalanceCheckpoint, Bank, TransactionLog
+from money import from_pence, pence_array
+from rollups import NO_FRN
+
+# Account columns as-of balances can be grouped by
+BALANCE_GROUPS = ('frn', 'owner', 'account_type', 'savings')
+
+# Hot and archived logs; an as-of query may need either
+LOG_TABLES = (ArchivedTransactionLog.__table__, TransactionLog.__table__)
+
+def parse_timestamp(value):
+    """
+    A naive UTC datetime from an ISO date or datetime, as timestamps are
+    stored; one with a UTC offset is converted to UTC. Raises ValueError
+    for anything else.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_as_of(value):
+    """A datetime from an ISO date or datetime; a bare date means the end of that day."""
+    as_of = parse_timestamp(value)
+    if len(value) == 10:
+        as_of += timedelta(days=1) - timedelta(microseconds=1)
+    return as_of
+
+def latest_checkpoint(conn, as_of):
+    """The newest checkpoint taken at or before as_of, or None."""
+    return conn.execute(
+        sa.select(sa.func.max(BalanceCheckpoint.taken_at)).where(BalanceCheckpoint.taken_at <= as_of)
+    ).scalar()
+
+def _checkpoint_balances(conn, taken_at):
+    import pandas as pd
+
+    if taken_at is None:
+        return pd.Series(dtype=float)
+    rows = conn.execute(
+        sa.select(BalanceCheckpoint.account_id, BalanceCheckpoint.balance)
+        .where(BalanceCheckpoint.taken_at == taken_at)
+    ).all()
+    return pd.DataFrame(rows, columns=['account_id', 'balance']).set_index('account_id')['balance']
+
+def _replayed_balances(conn, since, as_of):
+    """
+    Each account's balance after its last log in (since, as_of], replayed
+    from the hot and archived logs in one vectorized pass.
+    """
+    import pandas as pd
+
+    frames = []
+    for table in LOG_TABLES:
+        stmt = sa.select(table.c.account_id, table.c.timestamp, table.c.id, table.c.new_balance).where(
+            table.c.timestamp <= as_of
+        )
+        if since is not None:
+            stmt = stmt.where(table.c.timestamp > since)
+        rows = conn.execute(stmt).all()
+        if rows:
+            frames.append(pd.DataFrame(rows, columns=['account_id', 'timestamp', 'id', 'new_balance']))
+    if not frames:
+        return pd.Series(dtype=float)
+
+    logs = pd.concat(frames, ignore_index=True).sort_values(['timestamp', 'id'])
+    return logs.groupby('account_id')['new_balance'].last()
+
+def _accounts_frame(conn, as_of):
+    """
+    Every account with its grouping columns and a fallback balance for
+    accounts with no log or checkpoint by as_of: the balance its first
+    later log started from, or its current balance if it has none.
+    """
+    import pandas as pd
+
+    def first_after(table):
+        return sa.select(table.c.previous_balance).where(
+            table.c.account_id == Account.id, table.c.timestamp > as_of
+        ).order_by(table.c.timestamp, table.c.id).limit(1).scalar_subquery()
+
+    archived, hot = LOG_TABLES
+    stmt = sa.select(
+        Account.id,
+        Account.account_name,
+        Account.account_number,
+        Account.owner,
+        Account.account_type,
+        Account.savings,
+        sa.func.coalesce(Bank.frn, NO_FRN).label('frn'),
+        Account.created_at,
+        sa.func.coalesce(first_after(archived), first_after(hot), Account.balance).label('fallback')
+    ).outerjoin(Bank, Bank.id == Account.bank_id)
+
+    columns = ['id', 'account_name', 'account_number', 'owner', 'account_type', 'savings', 'frn',
+               'created_at', 'fallback']
+    return pd.DataFrame(conn.execute(stmt).all(), columns=columns).set_index('id')
+
+def balances_as_of(conn, as_of):
+    """
+    Every account's balance at as_of, read from the nearest checkpoint plus
+    the logs after it.
+
+    Returns (accounts, taken_at): a DataFrame indexed by account id with the
+    account's current grouping columns and a balance column, and the
+    checkpoint used (None if none precedes as_of). Accounts created after
+    as_of with no earlier log are left out; deleted accounts cannot be
+    reconstructed.
+    """
+    taken_at = latest_checkpoint(conn, as_of)
+    known = _replayed_balances(conn, taken_at, as_of).combine_first(_checkpoint_balances(conn, taken_at))
+
+    accounts = _accounts_frame(conn, as_of)
+    existed = accounts.index.isin(known.index) | ~(accounts['created_at'] > as_of)
+    accounts = accounts[existed].copy()
+    accounts['balance'] = known.reindex(accounts.index).fillna(accounts['fallback'])
+    return accounts.drop(columns=['created_at', 'fallback']), taken_at
+
+def grouped_balances(conn, as_of, columns):
+    """
+    Account counts and balance totals at as_of grouped by the given
+    BALANCE_GROUPS columns, in the shape grouped_totals rows have, with the
+    totals summed exactly in pence. Grouping by frn leaves out accounts
+    without a bank, as the rollups do.
+    """
+    accounts, taken_at = balances_as_of(conn, as_of)
+    if 'frn' in columns:
+        accounts = accounts[accounts['frn'] != NO_FRN]
+    accounts = accounts.assign(pence=pence_array(accounts['balance'].fillna(0.0)))
+    grouped = accounts.groupby(list(columns)).agg(
+        account_count=('pence', 'size'),
+        total_balance=('pence', 'sum')
+    ).reset_index()
+    grouped['total_balance'] = from_pence(grouped['total_balance'])
+    return grouped.to_dict('records'), taken_at
+
+def balances_payload(conn, as_of, columns=()):
+    """Balances at as_of for the API: one entry per account, or per group when columns are given."""
+    if columns:
+        balances, taken_at = grouped_balances(conn, as_of, columns)
+    else:
+        accounts, taken_at = balances_as_of(conn, as_of)
+        balances = accounts.sort_index().reset_index().to_dict('records')
+    return {
+        'as_of': as_of.isoformat(),
+        'checkpoint': taken_at.isoformat() if taken_at else None,
+        'group_by': list(columns) or 'account',
+        'balances': balances,
+    }
+
+def build_checkpoint(conn, taken_at):
+    """Record every account's balance at taken_at, replacing any checkpoint already there."""
+    accounts, _ = balances_as_of(conn, taken_at)
+    conn.execute(sa.delete(BalanceCheckpoint).where(BalanceCheckpoint.taken_at == taken_at))
+    if len(accounts):
+        conn.execute(sa.insert(BalanceCheckpoint), [
+            {'taken_at': taken_at, 'account_id': int(account_id), 'balance': float(balance)}
+            for account_id, balance in accounts['balance'].items()
+        ])
+    return len(accounts)
+
+def build_checkpoints(engine, every, until, rebuild=False, progress=None):
+    """
+    Add a checkpoint every `every` (a timedelta) up to until, continuing
+    from the newest one or, without any, from midnight of the first logged
+    day.
+
+    Each checkpoint replays only the logs since the one before it and is
+    committed on its own. rebuild drops the existing checkpoints first,
+    which is needed after logs were backdated or a database was restored.
+    progress(taken_at, accounts), if given, is called after each one.
+    Returns the number of checkpoints built.
+    """
+    with engine.begin() as conn:
+        if rebuild:
+            conn.execute(sa.delete(BalanceCheckpoint))
+        start = conn.execute(sa.select(sa.func.max(BalanceCheckpoint.taken_at))).scalar()
+        if start is None:
+            firsts = [conn.execute(sa.select(sa.func.min(table.c.timestamp))).scalar() for table in LOG_TABLES]
+            firsts = [first for first in firsts if first is not None]
+            if not firsts:
+                return 0
+            start = datetime.combine(min(firsts).date(), time.min)
+
+    built = 0
+    taken_at = start + every
+    while taken_at <= until:
+        with engine.begin() as conn:
+            accounts = build_checkpoint(conn, taken_at)
+        built += 1
+        if progress is not None:
+            progress(taken_at, accounts)
+        taken_at += every
+    return built
@@ -0,0 +1,311 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import date, datetime
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+from models import db, DataVersion
+
+SNAPSHOT_FORMATS = ('parquet', 'csv')
+
+# How CSV snapshots write NULL, so it stays distinct from an empty string
+CSV_NULL = '\\N'
+
+# Pages copied per step of the online backup; the source is unlocked
+# between steps so writers are never held up for the whole copy.
+BACKUP_PAGES_PER_STEP = 1024
+
+def sqlite_path(uri):
+    """The database file behind a sqlite:/// URI, or None for other backends."""
+    url = sa.engine.make_url(uri)
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return url.database
+
+def backup_database(source_path, dest_path, pages=BACKUP_PAGES_PER_STEP, progress=None):
+    """
+    Copy a live SQLite database to dest_path with the online backup API.
+
+    The copy runs pages at a time; a write from another connection between
+    steps makes SQLite restart the copy rather than produce a torn file.
+    progress(remaining, total), if given, is called after each step.
+    Returns the size of the copy in bytes.
+    """
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(remaining, total)
+
+    if os.path.exists(dest_path + '-wal'):
+        # Moving a new file under a live WAL would have SQLite replay it there
+        raise RuntimeError(f"{dest_path} is a live database; restore into it with restore_database")
+
+    tmp_path = dest_path + '.part'
+    source = sqlite3.connect(source_path)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        source.backup(dest, pages=pages, progress=step)
+        result = dest.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise RuntimeError(f"Backup failed its integrity check: {result}")
+    finally:
+        dest.close()
+        source.close()
+    os.replace(tmp_path, dest_path)
+    return os.path.getsize(dest_path)
+
+def restore_database(source_path, target_path):
+    """
+    Replace the contents of the SQLite database at target_path with the
+    database at source_path, through the online backup API.
+
+    The copy goes in through a connection on the target, in one step under
+    its write lock, so SQLite itself deals with the target's WAL and
+    shared-memory files: replacing the file underneath them would let a
+    stale WAL be replayed over the restored data. A target in WAL mode is
+    checkpointed afterwards, leaving the whole restore in the main file.
+
+    The restored data_version is then set past both the target's and the
+    backup's, so ETags and cached responses from before the restore can
+    never match a later version. Returns the size of the restored database
+    in bytes.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source_page_size = source.execute('PRAGMA page_size').fetchone()[0]
+        target_page_size = target.execute('PRAGMA page_size').fetchone()[0]
+        wal = target.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal and source_page_size != target_page_size:
+            raise RuntimeError(f"Cannot restore {source_page_size}-byte pages into a WAL database with "
+                               f"{target_page_size}-byte pages")
+
+        version = _data_version(target)
+        source.backup(target)
+        _advance_data_version(target, max(version, _data_version(target)) + 1)
+        target.commit()
+        if wal:
+            target.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        result = target.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise RuntimeError(f"Restored database failed its integrity check: {result}")
+    finally:
+        target.close()
+        source.close()
+    return os.path.getsize(target_path)
+
+def _data_version(conn):
+    """The data version recorded in a SQLite database, 0 if it has none."""
+    table = DataVersion.__tablename__
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None:
+        return 0
+    row = conn.execute(f"SELECT version FROM {table} WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def _advance_data_version(conn, version):
+    table = DataVersion.__tablename__
+    conn.execute(str(sa.schema.CreateTable(DataVersion.__table__, if_not_exists=True).compile(dialect=sqlite.dialect())))
+    conn.execute(f"INSERT OR REPLACE INTO {table} (id, version) VALUES (1, ?)", (version,))
+
+def _arrow_schema(table):
+    import pyarrow as pa
+
+    fields = []
+    for column in table.columns:
+        python_type = _python_type(column)
+        if python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is float:
+            arrow_type = pa.float64()
+        elif python_type is bool:
+            arrow_type = pa.bool_()
+        elif python_type is datetime:
+            arrow_type = pa.timestamp('us')
+        elif python_type is date:
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def _python_type(column):
+    if isinstance(column.type, sa.JSON):
+        return 'json'
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return str
+
+def _encode(row, columns, null=None):
+    """A row's values in a form every snapshot format can hold, with NULL written as null."""
+    values = {}
+    for column in columns:
+        value = row[column.name]
+        if value is None:
+            value = null
+        elif _python_type(column) == 'json':
+            value = json.dumps(value)
+        values[column.name] = value
+    return values
+
+def _decode_csv(row, columns):
+    """Convert a snapshot CSV row's strings back to column values."""
+    values = {}
+    for column in columns:
+        value = row[column.name]
+        python_type = _python_type(column)
+        if value == CSV_NULL:
+            value = None
+        else:
+            if python_type == 'json':
+                value = json.loads(value)
+            elif python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            elif python_type is bool:
+                value = value == 'True'
+            elif python_type in (int, float):
+                value = python_type(value)
+        values[column.name] = value
+    return values
+
+def _decode_parquet(row, columns):
+    for column in columns:
+        if row[column.name] is not None and _python_type(column) == 'json':
+            row[column.name] = json.loads(row[column.name])
+    return row
+
+def write_snapshot(conn, directory, fmt='parquet', batch_size=50000):
+    """
+    Write every table to directory as one compressed file per table.
+
+    parquet (zstd, one row group per batch; needs pyarrow) is columnar and
+    the fastest to restore; csv writes gzipped CSV with the standard
+    library only. Rows are streamed batch_size at a time. Returns
+    {table name: row count}.
+    """
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(SNAPSHOT_FORMATS)}")
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for table in db.metadata.sorted_tables:
+        columns = list(table.columns)
+        result = conn.execution_options(yield_per=batch_size).execute(
+            sa.select(table).order_by(*table.primary_key.columns)
+        )
+        count = 0
+        if fmt == 'parquet':
+            schema = _arrow_schema(table)
+            with pq.ParquetWriter(os.path.join(directory, f"{table.name}.parquet"), schema,
+                                  compression='zstd') as writer:
+                for partition in result.mappings().partitions():
+                    rows = [_encode(row, columns) for row in partition]
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                    count += len(rows)
+        else:
+            with gzip.open(os.path.join(directory, f"{table.name}.csv.gz"), 'wt', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=[column.name for column in columns])
+                writer.writeheader()
+                for partition in result.mappings().partitions():
+                    writer.writerows(_encode(row, columns, CSV_NULL) for row in partition)
+                    count += len(partition)
+        counts[table.name] = count
+    return counts
+
+def _snapshot_batches(directory, table, batch_size):
+    """Yield lists of row dicts for one table from whichever snapshot file exists."""
+    columns = list(table.columns)
+    parquet_path = os.path.join(directory, f"{table.name}.parquet")
+    csv_path = os.path.join(directory, f"{table.name}.csv.gz")
+
+    if os.path.exists(parquet_path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=batch_size):
+            yield [_decode_parquet(row, columns) for row in batch.to_pylist()]
+    elif os.path.exists(csv_path):
+        with gzip.open(csv_path, 'rt', newline='', encoding='utf-8') as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(_decode_csv(row, columns))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+def restore_snapshot(directory, target_path, batch_size=50000):
+    """
+    Build a new SQLite database at target_path from a snapshot directory.
+
+    Tables are created without their indexes and loaded in one transaction
+    with foreign key checks deferred and journaling relaxed; the indexes
+    are built once at the end, which is far cheaper than maintaining them
+    row by row. The database is assembled beside target_path and copied in
+    with restore_database only when complete. Returns a list of (table,
+    rows, seconds).
+    """
+    if not any(name.endswith(('.parquet', '.csv.gz')) for name in os.listdir(directory)):
+        raise ValueError(f"No snapshot files in {directory}")
+
+    tmp_path = target_path + '.restoring'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    engine = sa.create_engine(f"sqlite:///{tmp_path}")
+
+    @sa.event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        # The file is discarded if the load fails, so skip the journal and
+        # fsyncs, and manage the transaction explicitly so the schema and
+        # the data go in together.
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute('PRAGMA journal_mode = OFF')
+        dbapi_connection.execute('PRAGMA synchronous = OFF')
+        dbapi_connection.execute('PRAGMA foreign_keys = ON')
+
+    @sa.event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+    stats = []
+    try:
+        with engine.begin() as conn:
+            # Check foreign keys once at commit rather than per row
+            conn.exec_driver_sql('PRAGMA defer_foreign_keys = ON')
+            for table in db.metadata.sorted_tables:
+                conn.execute(sa.schema.CreateTable(table))
+
+                started = time.perf_counter()
+                rows = 0
+                for batch in _snapshot_batches(directory, table, batch_size):
+                    conn.execute(table.insert(), batch)
+                    rows += len(batch)
+                stats.append((table.name, rows, time.perf_counter() - started))
+
+            started = time.perf_counter()
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn)
+            conn.exec_driver_sql('ANALYZE')
+            stats.append(('(indexes)', 0, time.perf_counter() - started))
+    except Exception:
+        engine.dispose()
+        os.remove(tmp_path)
+        raise
+    engine.dispose()
+
+    started = time.perf_counter()
+    try:
+        restore_database(tmp_path, target_path)
+    finally:
+        os.remove(tmp_path)
+    stats.append(('(copy into place)', 0, time.perf_counter() - started))
+    return stats
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+App benchmark: time the main pages and APIs end to end on a synthetic dataset.
+
+Loads a throwaway SQLite database with one of the synthetic.SCALES (1k
+accounts by default), then requests each entry point through the Flask
+test client with the response cache cleared, recording the median
+latency, the SQL statements run (from the Server-Timing header) and the
+peak Python memory allocated (from one extra run under tracemalloc).
+Uploads post a generated CSV and are reconciled inline.
+
+Results are compared with the stored baseline for the same scale; the
+run exits with status 1 if any entry point is slower or uses more memory
+than the baseline allows, or runs more queries. Run from the project
+root:
+
+    python benchmarks/app_benchmark.py --scale 100k
+    python benchmarks/app_benchmark.py --scale 1k --save    # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from synthetic import SCALES, load_synthetic, write_upload_csv  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# (method, path) of every entry point timed
+ENDPOINTS = [
+    ('GET', '/'),
+    ('GET', '/accounts'),
+    ('GET', '/reports'),
+    ('GET', '/api/chart-data'),
+    ('GET', '/api/frn-owner-data'),
+    ('POST', '/upload'),
+]
+
+# Latency and memory may exceed the baseline by this fraction, plus a
+# small absolute slack so tiny timings do not flap
+LATENCY_SLACK_MS = 2.0
+MEMORY_SLACK_MB = 1.0
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+def configure(workdir):
+    """Point the app at a scratch database and folders; must run before main is imported."""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['WRITE_LOCK_FILE'] = os.path.join(workdir, 'write.lock')
+    # Reconcile uploads inline so their time is part of the request
+    os.environ['UPLOAD_WORKERS'] = '0'
+
+def make_request(client, method, path, workdir, accounts, upload_rows, run):
+    if method == 'POST':
+        csv_path = os.path.join(workdir, f"upload-{run}.csv")
+        write_upload_csv(csv_path, accounts, upload_rows, seed=run)
+        with open(csv_path, 'rb') as f:
+            return client.post(path, data={'file': (f, 'benchmark.csv')}, content_type='multipart/form-data')
+    return client.get(path)
+
+def measure(client, cache, method, path, workdir, accounts, upload_rows, repeat):
+    """Median latency and the most queries over repeat runs, then the peak memory of one more."""
+    latencies = []
+    queries = 0
+    for run in range(repeat + 1):
+        cache.clear()
+        traced = run == repeat
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        response = make_request(client, method, path, workdir, accounts, upload_rows, run)
+        elapsed = time.perf_counter() - started
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            latencies.append(elapsed)
+        if response.status_code >= 400:
+            raise SystemExit(f"{method} {path} returned {response.status_code}")
+        match = _QUERIES.search(response.headers.get('Server-Timing', ''))
+        if match:
+            queries = max(queries, int(match.group(1)))
+    return {
+        'latency_ms': round(statistics.median(latencies) * 1000, 2),
+        'queries': queries,
+        'peak_mb': round(peak / (1024 * 1024), 2),
+    }
+
+def regressions(result, baseline, tolerance):
+    """Descriptions of how result is worse than baseline, if it is."""
+    problems = []
+    allowed = baseline['latency_ms'] * (1 + tolerance) + LATENCY_SLACK_MS
+    if result['latency_ms'] > allowed:
+        problems.append(f"latency {result['latency_ms']} ms > {allowed:.2f} ms")
+    if result['queries'] > baseline['queries']:
+        problems.append(f"queries {result['queries']} > {baseline['queries']}")
+    allowed = baseline['peak_mb'] * (1 + tolerance) + MEMORY_SLACK_MB
+    if result['peak_mb'] > allowed:
+        problems.append(f"peak memory {result['peak_mb']} MB > {allowed:.2f} MB")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--upload-rows', type=int, default=None,
+                        help="rows per upload CSV (default: one per account, at most 100000)")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="fraction latency and memory may exceed the baseline by")
+    parser.add_argument('--save', action='store_true', help="store these results as the scale's baseline")
+    args = parser.parse_args()
+
+    banks, accounts, logs_per_account = SCALES[args.scale]
+    upload_rows = args.upload_rows or min(accounts, 100000)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir)
+        from main import app, db, response_cache  # noqa: E402
+
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            counts = load_synthetic(db.engine, banks, accounts, logs_per_account)
+            elapsed = time.perf_counter() - started
+        rows = sum(counts.values())
+        print(f"loaded {args.scale}: {counts} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+
+        client = app.test_client()
+        results = {}
+        for method, path in ENDPOINTS:
+            name = f"{method} {path}"
+            results[name] = measure(client, response_cache, method, path, workdir, accounts, upload_rows,
+                                    args.repeat)
+            print(f"{name:28} {results[name]['latency_ms']:>10.2f} ms {results[name]['queries']:>5} queries "
+                  f"{results[name]['peak_mb']:>9.2f} MB")
+        with app.app_context():
+            db.engine.dispose()
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+
+    if args.save:
+        stored[args.scale] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline for {args.scale} saved to {args.baseline}")
+        return
+
+    baseline = stored.get(args.scale)
+    if baseline is None:
+        print(f"no {args.scale} baseline in {args.baseline}; run with --save to record one")
+        return
+
+    failed = False
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for problem in regressions(result, baseline[name], args.tolerance):
+            print(f"REGRESSION {name}: {problem}")
+            failed = True
+    if failed:
+        sys.exit(1)
+    print(f"no regressions against the {args.scale} baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Projection benchmark: time the interest projection engine on synthetic accounts.
+
+Builds a throwaway SQLite database with the given number of accounts
+(100k by default) with a mix of rates, compounding frequencies and terms,
+then times loading them and projecting them separately. Run from the
+project root:
+
+    python benchmarks/projection_benchmark.py --accounts 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from models import db, Account, Bank  # noqa: E402
+from projections import PROJECTION_GROUPS, load_accounts, project, projection_totals  # noqa: E402
+
+INSERT_BATCH = 50000
+
+def build_database(path, accounts):
+    engine = sa.create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    rng = random.Random(42)
+    today = date.today()
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        conn.execute(sa.insert(Bank.__table__), [
+            {'id': i + 1, 'bank_name': f"Bank {i}", 'frn': f"FRN{i:05d}", 'created_at': now}
+            for i in range(200)
+        ])
+        for offset in range(0, accounts, INSERT_BATCH):
+            rows = []
+            for i in range(offset, min(offset + INSERT_BATCH, accounts)):
+                start = today - timedelta(days=rng.randint(0, 1500))
+                rows.append({
+                    'id': i + 1, 'account_name': f"Account {i}", 'account_number': f"ACC{i:08d}",
+                    'balance': round(rng.uniform(0, 100000), 2), 'account_type': rng.choice(['isa', 'depo', 'nsi', 'none']),
+                    'owner': rng.choice('aij'), 'savings': rng.choice('yn'), 'bank_name': f"Bank {i % 200}",
+                    'bank_id': i % 200 + 1, 'interest_rate': rng.choice([None, 0.0, round(rng.uniform(0.5, 6), 2)]),
+                    'interest_frequency': rng.choice([None, 'per_year', 'per_month', 'per year']),
+                    'start_date': rng.choice([None, start]),
+                    'end_date': rng.choice([None, start + timedelta(days=rng.randint(90, 3650))]),
+                    'created_at': now, 'updated_at': now,
+                })
+            conn.execute(sa.insert(Account.__table__), rows)
+    return engine
+
+def timed(label, func, repeat=1):
+    """Run func repeat times and print the best time; returns its last result."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label}: {best * 1000:.1f} ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=100000)
+    parser.add_argument('--horizon', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = build_database(os.path.join(workdir, 'projections.db'), args.accounts)
+        today = date.today()
+
+        with engine.connect() as conn:
+            accounts = timed(f"load {args.accounts} accounts", lambda: load_accounts(conn), args.repeat)
+        projected = timed("project", lambda: project(accounts, today, args.horizon), args.repeat)
+        timed("totals", lambda: [projection_totals(projected)] +
+              [projection_totals(projected, column) for column in PROJECTION_GROUPS], args.repeat)
+
+        totals = projection_totals(projected)
+        print(f"balance {totals['balance']:,.2f}, accrued {totals['accrued_interest']:,.2f}, "
+              f"projected {totals['projected_balance']:,.2f}")
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
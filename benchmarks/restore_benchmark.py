@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+Restore benchmark: time backup-db and restore-db on a synthetic database.
+
+Builds a throwaway SQLite database with the given number of transaction
+logs (1M by default), then times the online backup, writing a snapshot and
+restoring it. Run from the project root:
+
+    python benchmarks/restore_benchmark.py --logs 1000000 --format csv
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backup import backup_database, restore_snapshot, write_snapshot  # noqa: E402
+from models import db, Account, Bank, TransactionLog  # noqa: E402
+
+INSERT_BATCH = 50000
+
+def build_database(path, accounts, logs):
+    engine = sa.create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+
+    with engine.begin() as conn:
+        conn.execute(sa.insert(Bank.__table__), [
+            {'id': i + 1, 'bank_name': f"Bank {i}", 'frn': f"FRN{i:05d}", 'created_at': start}
+            for i in range(20)
+        ])
+        conn.execute(sa.insert(Account.__table__), [
+            {'id': i + 1, 'account_name': f"Account {i}", 'account_number': f"ACC{i:08d}",
+             'balance': round(rng.uniform(0, 100000), 2), 'account_type': rng.choice(['isa', 'depo', 'nsi', 'none']),
+             'owner': rng.choice('aij'), 'savings': rng.choice('yn'), 'bank_name': f"Bank {i % 20}",
+             'bank_id': i % 20 + 1, 'created_at': start, 'updated_at': start}
+            for i in range(accounts)
+        ])
+        for offset in range(0, logs, INSERT_BATCH):
+            conn.execute(sa.insert(TransactionLog.__table__), [
+                {'account_id': rng.randint(1, accounts), 'previous_balance': 100.0, 'new_balance': 150.0,
+                 'change_amount': 50.0, 'timestamp': start + timedelta(seconds=i * 30), 'source': 'CSV upload'}
+                for i in range(offset, min(offset + INSERT_BATCH, logs))
+            ])
+    engine.dispose()
+
+def timed(label, func, rows=None):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    rate = f" ({rows / elapsed:,.0f} rows/s)" if rows else ""
+    print(f"{label}: {elapsed:.2f}s{rate}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logs', type=int, default=1000000)
+    parser.add_argument('--accounts', type=int, default=10000)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'source.db')
+        timed(f"build {args.logs} logs", lambda: build_database(source, args.accounts, args.logs))
+        print(f"database size: {os.path.getsize(source) / (1024 * 1024):.1f} MB")
+
+        timed("backup-db (online backup API)", lambda: backup_database(source, os.path.join(workdir, 'copy.db')))
+
+        snapshot = os.path.join(workdir, 'snapshot')
+        engine = sa.create_engine(f"sqlite:///{source}")
+        with engine.connect() as conn:
+            timed(f"write {args.format} snapshot", lambda: write_snapshot(conn, snapshot, args.format), args.logs)
+        engine.dispose()
+
+        target = os.path.join(workdir, 'restored.db')
+        stats = timed("restore-db from snapshot", lambda: restore_snapshot(snapshot, target), args.logs)
+        for table_name, rows, seconds in stats:
+            if rows or table_name == '(indexes)':
+                print(f"    {table_name}: {rows} rows in {seconds:.2f}s")
+
+if __name__ == '__main__':
+    main()
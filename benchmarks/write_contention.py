@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+Write contention benchmark: account edits per second with N concurrent writers.
+
+Loads a throwaway SQLite database with the 1k synthetic dataset, forks
+--processes worker processes (as gunicorn would) and has N writer threads
+between them post balance edits to /accounts/edit/<id> through the Flask
+test client for --duration seconds, each writer editing an account of its
+own. Every edit that commits adds one transaction log, so edits that were
+lost to "database is locked" or any other error show up as failed.
+--upload-rows also runs an upload of that many rows, reconciled inline,
+in the background of each run.
+
+Compare WRITE_GROUP_MAX settings to see what group commit buys; 1 commits
+every write on its own. Run from the project root:
+
+    python benchmarks/write_contention.py --writers 1,4,16
+    python benchmarks/write_contention.py --writers 16 --group-max 1 --upload-rows 50000
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app_benchmark import configure  # noqa: E402
+from synthetic import SCALES, load_synthetic, write_upload_csv  # noqa: E402
+
+def edit_form(account, balance):
+    return {
+        'account_name': account['account_name'],
+        'account_number': account['account_number'],
+        'balance': f"{balance:.2f}",
+        'account_type': account['account_type'],
+        'owner': account['owner'],
+        'savings': account['savings'],
+        'bank_id': str(account['bank_id']),
+    }
+
+def run_writer(app, account, deadline, latencies):
+    """Edit account's balance, a penny more each time, until deadline."""
+    client = app.test_client()
+    balance = account['balance']
+    while time.time() < deadline:
+        balance += 0.01
+        started = time.perf_counter()
+        client.post(f"/accounts/edit/{account['id']}", data=edit_form(account, balance))
+        latencies.append(time.perf_counter() - started)
+
+def run_process(accounts, deadline, results):
+    """One worker process: a writer thread per account, reporting its latencies."""
+    from main import app, db
+
+    # Connections inherited from the parent are not this process's to use
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    latencies = []
+    threads = [threading.Thread(target=run_writer, args=(app, account, deadline, latencies))
+               for account in accounts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(latencies)
+
+def logged_edits(app, db):
+    from models import TransactionLog
+    with app.app_context():
+        return TransactionLog.query.filter_by(source="manual update").count()
+
+def run_upload(app, workdir, accounts, rows, timings):
+    path = os.path.join(workdir, 'contention-upload.csv')
+    write_upload_csv(path, accounts, rows)
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        app.test_client().post('/upload', data={'file': (f, 'contention.csv')}, content_type='multipart/form-data')
+    timings.append(time.perf_counter() - started)
+
+def measure(app, db, workdir, accounts, writers, processes, duration, upload_rows, dataset_accounts):
+    """Run writers across processes for duration seconds; returns the run's figures."""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    before = logged_edits(app, db)
+
+    with app.app_context():
+        db.engine.dispose()
+    deadline = time.time() + duration
+    workers = [
+        context.Process(target=run_process, args=(accounts[i:writers:processes], deadline, results))
+        for i in range(min(processes, writers))
+    ]
+    for worker in workers:
+        worker.start()
+
+    upload_timings = []
+    if upload_rows:
+        upload = threading.Thread(target=run_upload, args=(app, workdir, dataset_accounts, upload_rows,
+                                                           upload_timings))
+        upload.start()
+
+    latencies = []
+    for _ in workers:
+        latencies.extend(results.get())
+    for worker in workers:
+        worker.join()
+    if upload_rows:
+        upload.join()
+
+    committed = logged_edits(app, db) - before
+    latencies.sort()
+    return {
+        'writers': writers,
+        'edits_per_second': committed / duration,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        'failed': len(latencies) - committed,
+        'upload_seconds': upload_timings[0] if upload_timings else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', default='1,2,4,8,16', help="comma-separated writer counts to run")
+    parser.add_argument('--processes', type=int, default=2, help="worker processes the writers are spread over")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds each run lasts")
+    parser.add_argument('--group-max', type=int, default=None, help="WRITE_GROUP_MAX for the run")
+    parser.add_argument('--upload-rows', type=int, default=0,
+                        help="also upload this many rows in the background of each run")
+    args = parser.parse_args()
+
+    writer_counts = [int(count) for count in args.writers.split(',')]
+    banks, dataset_accounts, logs_per_account = SCALES['1k']
+    if max(writer_counts) > dataset_accounts:
+        parser.error(f"at most {dataset_accounts} writers")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir)
+        if args.group_max is not None:
+            os.environ['WRITE_GROUP_MAX'] = str(args.group_max)
+        from main import app, db
+        from models import Account
+
+        with app.app_context():
+            db.create_all()
+            load_synthetic(db.engine, banks, dataset_accounts, logs_per_account)
+            accounts = [
+                {column: getattr(account, column) for column in
+                 ('id', 'account_name', 'account_number', 'balance', 'account_type', 'owner', 'savings', 'bank_id')}
+                for account in Account.query.order_by(Account.id).limit(max(writer_counts))
+            ]
+            group_max = app.config['WRITE_GROUP_MAX']
+
+        print(f"WRITE_GROUP_MAX={group_max}, {args.processes} processes, {args.duration:g}s per run")
+        print(f"{'writers':>7} {'edits/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'failed':>7} {'upload s':>9}")
+        for writers in writer_counts:
+            result = measure(app, db, workdir, accounts, writers, args.processes, args.duration,
+                             args.upload_rows, dataset_accounts)
+            upload = f"{result['upload_seconds']:.2f}" if result['upload_seconds'] is not None else '-'
+            print(f"{writers:>7} {result['edits_per_second']:>10.1f} {result['p50_ms']:>9.2f} "
+                  f"{result['p95_ms']:>9.2f} {result['failed']:>7} {upload:>9}")
+
+        with app.app_context():
+            db.engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+from datetime import timedelta
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
+from models import BalanceRollup, MaturityBucket, TransactionLog
+from maturities import MATURING_DAYS
+
+def _summary_select(today):
+    """
+    One statement returning every dashboard figure as (dimension, key,
+    account_count, total_balance) rows: the per-type and per-owner groups
+    and the overall totals from the rollup table, plus the maturing count
+    from the maturity calendar.
+    """
+    R = BalanceRollup
+    no_key = sa.cast(sa.null(), sa.String)
+
+    def grouped(dimension, column):
+        return sa.select(
+            sa.literal(dimension).label('dimension'),
+            column.label('key'),
+            sa.func.sum(R.account_count).label('account_count'),
+            sa.func.sum(R.total_balance).label('total_balance')
+        ).group_by(column)
+
+    totals = sa.select(
+        sa.literal('total'),
+        no_key,
+        sa.func.coalesce(sa.func.sum(R.account_count), 0),
+        sa.func.coalesce(sa.func.sum(R.total_balance), 0.0)
+    )
+    maturing = sa.select(
+        sa.literal('maturing'),
+        no_key,
+        sa.func.coalesce(sa.func.sum(MaturityBucket.account_count), 0),
+        sa.literal(0.0)
+    ).where(MaturityBucket.end_date >= today, MaturityBucket.end_date <= today + timedelta(days=MATURING_DAYS))
+
+    return sa.union_all(grouped('account_type', R.account_type), grouped('owner', R.owner), totals, maturing)
+
+def dashboard_summary(conn, today):
+    """
+    Dashboard figures in the shape the index template expects, read with a
+    single query.
+
+    accounts_by_type and accounts_by_owner are sorted (key, count, balance)
+    tuples.
+    """
+    summary = {
+        'account_count': 0,
+        'total_balance': 0.0,
+        'maturing_soon': 0,
+        'accounts_by_type': [],
+        'accounts_by_owner': [],
+    }
+    for dimension, key, count, balance in conn.execute(_summary_select(today)):
+        if dimension == 'total':
+            summary['account_count'] = count
+            summary['total_balance'] = balance
+        elif dimension == 'maturing':
+            summary['maturing_soon'] = count
+        elif dimension == 'account_type':
+            summary['accounts_by_type'].append((key, count, balance))
+        else:
+            summary['accounts_by_owner'].append((key, count, balance))
+
+    summary['accounts_by_type'].sort()
+    summary['accounts_by_owner'].sort()
+    return summary
+
+def latest_transactions(session, limit=5):
+    """The most recent logs with their accounts loaded in the same query."""
+    return session.scalars(
+        sa.select(TransactionLog)
+        .options(joinedload(TransactionLog.account, innerjoin=True))
+        .order_by(TransactionLog.timestamp.desc())
+        .limit(limit)
+    ).all()
+
+def dashboard_payload(session, today):
+    """The dashboard as JSON-ready data: the summary figures plus the latest logs."""
+    summary = dashboard_summary(session, today)
+    return {
+        'account_count': summary['account_count'],
+        'total_balance': summary['total_balance'],
+        'maturing_soon': summary['maturing_soon'],
+        'accounts_by_type': [
+            {'account_type': key, 'account_count': count, 'total_balance': balance}
+            for key, count, balance in summary['accounts_by_type']
+        ],
+        'accounts_by_owner': [
+            {'owner': key, 'account_count': count, 'total_balance': balance}
+            for key, count, balance in summary['accounts_by_owner']
+        ],
+        'latest_transactions': [
+            {
+                'id': log.id,
+                'account_name': log.account.account_name,
+                'previous_balance': log.previous_balance,
+                'new_balance': log.new_balance,
+                'change_amount': log.change_amount,
+                'timestamp': log.timestamp.isoformat() if log.timestamp else None,
+                'source': log.source
+            }
+            for log in latest_transactions(session)
+        ]
+    }
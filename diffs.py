@@ -0,0 +1,124 @@
+import sqlalchemy as sa
+from models import Account, ArchivedTransactionLog, Bank, TransactionLog, UploadBatch
+from money import Money
+from listing import ListingError, keyset_page, page_args
+from rollups import NO_FRN
+
+# The right-hand side of a diff that compares a batch with current balances
+LIVE = 'live'
+
+# How an account's balance moved between the two sides of a diff
+DIFF_STATUSES = ('changed', 'unchanged', 'appeared', 'vanished')
+
+# Columns of a diff row, in the order CSV downloads write them
+DIFF_COLUMNS = ('account_id', 'account_number', 'account_name', 'frn', 'owner', 'status', 'before', 'after', 'delta')
+
+def _batch_balances(batch_id, name):
+    """Each account's balance as its last line in a batch left it, from the hot and archived logs."""
+    logs = sa.union_all(*[
+        sa.select(table.c.id, table.c.account_id, table.c.new_balance).where(table.c.batch_id == batch_id)
+        for table in (TransactionLog.__table__, ArchivedTransactionLog.__table__)
+    ]).cte(f"{name}_logs")
+    last_ids = sa.select(sa.func.max(logs.c.id)).group_by(logs.c.account_id)
+    return sa.select(logs.c.account_id, logs.c.new_balance.label('balance')).where(logs.c.id.in_(last_ids))
+
+def _side(batch_id, name):
+    if batch_id == LIVE:
+        stmt = sa.select(Account.id.label('account_id'), Account.balance.label('balance'))
+    else:
+        stmt = _batch_balances(batch_id, name)
+    return stmt.cte(name)
+
+def diff_select(from_batch, to_batch):
+    """
+    The diff between two batches (to_batch may be LIVE) as a subquery with
+    DIFF_COLUMNS: one row per account either side has, computed set-wise
+    with a full outer join of the two sides' balances.
+
+    delta is after - before, with a missing side counting as 0. Account
+    details come from the live account, so they are NULL for accounts that
+    have since been deleted.
+    """
+    before = _side(from_batch, 'before')
+    after = _side(to_batch, 'after')
+    account_id = sa.func.coalesce(before.c.account_id, after.c.account_id)
+    status = sa.case(
+        (before.c.account_id.is_(None), 'appeared'),
+        (after.c.account_id.is_(None), 'vanished'),
+        (before.c.balance.is_not_distinct_from(after.c.balance), 'unchanged'),
+        else_='changed'
+    )
+    delta = sa.type_coerce(sa.func.coalesce(after.c.balance, 0.0) - sa.func.coalesce(before.c.balance, 0.0), Money)
+
+    return sa.select(
+        account_id.label('account_id'),
+        Account.account_number,
+        Account.account_name,
+        sa.func.coalesce(Bank.frn, NO_FRN).label('frn'),
+        Account.owner,
+        status.label('status'),
+        before.c.balance.label('before'),
+        after.c.balance.label('after'),
+        delta.label('delta')
+    ).select_from(
+        before.join(after, before.c.account_id == after.c.account_id, full=True)
+    ).outerjoin(Account, Account.id == account_id).outerjoin(Bank, Bank.id == Account.bank_id).subquery('diff')
+
+def _filtered(diff, status):
+    stmt = sa.select(*[diff.c[column] for column in DIFF_COLUMNS])
+    if status:
+        if status not in DIFF_STATUSES:
+            raise ListingError(f"status must be one of {', '.join(DIFF_STATUSES)}")
+        stmt = stmt.where(diff.c.status == status)
+    return stmt
+
+def diff_movement(conn, from_batch, to_batch):
+    """Net balance movement and account counts per status, grouped by FRN and owner."""
+    diff = diff_select(from_batch, to_batch)
+    counts = [
+        sa.func.sum(sa.case((diff.c.status == status, 1), else_=0)).label(status)
+        for status in DIFF_STATUSES
+    ]
+    rows = conn.execute(
+        sa.select(diff.c.frn, diff.c.owner, sa.func.sum(diff.c.delta).label('net_change'), *counts)
+        .group_by(diff.c.frn, diff.c.owner).order_by(diff.c.frn, diff.c.owner)
+    ).mappings().all()
+    return [dict(row) for row in rows]
+
+def diff_page(conn, from_batch, to_batch, args, per_page, max_per_page):
+    """
+    One page of a batch diff for the query parameters in args: status
+    filters on one of DIFF_STATUSES, sort is account (default) or delta,
+    with order and limit as in the other listings. Returns (rows,
+    next_cursor).
+    """
+    sort = args.get('sort', 'account')
+    if sort not in ('account', 'delta'):
+        raise ListingError("sort must be account or delta")
+    order, limit = page_args(args, per_page, max_per_page, 'asc')
+
+    diff = diff_select(from_batch, to_batch)
+    keys = [diff.c.account_id] if sort == 'account' else [diff.c.delta, diff.c.account_id]
+    rows, next_cursor = keyset_page(conn, _filtered(diff, args.get('status')), keys, order == 'desc',
+                                    args.get('cursor'), limit)
+    return [dict(row._mapping) for row in rows], next_cursor
+
+def iter_diff_rows(conn, from_batch, to_batch, status=None, batch_size=1000):
+    """Yield every row of a batch diff as a dict, by account id, batch_size rows at a time."""
+    diff = diff_select(from_batch, to_batch)
+    result = conn.execution_options(yield_per=batch_size).execute(
+        _filtered(diff, status).order_by(diff.c.account_id)
+    )
+    for partition in result.mappings().partitions():
+        for row in partition:
+            yield dict(row)
+
+def parse_diff_side(conn, value):
+    """A batch id or LIVE from a URL segment, or None if there is no such batch."""
+    if value == LIVE:
+        return LIVE
+    try:
+        batch_id = int(value)
+    except ValueError:
+        return None
+    return batch_id if conn.execute(sa.select(UploadBatch.id).where(UploadBatch.id == batch_id)).scalar() else None
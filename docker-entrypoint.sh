@@ -60,4 +60,6 @@ with app.app_context():
 
 # Start Gunicorn with main.py
 echo "Starting the application..."
-exec gunicorn --bind 0.0.0.0:5000 --workers 2 --reload main:app
\ No newline at end of file
+# Settings are in gunicorn.conf.py; set GUNICORN_RELOAD=1 to restart on
+# code changes while developing
+exec gunicorn -c gunicorn.conf.py main:app
\ No newline at end of file
@@ -6,11 +6,13 @@ Database initialization script for Docker deployment
 
 import os
 from main import app, db, seed_database
+from migrations import upgrade_schema
 
 if __name__ == "__main__":
     with app.app_context():
         print("Creating database tables...")
-        db.create_all()
+        for change in upgrade_schema():
+            print(change)
         print("Database tables created successfully!")
         
         # Seed the database if it's empty
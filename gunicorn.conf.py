@@ -0,0 +1,20 @@
+# Gunicorn settings for the app; run it with: gunicorn -c gunicorn.conf.py main:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+
+# Development: restart workers whenever the code changes. Each worker then
+# imports the app itself, so this rules out preloading.
+reload = os.environ.get('GUNICORN_RELOAD', '0') == '1'
+
+# Import the app once in the master and fork the workers from it, so they
+# start serving at once and share its memory copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1' and not reload
+
+def when_ready(server):
+    # The app defers pandas and NumPy until a request needs them; with a
+    # preloaded app, import them here too so no worker pays for them
+    if preload_app:
+        from startup import preload_heavy_modules
+        server.log.info("Preloaded %s", ', '.join(preload_heavy_modules()) or 'nothing')
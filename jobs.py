@@ -0,0 +1,143 @@
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from models import db, UploadBatch, UploadJob
+from reconcile import ingest_csv
+from utils import batch_summary
+from logconfig import current_request_id, request_id_bound
+from writes import run_write
+
+logger = logging.getLogger(__name__)
+
+# One executor per worker process, created on first use so that gunicorn
+# workers forked from a preloaded master each get their own threads.
+_executor = None
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['UPLOAD_WORKERS'],
+                                       thread_name_prefix='upload')
+    return _executor
+
+def submit_upload(app, path, filename):
+    """
+    Record an upload batch and the job that fills it for the CSV file stored
+    at path, and queue the job.
+
+    Returns (job_id, batch_id). With UPLOAD_WORKERS set to 0 the job runs
+    inline before this returns, which is what the CLI and tests want.
+    """
+    def create_job():
+        batch = UploadBatch(filename=filename, source="CSV upload")
+        job = UploadJob(id=uuid.uuid4().hex, filename=filename, state='queued', batch=batch)
+        db.session.add(job)
+        db.session.flush()
+        return job.id, batch.id
+
+    job_id, batch_id = run_write(create_job)
+
+    if app.config['UPLOAD_WORKERS'] > 0:
+        _get_executor(app).submit(run_upload, app, job_id, path, current_request_id())
+    else:
+        run_upload(app, job_id, path, current_request_id())
+
+    return job_id, batch_id
+
+def run_upload(app, job_id, path, request_id=None):
+    """
+    Reconcile the stored CSV for job_id into its upload batch, recording
+    progress on the job and result counts on the batch.
+
+    Each chunk is written through the app's writer together with the job's
+    progress counters, so other workers polling the job see both at once.
+    Records logged by the job carry request_id, the id of the upload
+    request that queued it.
+    """
+    def start_job():
+        job = db.session.get(UploadJob, job_id)
+        job.state = 'running'
+        job.started_at = datetime.utcnow()
+        return job.batch.source, job.batch_id
+
+    def on_chunk(results):
+        job = db.session.get(UploadJob, job_id)
+        job.rows_processed = results['rows_processed']
+        _record_counts(job.batch, results)
+
+    def finish_job(results):
+        job = db.session.get(UploadJob, job_id)
+        _record_counts(job.batch, results)
+        job.batch.not_found_accounts = results['not_found_accounts']
+        job.batch.error_accounts = results['error_accounts']
+        job.state = 'done'
+        job.finished_at = datetime.utcnow()
+
+    def fail_job(error):
+        job = db.session.get(UploadJob, job_id)
+        job.state = 'failed'
+        job.error = error
+        job.finished_at = datetime.utcnow()
+
+    with app.app_context(), request_id_bound(request_id):
+        source, batch_id = run_write(start_job)
+        try:
+            with open(path, 'rb') as f:
+                results = ingest_csv(
+                    f,
+                    chunk_size=app.config['UPLOAD_CHUNK_SIZE'],
+                    mode=app.config['UPLOAD_RECONCILE_MODE'],
+                    source=source,
+                    batch_id=batch_id,
+                    snapshot_limit=0,
+                    on_chunk=on_chunk,
+                    writer=run_write
+                )
+
+            run_write(finish_job, results)
+            logger.info("Upload job %s: %d rows, peak RSS %s MB", job_id, results['rows_processed'], results['peak_rss_mb'],
+                        extra={'job_id': job_id, 'rows': results['rows_processed'], 'peak_rss_mb': results['peak_rss_mb']})
+        except Exception as e:
+            run_write(fail_job, str(e))
+            logger.error("Upload job %s failed: %s", job_id, e, exc_info=True, extra={'job_id': job_id})
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def _record_counts(batch, results):
+    batch.updated = results['updated']
+    batch.not_found = results['not_found']
+    batch.error = results['error']
+    batch.rows_processed = results['rows_processed']
+    batch.peak_rss_mb = results.get('peak_rss_mb')
+
+def job_status(job):
+    """Serialize a job for the status API: state, progress, throughput and result counts."""
+    elapsed = None
+    rows_per_second = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rows_per_second = round(job.rows_processed / elapsed, 1)
+
+    status = {
+        'id': job.id,
+        'filename': job.filename,
+        'state': job.state,
+        'rows_processed': job.rows_processed,
+        'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+        'rows_per_second': rows_per_second,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+        'batch_id': job.batch_id,
+        'result': None
+    }
+    if job.state == 'done' and job.batch is not None:
+        status['result'] = batch_summary(job.batch)
+    return status
@@ -0,0 +1,227 @@
+import base64
+import json
+from datetime import date, datetime, timedelta
+import sqlalchemy as sa
+from models import Account, TransactionLog
+from asof import parse_timestamp
+
+class ListingError(ValueError):
+    """Raised for an invalid sort, filter or cursor in a listing request."""
+
+# Sort name -> column; every sort is tie-broken on id so keys are unique
+ACCOUNT_SORTS = {
+    'name': Account.account_name,
+    'balance': Account.balance,
+    'end_date': Account.end_date,
+}
+
+# Query parameter -> column for exact-match account filters
+ACCOUNT_FILTERS = {
+    'owner': Account.owner,
+    'account_type': Account.account_type,
+    'bank_id': Account.bank_id,
+    'savings': Account.savings,
+}
+
+def encode_cursor(values):
+    """Encode a page's last sort key as an opaque URL-safe token."""
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ListingError("Invalid cursor")
+
+def _after(column, value, descending):
+    """Rows strictly past value on one key, with NULL ordered below every value."""
+    if descending:
+        if value is None:
+            return sa.false()
+        return sa.or_(column < value, column.is_(None))
+    if value is None:
+        return column.is_not(None)
+    return column > value
+
+def keyset_page(session, stmt, keys, descending, cursor, limit):
+    """
+    Fetch one page of stmt ordered by keys, continuing after cursor.
+
+    keys are columns ending in a unique one; NULLs sort first ascending and
+    last descending. Rows are fetched by seeking past the cursor rather than
+    with OFFSET, and the leading key is bounded at the cursor so an index on
+    it starts the range scan there: every page costs the same however deep
+    it is. Returns (rows, next_cursor), next_cursor being None on the last
+    page.
+    """
+    if descending:
+        order = [column.desc().nulls_last() for column in keys]
+    else:
+        order = [column.asc().nulls_first() for column in keys]
+
+    def fetch(query, count):
+        return session.execute(query.order_by(*order).limit(count)).all()
+
+    if cursor is None:
+        rows = fetch(stmt, limit + 1)
+    else:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ListingError("Cursor does not match the requested sort")
+        try:
+            values = [_cursor_value(column, value) for column, value in zip(keys, values)]
+        except (ValueError, TypeError):
+            raise ListingError("Invalid cursor")
+
+        # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        clauses = []
+        for i, column in enumerate(keys):
+            equal = [keys[j].is_not_distinct_from(values[j]) for j in range(i)]
+            clauses.append(sa.and_(*equal, _after(column, values[i], descending)))
+        seek = stmt.where(sa.or_(*clauses))
+
+        lead, lead_value = keys[0], values[0]
+        if lead_value is None:
+            rows = fetch(seek, limit + 1)
+        elif descending:
+            rows = fetch(seek.where(lead <= lead_value), limit + 1)
+            if len(rows) <= limit:
+                # NULLs sort last descending; carry on into them
+                rows += fetch(stmt.where(lead.is_(None)), limit + 1 - len(rows))
+        else:
+            rows = fetch(seek.where(lead >= lead_value), limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]._mapping[column.key] for column in keys])
+    return rows, next_cursor
+
+def _cursor_value(column, value):
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is datetime:
+        return parse_timestamp(value)
+    return python_type(value)
+
+def account_to_dict(account):
+    """Serialize an account (ORM object or row) for the accounts API."""
+    return {
+        'id': account.id,
+        'account_name': account.account_name,
+        'account_number': account.account_number,
+        'balance': account.balance,
+        'account_type': account.account_type,
+        'owner': account.owner,
+        'savings': account.savings,
+        'bank_id': account.bank_id,
+        'bank_name': account.bank_name,
+        'interest_rate': account.interest_rate,
+        'start_date': account.start_date.isoformat() if account.start_date else None,
+        'end_date': account.end_date.isoformat() if account.end_date else None,
+        'interest_frequency': account.interest_frequency,
+        'created_at': account.created_at.isoformat() if account.created_at else None,
+        'updated_at': account.updated_at.isoformat() if account.updated_at else None,
+    }
+
+def account_page(session, args, per_page, max_per_page):
+    """
+    One page of accounts for the query parameters in args.
+
+    sort is one of ACCOUNT_SORTS (default name), order asc or desc, limit at
+    most max_per_page; owner, account_type, bank_id and savings filter on
+    equality and q matches account name or number. Returns (accounts,
+    next_cursor).
+    """
+    sort = args.get('sort', 'name')
+    if sort not in ACCOUNT_SORTS:
+        raise ListingError(f"sort must be one of {', '.join(ACCOUNT_SORTS)}")
+    order, limit = page_args(args, per_page, max_per_page, 'asc')
+
+    stmt = sa.select(*Account.__table__.columns)
+    for name, column in ACCOUNT_FILTERS.items():
+        value = args.get(name)
+        if value:
+            try:
+                value = column.type.python_type(value)
+            except ValueError:
+                raise ListingError(f"{name} must be a {column.type.python_type.__name__}")
+            stmt = stmt.where(column == value)
+    search = args.get('q', '').strip()
+    if search:
+        pattern = f"%{search}%"
+        stmt = stmt.where(sa.or_(Account.account_name.ilike(pattern), Account.account_number.ilike(pattern)))
+
+    keys = [ACCOUNT_SORTS[sort], Account.id]
+    rows, next_cursor = keyset_page(session, stmt, keys, order == 'desc', args.get('cursor'), limit)
+    return [account_to_dict(row) for row in rows], next_cursor
+
+def page_args(args, per_page, max_per_page, default_order):
+    """The order and clamped limit requested in args."""
+    order = args.get('order', default_order)
+    if order not in ('asc', 'desc'):
+        raise ListingError("order must be asc or desc")
+    try:
+        limit = min(max(int(args.get('limit', per_page)), 1), max_per_page)
+    except ValueError:
+        raise ListingError("limit must be an integer")
+    return order, limit
+
+def _parse_timestamp(name, value):
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise ListingError(f"{name} must be an ISO date or datetime")
+
+def transaction_to_dict(row):
+    return {
+        'id': row.id,
+        'account_id': row.account_id,
+        'account_name': row.account_name,
+        'account_number': row.account_number,
+        'previous_balance': row.previous_balance,
+        'new_balance': row.new_balance,
+        'change_amount': row.change_amount,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+        'source': row.source,
+        'batch_id': row.batch_id,
+    }
+
+def transaction_page(session, args, per_page, max_per_page, account_id=None):
+    """
+    One page of transaction logs, newest first unless order=asc.
+
+    Logs are keyset-paginated on (timestamp, id) and filtered on source and
+    on from/to (ISO dates or datetimes; a bare to date includes that day).
+    The timestamp, account/timestamp and source/timestamp indexes serve
+    each combination of filters. Returns (transactions, next_cursor).
+    """
+    order, limit = page_args(args, per_page, max_per_page, 'desc')
+
+    stmt = sa.select(*TransactionLog.__table__.columns, Account.account_name, Account.account_number).join(
+        Account, Account.id == TransactionLog.account_id
+    )
+    if account_id is not None:
+        stmt = stmt.where(TransactionLog.account_id == account_id)
+    if args.get('source'):
+        stmt = stmt.where(TransactionLog.source == args['source'])
+    if args.get('from'):
+        stmt = stmt.where(TransactionLog.timestamp >= _parse_timestamp('from', args['from']))
+    if args.get('to'):
+        to = _parse_timestamp('to', args['to'])
+        if len(args['to']) == 10:
+            # A bare date includes that whole day
+            stmt = stmt.where(TransactionLog.timestamp < to + timedelta(days=1))
+        else:
+            stmt = stmt.where(TransactionLog.timestamp <= to)
+
+    keys = [TransactionLog.timestamp, TransactionLog.id]
+    rows, next_cursor = keyset_page(session, stmt, keys, order == 'desc', args.get('cursor'), limit)
+    return [transaction_to_dict(row) for row in rows], next_cursor
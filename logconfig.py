@@ -0,0 +1,184 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from flask import request
+
+# Output formats LOG_FORMAT accepts
+LOG_FORMATS = ('json', 'text')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+# Incoming X-Request-ID values are kept if they look like an id
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+# The request or job being logged for on this thread
+_request_id = ContextVar('request_id', default=None)
+
+# Fraction of per-row events sampled() lets through
+_sample_rate = 1.0
+
+def current_request_id():
+    return _request_id.get()
+
+@contextmanager
+def request_id_bound(request_id):
+    """Tag records logged inside the block with request_id, e.g. in a job run for a request."""
+    token = _request_id.set(request_id)
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
+
+def sampled(logger, level=logging.DEBUG):
+    """
+    Whether to log one per-row event at level on logger: the level must be
+    enabled, and then only LOG_SAMPLE_RATE of such events are kept. Check
+    it before building the message so skipped rows cost next to nothing.
+    """
+    return logger.isEnabledFor(level) and (_sample_rate >= 1.0 or random.random() < _sample_rate)
+
+def parse_levels(spec):
+    """
+    Per-logger levels from a LOG_LEVELS value such as
+    "reconcile=DEBUG,sqlalchemy.engine=INFO", as {logger name: level}.
+    Raises ValueError for anything else.
+    """
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, level = item.partition('=')
+        if not sep or not name.strip() or not isinstance(logging.getLevelName(level.strip().upper()), int):
+            raise ValueError(f"LOG_LEVELS entry {item!r} is not logger=LEVEL")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the request id of the thread that logged it."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get() or '-'
+        return True
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= fields as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', '-') != '-':
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a listener thread that formats and writes them with
+    handler, so logging never waits on I/O in the thread that logged.
+
+    The message is interpolated and any traceback rendered when the record
+    is queued, since its arguments may change afterwards; everything else
+    happens on the listener. Each process starts its own listener on first
+    use, so gunicorn workers forked from a preloaded master keep logging.
+    Closing the handler, which logging does at exit, drains the queue.
+    """
+
+    def __init__(self, handler):
+        super().__init__(None)
+        self.handler = handler
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._listener = None
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self.queue = queue.SimpleQueue()
+                    self._listener = logging.handlers.QueueListener(self.queue, self.handler,
+                                                                    respect_handler_level=True)
+                    self._listener.start()
+                    self._pid = os.getpid()
+        self.queue.put_nowait(record)
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+        super().close()
+
+def init_logging(app):
+    """
+    Configure logging for app from LOG_LEVEL, LOG_LEVELS, LOG_FORMAT and
+    LOG_SAMPLE_RATE.
+
+    Every record goes through a BackgroundHandler on the root logger to
+    stderr, as JSON (or plain text) tagged with the request id. Each
+    request gets an id, from its X-Request-ID header if it has a usable
+    one, which is echoed back on the response.
+    """
+    global _sample_rate
+
+    if app.config['LOG_FORMAT'] not in LOG_FORMATS:
+        raise ValueError(f"LOG_FORMAT must be one of {', '.join(LOG_FORMATS)}")
+    levels = parse_levels(app.config['LOG_LEVELS'])
+    _sample_rate = app.config['LOG_SAMPLE_RATE']
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JSONFormatter() if app.config['LOG_FORMAT'] == 'json' else logging.Formatter(TEXT_FORMAT))
+    handler = BackgroundHandler(output)
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(handler)
+    root.setLevel(app.config['LOG_LEVEL'].upper())
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    @app.before_request
+    def _assign_request_id():
+        incoming = request.headers.get('X-Request-ID', '')
+        _request_id.set(incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex)
+
+    @app.after_request
+    def _return_request_id(response):
+        if _request_id.get():
+            response.headers['X-Request-ID'] = _request_id.get()
+        return response
+
+    @app.teardown_request
+    def _clear_request_id(exc):
+        _request_id.set(None)
+
+    return handler
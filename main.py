@@ -1,87 +1,146 @@
 import os
+import hashlib
 import logging
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, make_response
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+import tempfile
+import time
+import uuid
+from flask import Flask, Request, Response, abort, request, jsonify, render_template, redirect, url_for, flash, session, make_response, stream_with_context
 from datetime import datetime, timedelta
-import pandas as pd
+from flask_sqlalchemy.pagination import SelectPagination
 from werkzeug.utils import secure_filename
 import sqlalchemy as sa
 import click
-
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
-
-# Initialize the database
-class Base(DeclarativeBase):
-    pass
-
-db = SQLAlchemy(model_class=Base)
+from models import db, Account, Bank, TransactionLog, UploadBatch, UploadJob
+from money import format_money, from_pence, parse_money, round_money, to_pence
+from reconcile import CSVFormatError, check_csv_header
+from jobs import job_status, submit_upload
+from readonly import read_connection, read_session
+from archive import compact_logs, monthly_summaries
+from asof import BALANCE_GROUPS, balances_payload, build_checkpoints, grouped_balances, parse_as_of
+from backup import SNAPSHOT_FORMATS, backup_database, restore_database, restore_snapshot, sqlite_path, write_snapshot
+from migrations import check_index_usage, check_query_budgets, create_missing_indexes, upgrade_schema
+from rollups import check_rollups, grouped_totals, rebuild_rollups
+from dashboard import dashboard_payload, dashboard_summary, latest_transactions
+from maturities import (CALENDAR_BUCKETS, MATURING_DAYS, check_maturities, maturing_totals, maturities_payload,
+                        maturity_calendar, rebuild_maturities)
+from projections import projections_payload
+from listing import ListingError, account_page, account_to_dict, keyset_page, page_args, transaction_page
+from diffs import DIFF_COLUMNS, DIFF_STATUSES, diff_movement, diff_page, iter_diff_rows, parse_diff_side
+from logconfig import init_logging
+from metrics import init_metrics, render_metrics
+from startup import HEAVY_MODULES, import_report, time_import
+from synthetic import INSERT_BATCH_SIZE, load_synthetic
+from versions import VersionedCache, bump_version, current_version
+from writes import WriteRejected, init_writes, run_write
+from utils import EXPORT_FORMATS, EXPORT_TABLES, batch_summary, batch_snapshots_query, encode_rows, iter_export, snapshot_from_log
+
+logger = logging.getLogger(__name__)
+
+class UploadRequest(Request):
+    """Request class that spools large uploaded files to disk instead of RAM."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_MAX_MEMORY'], mode='rb+')
 
 # Create the Flask app
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
-# Configure SQLite database to use instance folder
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(app.instance_path, 'bank_management.db')}"
+# Configure SQLite database to use instance folder, unless DATABASE_URL
+# points elsewhere (benchmarks run against a scratch database)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(app.instance_path, 'bank_management.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Shared read-only connection pool for the JSON API endpoints
+app.config['READ_POOL_SIZE'] = int(os.environ.get('READ_POOL_SIZE', 5))
+app.config['READ_POOL_MAX_OVERFLOW'] = int(os.environ.get('READ_POOL_MAX_OVERFLOW', 10))
+app.config['READ_POOL_PRE_PING'] = os.environ.get('READ_POOL_PRE_PING', 'true').lower() == 'true'
+app.config['READ_POOL_RECYCLE'] = int(os.environ.get('READ_POOL_RECYCLE', 300))
+
+# CSV upload reconciliation: 'bulk' (set-based) or 'row' (one lookup per row)
+app.config['UPLOAD_RECONCILE_MODE'] = os.environ.get('UPLOAD_RECONCILE_MODE', 'bulk')
+
+# Streaming upload ingestion: rows parsed per chunk, and uploaded bytes held
+# in memory before spooling to a temp file
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 50000))
+app.config['UPLOAD_SPOOL_MAX_MEMORY'] = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY', 1024 * 1024))
+
+# Accounts page and /api/accounts: default and largest page sizes
+app.config['ACCOUNTS_PER_PAGE'] = int(os.environ.get('ACCOUNTS_PER_PAGE', 50))
+app.config['ACCOUNTS_MAX_PER_PAGE'] = int(os.environ.get('ACCOUNTS_MAX_PER_PAGE', 500))
+
+# Transaction history APIs: default and largest page sizes
+app.config['TRANSACTIONS_PER_PAGE'] = int(os.environ.get('TRANSACTIONS_PER_PAGE', 50))
+app.config['TRANSACTIONS_MAX_PER_PAGE'] = int(os.environ.get('TRANSACTIONS_MAX_PER_PAGE', 500))
+
+# Upload batch listing and batch diffs: default and largest page sizes
+app.config['BATCHES_PER_PAGE'] = int(os.environ.get('BATCHES_PER_PAGE', 50))
+app.config['BATCHES_MAX_PER_PAGE'] = int(os.environ.get('BATCHES_MAX_PER_PAGE', 500))
+
+# Exports: rows fetched and written per batch
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+# Log archival: logs older than this many days are moved out of
+# transaction_logs by compact-logs, this many per transaction
+app.config['LOG_RETENTION_DAYS'] = int(os.environ.get('LOG_RETENTION_DAYS', 365))
+app.config['COMPACT_BATCH_SIZE'] = int(os.environ.get('COMPACT_BATCH_SIZE', 5000))
+
+# As-of balances: days between the checkpoints build-checkpoints adds
+app.config['CHECKPOINT_INTERVAL_DAYS'] = int(os.environ.get('CHECKPOINT_INTERVAL_DAYS', 30))
+
+# Projections: days ahead to project accounts with no end date, and the
+# furthest horizon /api/projections accepts
+app.config['PROJECTION_HORIZON_DAYS'] = int(os.environ.get('PROJECTION_HORIZON_DAYS', 365))
+app.config['PROJECTION_MAX_HORIZON_DAYS'] = int(os.environ.get('PROJECTION_MAX_HORIZON_DAYS', 36500))
+
+# Maturity calendar: periods shown by default, and the longest window and
+# most periods /api/maturities accepts
+app.config['MATURITY_CALENDAR_PERIODS'] = int(os.environ.get('MATURITY_CALENDAR_PERIODS', 24))
+app.config['MATURITY_MAX_DAYS'] = int(os.environ.get('MATURITY_MAX_DAYS', 3650))
+app.config['MATURITY_MAX_PERIODS'] = int(os.environ.get('MATURITY_MAX_PERIODS', 120))
+
+# Upload report: before/after snapshot rows per page
+app.config['SNAPSHOTS_PER_PAGE'] = int(os.environ.get('SNAPSHOTS_PER_PAGE', 50))
+
+# Background upload jobs: where stored files wait, and executor threads per
+# worker process (0 runs each job inline in the request)
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(app.instance_path, 'uploads'))
+app.config['UPLOAD_WORKERS'] = int(os.environ.get('UPLOAD_WORKERS', 2))
+
+# Instrumentation: statements slower than this are logged, and each
+# worker's counters are flushed to METRICS_DIR for /metrics to sum
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 1.0))
+
+# Writes: most queued writes each worker's writer commits together, the
+# file writers on different workers take turns through, and how long a
+# SQLite write from outside the queue waits for the lock
+app.config['WRITE_GROUP_MAX'] = int(os.environ.get('WRITE_GROUP_MAX', 64))
+app.config['WRITE_LOCK_FILE'] = os.environ.get('WRITE_LOCK_FILE', os.path.join(app.instance_path, 'write.lock'))
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 30000))
+
+# Startup: longest check-startup lets importing main take, in a fresh
+# interpreter, before it fails
+app.config['STARTUP_BUDGET_MS'] = int(os.environ.get('STARTUP_BUDGET_MS', 1000))
+
+# Logging: the level for every logger, per-logger overrides such as
+# "reconcile=DEBUG,sqlalchemy.engine=INFO", json or text output, and the
+# fraction of per-row upload events logged
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+app.config['LOG_LEVELS'] = os.environ.get('LOG_LEVELS', '')
+app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json')
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+init_logging(app)
+
 # Initialize the app with the extension
 db.init_app(app)
-
-# Define models
-class Account(db.Model):
-    __tablename__ = 'accounts'
-
-    id = db.Column(db.Integer, primary_key=True)
-    account_name = db.Column(db.String(100), nullable=False)
-    account_number = db.Column(db.String(50), nullable=False, unique=True)
-    balance = db.Column(db.Float, default=0.0)
-    account_type = db.Column(db.String(20), nullable=False)  # isa, depo, nsi, none
-    owner = db.Column(db.String(10), nullable=False)  # a, i, j
-    savings = db.Column(db.String(1), nullable=False)  # y, n
-    bank_name = db.Column(db.String(100), nullable=False)
-
-    interest_rate = db.Column(db.Float, nullable=True)
-    start_date = db.Column(db.Date, nullable=True)
-    end_date = db.Column(db.Date, nullable=True)
-    interest_frequency = db.Column(db.String(20), nullable=True)  # per year or per month
-
-    bank_id = db.Column(db.Integer, db.ForeignKey('banks.id'), nullable=True)
-    bank = db.relationship('Bank', backref=db.backref('accounts', lazy=True))
-
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-    def __repr__(self):
-        return f"<Account {self.account_name}>"
-
-class Bank(db.Model):
-    __tablename__ = 'banks'
-
-    id = db.Column(db.Integer, primary_key=True)
-    bank_name = db.Column(db.String(100), nullable=False, unique=True)
-    frn = db.Column(db.String(50), nullable=False)  # Financial Reference Number
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    def __repr__(self):
-        return f"<Bank {self.bank_name}>"
-
-class TransactionLog(db.Model):
-    __tablename__ = 'transaction_logs'
-
-    id = db.Column(db.Integer, primary_key=True)
-    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
-    previous_balance = db.Column(db.Float, nullable=False)
-    new_balance = db.Column(db.Float, nullable=False)
-    change_amount = db.Column(db.Float, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    source = db.Column(db.String(50), nullable=False)  # e.g., "CSV upload", "manual"
-
-    account = db.relationship('Account', backref=db.backref('transactions', lazy=True))
-
-    def __repr__(self):
-        return f"<TransactionLog {self.id}>"
+init_metrics(app)
+init_writes(app)
 
 # CLI Commands
 @app.cli.command("init-db")
@@ -94,6 +153,228 @@ def init_db():
         seed_database()
     print(f"Database initialized at {os.path.join(app.instance_path, 'bank_management.db')}")
 
+@app.cli.command("upgrade-db")
+def upgrade_db():
+    """Add missing tables and columns to an existing database without seeding."""
+    with app.app_context():
+        for change in upgrade_schema():
+            print(change)
+    print("Database schema is up to date")
+
+@app.cli.command("create-indexes")
+def create_indexes():
+    """Add any missing indexes to an existing database in place."""
+    with app.app_context():
+        created = create_missing_indexes()
+    for change in created:
+        print(change)
+    print(f"{len(created)} indexes created")
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    """EXPLAIN the dashboard and report queries and fail if any scan a large table without an index."""
+    problems = check_index_usage(app)
+    for path, statement, detail in problems:
+        print(f"{path}: {detail}\n    {' '.join(statement.split())}")
+    if problems:
+        raise click.ClickException(f"{len(problems)} query plan steps scan without an index")
+    print("All dashboard and report queries use indexes")
+
+@app.cli.command("rebuild-rollups")
+@click.option('--check', is_flag=True, help="Only report groups that differ from a full recomputation.")
+def rebuild_rollups_command(check):
+    """Recompute the balance rollups and maturity calendar from the accounts, or check them for drift."""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            if check:
+                drift = check_rollups(conn) + check_maturities(conn)
+                for key, stored, expected in drift:
+                    print(f"{'/'.join(str(part) for part in key)}: stored {stored}, expected {expected}")
+                if drift:
+                    raise click.ClickException(f"{len(drift)} rollup groups have drifted")
+                print("Balance rollups and maturity calendar match the accounts")
+                return
+            rebuild_rollups(conn)
+            rebuild_maturities(conn)
+            bump_version(conn)
+    print("Balance rollups and maturity calendar rebuilt")
+
+@app.cli.command("check-queries")
+def check_queries():
+    """Request the dashboard pages and fail if any runs more queries than its budget."""
+    problems = check_query_budgets(app)
+    for path, statements, budget in problems:
+        print(f"{path}: {len(statements)} queries, budget {budget}")
+        for statement in statements:
+            print(f"    {' '.join(statement.split())}")
+    if problems:
+        raise click.ClickException(f"{len(problems)} pages exceed their query budget")
+    print("All pages are within their query budgets")
+
+@app.cli.command("import-report")
+@click.option('--top', type=int, default=15, show_default=True, help="Direct imports of main to list.")
+def import_report_command(top):
+    """Show what importing main costs, slowest direct import first."""
+    seconds, heavy, imports = import_report(app.root_path)
+    direct = sorted((entry for entry in imports if entry[0] == 1), key=lambda entry: entry[3], reverse=True)
+    print(f"import main: {seconds * 1000:.0f} ms (under -X importtime)")
+    for _, name, self_seconds, cumulative in direct[:top]:
+        print(f"  {name:32} {cumulative * 1000:8.1f} ms  (self {self_seconds * 1000:.1f} ms)")
+    for name in HEAVY_MODULES:
+        print(f"  {name:32} {'loaded at import' if name in heavy else 'deferred'}")
+
+@app.cli.command("check-startup")
+@click.option('--runs', type=int, default=5, show_default=True, help="Fresh interpreters to time the import in.")
+def check_startup(runs):
+    """Fail if importing main takes longer than STARTUP_BUDGET_MS or loads a heavy module."""
+    seconds, heavy = time_import(app.root_path, runs=runs)
+    budget = app.config['STARTUP_BUDGET_MS']
+    print(f"import main: {seconds * 1000:.0f} ms median of {runs}, budget {budget} ms")
+    problems = []
+    if seconds * 1000 > budget:
+        problems.append(f"import takes {seconds * 1000:.0f} ms")
+    if heavy:
+        problems.append(f"import loads {', '.join(heavy)}")
+    if problems:
+        raise click.ClickException("; ".join(problems))
+    print("Startup is within budget")
+
+@app.cli.command("seed")
+@click.option('--banks', type=int, default=20, show_default=True, help="Banks to generate.")
+@click.option('--accounts', type=int, default=1000, show_default=True, help="Accounts to generate, spread over the banks.")
+@click.option('--logs-per-account', type=int, default=10, show_default=True, help="Transaction logs per new account.")
+@click.option('--seed', 'seed', type=int, default=42, show_default=True, help="Random seed; the same seed generates the same rows.")
+@click.option('--batch-size', type=int, default=INSERT_BATCH_SIZE, show_default=True, help="Rows inserted per transaction.")
+@click.option('--keep-indexes', is_flag=True, help="Maintain indexes during the load instead of rebuilding them after it.")
+def seed_command(banks, accounts, logs_per_account, seed, batch_size, keep_indexes):
+    """Bulk-load synthetic banks, accounts and logs; rows already there by natural key are skipped."""
+    started = time.perf_counter()
+
+    def progress(counts):
+        click.echo(f"\rInserted {counts['accounts']} accounts, {counts['transaction_logs']} logs", nl=False)
+
+    with app.app_context():
+        counts = load_synthetic(db.engine, banks, accounts, logs_per_account, seed=seed, batch_size=batch_size,
+                                drop_indexes=not keep_indexes, progress=progress)
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    click.echo(f"\nInserted {counts['banks']} banks, {counts['accounts']} accounts and "
+               f"{counts['transaction_logs']} logs in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+
+@app.cli.command("export")
+@click.argument('table_name', type=click.Choice(list(EXPORT_TABLES)))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help="Compress the output with gzip.")
+@click.option('--output', '-o', type=click.File('wb'), default='-', help="File to write (default: stdout).")
+def export_command(table_name, fmt, compress, output):
+    """Stream a table to a CSV or NDJSON file in batches."""
+    with app.app_context():
+        with read_connection() as conn:
+            for chunk in iter_export(conn, table_name, fmt, compress, app.config['EXPORT_BATCH_SIZE']):
+                output.write(chunk)
+
+@app.cli.command("compact-logs")
+@click.option('--older-than', 'days', type=int, help="Archive logs older than this many days (default: LOG_RETENTION_DAYS).")
+@click.option('--batch-size', type=int, help="Logs archived per transaction (default: COMPACT_BATCH_SIZE).")
+@click.option('--pause', type=float, default=0.0, show_default=True, help="Seconds to sleep between batches.")
+@click.option('--max-batches', type=int, help="Stop after this many batches; run again to continue.")
+def compact_logs_command(days, batch_size, pause, max_batches):
+    """Move old transaction logs to the archive and fold them into monthly summaries."""
+    if days is None:
+        days = app.config['LOG_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    def progress(archived):
+        click.echo(f"\rArchived {archived} logs", nl=False)
+
+    with app.app_context():
+        total = compact_logs(db.engine, cutoff, batch_size or app.config['COMPACT_BATCH_SIZE'],
+                             pause=pause, max_batches=max_batches, progress=progress)
+    click.echo(f"\nArchived {total} logs from before {cutoff:%Y-%m-%d %H:%M}")
+
+@app.cli.command("build-checkpoints")
+@click.option('--every', 'days', type=int, help="Days between checkpoints (default: CHECKPOINT_INTERVAL_DAYS).")
+@click.option('--rebuild', is_flag=True, help="Drop existing checkpoints first, e.g. after restoring a database.")
+def build_checkpoints_command(days, rebuild):
+    """Add the periodic balance checkpoints that as-of queries start from."""
+    every = timedelta(days=days or app.config['CHECKPOINT_INTERVAL_DAYS'])
+
+    def progress(taken_at, accounts):
+        print(f"{taken_at:%Y-%m-%d %H:%M}: {accounts} accounts")
+
+    with app.app_context():
+        built = build_checkpoints(db.engine, every, datetime.utcnow(), rebuild=rebuild, progress=progress)
+    print(f"{built} checkpoints built")
+
+def _database_file():
+    path = sqlite_path(app.config['SQLALCHEMY_DATABASE_URI'])
+    if path is None:
+        raise click.ClickException("Only SQLite databases can be backed up or restored with these commands")
+    return path
+
+@app.cli.command("backup-db")
+@click.option('--output', '-o', help="Backup file to write (default: instance/backups/bank_management-<timestamp>.db).")
+@click.option('--snapshot', 'snapshot_dir', help="Also write a compressed snapshot of every table to this directory.")
+@click.option('--snapshot-format', type=click.Choice(SNAPSHOT_FORMATS), default='parquet', show_default=True)
+def backup_db(output, snapshot_dir, snapshot_format):
+    """Copy the live database with SQLite's online backup API, without blocking writers."""
+    source = _database_file()
+    if output is None:
+        backup_dir = os.path.join(app.instance_path, 'backups')
+        os.makedirs(backup_dir, exist_ok=True)
+        output = os.path.join(backup_dir, f"bank_management-{datetime.utcnow():%Y%m%d-%H%M%S}.db")
+
+    def progress(remaining, total):
+        click.echo(f"\rCopied {total - remaining}/{total} pages", nl=False)
+
+    size = backup_database(source, output, progress=progress)
+    click.echo(f"\nBackup written to {output} ({size / (1024 * 1024):.1f} MB)")
+
+    if snapshot_dir:
+        try:
+            with app.app_context():
+                with read_connection() as conn:
+                    counts = write_snapshot(conn, snapshot_dir, snapshot_format)
+        except ImportError:
+            raise click.ClickException("Parquet snapshots need pyarrow; install it or use --snapshot-format csv")
+        for table_name, count in counts.items():
+            print(f"{table_name}: {count} rows")
+        print(f"Snapshot written to {snapshot_dir}")
+
+@app.cli.command("restore-db")
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--target', help="Database file to replace (default: the app's database).")
+@click.option('--yes', is_flag=True, help="Replace the target without asking.")
+def restore_db(source, target, yes):
+    """
+    Restore from a backup-db file or snapshot directory.
+
+    Stop the app first: the target file is replaced, not merged into.
+    """
+    target = target or _database_file()
+    if not yes:
+        click.confirm(f"Replace {target} with {source}?", abort=True)
+
+    started = time.perf_counter()
+    if os.path.isdir(source):
+        try:
+            stats = restore_snapshot(source, target)
+        except ImportError:
+            raise click.ClickException("Restoring a Parquet snapshot needs pyarrow")
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        total_rows = 0
+        for table_name, rows, seconds in stats:
+            rate = f"{rows / seconds:,.0f} rows/s" if rows and seconds else ""
+            print(f"{table_name}: {rows} rows in {seconds:.2f}s {rate}")
+            total_rows += rows
+        elapsed = time.perf_counter() - started
+        print(f"Restored {total_rows} rows in {elapsed:.2f}s ({total_rows / elapsed:,.0f} rows/s)")
+    else:
+        size = restore_database(source, target)
+        elapsed = time.perf_counter() - started
+        print(f"Restored {size / (1024 * 1024):.1f} MB in {elapsed:.2f}s")
+
 def seed_database():
     """Add sample data to the database, appending if data already exists"""
     print("Seeding database with sample data...")
@@ -148,9 +429,10 @@ def seed_database():
     db.session.commit()
 
     # Add sample transaction logs
+    emergency_fund = Account.query.filter_by(account_number="A001").first()
     logs = [
         TransactionLog(
-            account_id=1,
+            account_id=emergency_fund.id,
             previous_balance=4800.00,
             new_balance=5000.00,
             change_amount=200.00,
@@ -176,83 +458,181 @@ def seed_database():
 def inject_now():
     return {'now': datetime.utcnow()}
 
+# Every amount on a page is shown through the one money format
+app.add_template_filter(format_money, 'money')
+
 # Flask Routes
 # Routes
 @app.route('/')
 def index():
-    account_count = Account.query.count()
-    latest_transactions = TransactionLog.query.order_by(TransactionLog.timestamp.desc()).limit(5).all()
-    accounts_by_type = db.session.query(
-        Account.account_type,
-        sa.func.count(Account.id),
-        sa.func.sum(Account.balance)
-    ).group_by(Account.account_type).all()
-
-    accounts_by_owner = db.session.query(
-        Account.owner,
-        sa.func.count(Account.id),
-        sa.func.sum(Account.balance)
-    ).group_by(Account.owner).all()
-
-    # Calculate total balance
-    total_balance_result = db.session.query(sa.func.sum(Account.balance)).scalar()
-    total_balance = total_balance_result if total_balance_result is not None else 0
-
-    # Count maturing accounts
-    thirty_days_future = datetime.utcnow().date() + timedelta(days=30)
-    maturing_soon = Account.query.filter(
-        Account.end_date <= thirty_days_future,
-        Account.end_date >= datetime.utcnow().date()
-    ).count()
+    # Every figure in one query, the latest logs with their accounts in another
+    summary = dashboard_summary(db.session, datetime.utcnow().date())
+    latest = latest_transactions(db.session)
 
     return render_template('index.html',
-                           account_count=account_count,
-                           latest_transactions=latest_transactions,
-                           accounts_by_type=accounts_by_type,
-                           accounts_by_owner=accounts_by_owner,
-                           total_balance=total_balance,
-                           maturing_soon=maturing_soon,
-                           recent_transactions=latest_transactions)
+                           latest_transactions=latest,
+                           recent_transactions=latest,
+                           **summary)
 
 @app.route('/accounts')
 def accounts():
-    accounts = Account.query.all()
-    banks = Bank.query.all()
-    return render_template('accounts.html', accounts=accounts, banks=banks)
+    # Accounts are fetched a page at a time from /api/accounts by the page script
+    banks = Bank.query.order_by(Bank.bank_name).all()
+    return render_template('accounts.html', banks=banks,
+                           per_page=app.config['ACCOUNTS_PER_PAGE'])
+
+@app.route('/api/accounts')
+def accounts_data():
+    """
+    API endpoint returning one page of accounts, keyset-paginated.
+
+    Pass next_cursor back as cursor to get the following page; see
+    listing.account_page for the sort and filter parameters.
+    """
+    try:
+        with read_session() as read:
+            accounts, next_cursor = account_page(read, request.args,
+                                                 app.config['ACCOUNTS_PER_PAGE'],
+                                                 app.config['ACCOUNTS_MAX_PER_PAGE'])
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'accounts': accounts, 'next_cursor': next_cursor})
+
+@app.route('/api/accounts/<int:id>')
+def account_data(id):
+    """API endpoint returning one account's full details, for the view and edit dialogs."""
+    with read_session() as read:
+        account = read.get(Account, id)
+        if account is None:
+            abort(404)
+        return jsonify(account_to_dict(account))
+
+@app.route('/api/transactions')
+def transactions_data():
+    """
+    API endpoint returning one page of transaction logs across all accounts.
+
+    Keyset-paginated on (timestamp, id); see listing.transaction_page for
+    the filters.
+    """
+    try:
+        with read_session() as read:
+            transactions, next_cursor = transaction_page(read, request.args,
+                                                         app.config['TRANSACTIONS_PER_PAGE'],
+                                                         app.config['TRANSACTIONS_MAX_PER_PAGE'])
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'transactions': transactions, 'next_cursor': next_cursor})
+
+@app.route('/api/accounts/<int:id>/transactions')
+def account_transactions_data(id):
+    """API endpoint returning one page of an account's transaction history."""
+    try:
+        with read_session() as read:
+            if read.get(Account, id) is None:
+                abort(404)
+            transactions, next_cursor = transaction_page(read, request.args,
+                                                         app.config['TRANSACTIONS_PER_PAGE'],
+                                                         app.config['TRANSACTIONS_MAX_PER_PAGE'],
+                                                         account_id=id)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'account_id': id, 'transactions': transactions, 'next_cursor': next_cursor})
+
+@app.route('/api/batches')
+def batches_data():
+    """API endpoint returning upload batches, newest first, keyset-paginated on id."""
+    columns = [UploadBatch.id, UploadBatch.filename, UploadBatch.source, UploadBatch.created_at,
+               UploadBatch.updated, UploadBatch.not_found, UploadBatch.error, UploadBatch.rows_processed]
+    try:
+        order, limit = page_args(request.args, app.config['BATCHES_PER_PAGE'], app.config['BATCHES_MAX_PER_PAGE'], 'desc')
+        with read_session() as read:
+            rows, next_cursor = keyset_page(read, sa.select(*columns), [UploadBatch.id], order == 'desc',
+                                            request.args.get('cursor'), limit)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    batches = []
+    for row in rows:
+        batch = dict(row._mapping)
+        batch['created_at'] = row.created_at.isoformat() if row.created_at else None
+        batches.append(batch)
+    return jsonify({'batches': batches, 'next_cursor': next_cursor})
+
+@app.route('/api/batches/<int:from_id>/diff/<to>')
+def batch_diff_data(from_id, to):
+    """
+    API endpoint returning one page of the per-account diff between upload
+    batch from_id and batch `to` (or 'live' for current balances).
+
+    The first page also carries the movement per FRN and owner and the
+    status counts. See diffs.diff_page for the paging parameters.
+    """
+    try:
+        with read_connection() as conn:
+            to_batch = parse_diff_side(conn, to)
+            if parse_diff_side(conn, str(from_id)) is None or to_batch is None:
+                abort(404)
+            changes, next_cursor = diff_page(conn, from_id, to_batch, request.args,
+                                             app.config['BATCHES_PER_PAGE'], app.config['BATCHES_MAX_PER_PAGE'])
+            payload = {'from': from_id, 'to': to_batch, 'changes': changes, 'next_cursor': next_cursor}
+            if not request.args.get('cursor'):
+                movement = diff_movement(conn, from_id, to_batch)
+                payload['movement'] = movement
+                payload['summary'] = {
+                    status: sum(group[status] for group in movement)
+                    for status in DIFF_STATUSES
+                }
+                # Summed in pence, so the total is as exact as each group's
+                payload['summary']['net_change'] = from_pence(sum(to_pence(group['net_change'])
+                                                                   for group in movement))
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(payload)
+
+@app.route('/api/accounts/<int:id>/months')
+def account_months_data(id):
+    """API endpoint returning an account's monthly summaries of archived logs."""
+    with read_connection() as conn:
+        months = monthly_summaries(conn, id)
+    return jsonify({
+        'account_id': id,
+        'months': [
+            {
+                'month': summary['month'].strftime('%Y-%m'),
+                'opening_balance': summary['opening_balance'],
+                'closing_balance': summary['closing_balance'],
+                'net_change': summary['net_change'],
+                'log_count': summary['log_count'],
+            }
+            for summary in months
+        ]
+    })
 
 @app.route('/accounts/add', methods=['POST'])
 def add_account():
     try:
-        logging.debug("Adding a new account with data: %s", request.form)
+        logger.debug("Adding a new account with data: %s", request.form)
 
         # Validate that bank_id is provided
         if not request.form.get('bank_id'):
             flash('Bank is required. Please select a bank.', 'danger')
             return redirect(url_for('accounts'))
 
-        # Validate that account_number is unique
-        existing_account = Account.query.filter_by(account_number=request.form['account_number']).first()
-        if existing_account:
-            flash(f'An account with number {request.form["account_number"]} already exists.', 'danger')
-            return redirect(url_for('accounts'))
-
-        # Get bank details
-        bank_id = int(request.form['bank_id'])
-        bank = Bank.query.get(bank_id)
-        if not bank:
-            flash('Selected bank not found.', 'danger')
-            return redirect(url_for('accounts'))
-
-        # Build account data
+        # Build account data; the bank name is filled in from the Bank model
+        # by the write
         account_data = {
             'account_name': request.form['account_name'],
             'account_number': request.form['account_number'],
-            'balance': float(request.form['balance']),
+            'balance': parse_money(request.form['balance']),
             'account_type': request.form['account_type'],
             'owner': request.form['owner'],
             'savings': request.form['savings'],
-            'bank_name': bank.bank_name,  # Get bank name from the Bank model
-            'bank_id': bank_id,
+            'bank_id': int(request.form['bank_id']),
         }
 
         # Optional fields
@@ -269,37 +649,45 @@ def add_account():
             account_data['interest_frequency'] = request.form['interest_frequency']
 
         # Log account creation attempt
-        logging.debug(f"Creating new account with data: {account_data}")
-
-        # Create and save the new account
-        new_account = Account(**account_data)
-        db.session.add(new_account)
-        db.session.commit()
-
-        # Create a transaction log entry for the new account
-        log = TransactionLog(
-            account_id=new_account.id,
-            previous_balance=0.0,
-            new_balance=new_account.balance,
-            change_amount=new_account.balance,
-            source="account creation"
-        )
-        db.session.add(log)
-        db.session.commit()
+        logger.debug("Creating new account with data: %s", account_data)
+
+        def create_account():
+            # Validate that account_number is unique
+            if Account.query.filter_by(account_number=account_data['account_number']).first():
+                raise WriteRejected(f'An account with number {account_data["account_number"]} already exists.')
+
+            bank = db.session.get(Bank, account_data['bank_id'])
+            if not bank:
+                raise WriteRejected('Selected bank not found.')
+
+            # The new account and its creation log, committed together
+            new_account = Account(bank_name=bank.bank_name, **account_data)
+            db.session.add(new_account)
+            db.session.add(TransactionLog(
+                account=new_account,
+                previous_balance=0.0,
+                new_balance=new_account.balance,
+                change_amount=new_account.balance,
+                source="account creation"
+            ))
+            db.session.flush()
+            return new_account.id
+
+        account_id = run_write(create_account)
 
         # Log successful creation
-        logging.info(f"Successfully added account: {new_account.account_name} (ID: {new_account.id})")
+        logger.info("Successfully added account: %s (ID: %s)", account_data['account_name'], account_id)
 
         flash('Account added successfully!', 'success')
 
         # Clear any cached report data from the session to ensure fresh data
-        if 'latest_upload_results' in session:
-            session.pop('latest_upload_results')
-        if 'latest_upload_snapshots' in session:
-            session.pop('latest_upload_snapshots')
+        if 'latest_upload_batch' in session:
+            session.pop('latest_upload_batch')
+    except WriteRejected as e:
+        flash(str(e), 'danger')
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error adding account: {str(e)}", exc_info=True)
+        logger.error("Error adding account: %s", e, exc_info=True)
         flash(f'Error adding account: {str(e)}', 'danger')
 
     return redirect(url_for('accounts'))
@@ -307,111 +695,108 @@ def add_account():
 @app.route('/accounts/edit/<int:id>', methods=['POST'])
 def edit_account(id):
     try:
-        logging.debug(f"Editing account {id} with data: {request.form}")
-
-        account = Account.query.get_or_404(id)
+        logger.debug("Editing account %s with data: %s", id, request.form)
 
         # Validate that bank_id is provided
         if not request.form.get('bank_id'):
             flash('Bank is required. Please select a bank.', 'danger')
             return redirect(url_for('accounts'))
 
-        # Validate that account_number is unique (if changed)
-        if account.account_number != request.form['account_number']:
-            existing_account = Account.query.filter_by(account_number=request.form['account_number']).first()
-            if existing_account:
-                flash(f'An account with number {request.form["account_number"]} already exists.', 'danger')
-                return redirect(url_for('accounts'))
-
-        account.account_name = request.form['account_name']
-        account.account_number = request.form['account_number']
-
-        previous_balance = account.balance
-        new_balance = float(request.form['balance'])
-
-        # Get bank details
-        bank_id = int(request.form['bank_id'])
-        bank = Bank.query.get(bank_id)
-        if not bank:
-            flash('Selected bank not found.', 'danger')
-            return redirect(url_for('accounts'))
-
-        account.balance = new_balance
-        account.account_type = request.form['account_type']
-        account.owner = request.form['owner']
-        account.savings = request.form['savings']
-        account.bank_name = bank.bank_name  # Get bank name from the Bank model
-        account.bank_id = bank_id
-
-        # Optional fields
-        if request.form.get('interest_rate'):
-            account.interest_rate = float(request.form['interest_rate'])
-        else:
-            account.interest_rate = None
-
-        if request.form.get('start_date'):
-            account.start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
-        else:
-            account.start_date = None
-
-        if request.form.get('end_date'):
-            account.end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
-        else:
-            account.end_date = None
-
-        if request.form.get('interest_frequency'):
-            account.interest_frequency = request.form['interest_frequency']
-        else:
-            account.interest_frequency = None
-
-        db.session.commit()
-
-        # Log the transaction if balance changed
-        if previous_balance != new_balance:
-            log = TransactionLog(
-                account_id=account.id,
-                previous_balance=previous_balance,
-                new_balance=new_balance,
-                change_amount=new_balance - previous_balance,
-                source="manual update"
-            )
-            db.session.add(log)
-            db.session.commit()
+        # The write runs on the writer thread, outside this request
+        request_form = request.form.to_dict()
+
+        def update_account():
+            account = Account.query.get_or_404(id)
+
+            # Validate that account_number is unique (if changed)
+            if account.account_number != request_form['account_number']:
+                if Account.query.filter_by(account_number=request_form['account_number']).first():
+                    raise WriteRejected(f'An account with number {request_form["account_number"]} already exists.')
+
+            # Get bank details
+            bank = db.session.get(Bank, int(request_form['bank_id']))
+            if not bank:
+                raise WriteRejected('Selected bank not found.')
+
+            previous_balance = account.balance
+            new_balance = parse_money(request_form['balance'])
+
+            account.account_name = request_form['account_name']
+            account.account_number = request_form['account_number']
+            account.balance = new_balance
+            account.account_type = request_form['account_type']
+            account.owner = request_form['owner']
+            account.savings = request_form['savings']
+            account.bank_name = bank.bank_name  # Get bank name from the Bank model
+            account.bank_id = bank.id
+
+            # Optional fields
+            if request_form.get('interest_rate'):
+                account.interest_rate = float(request_form['interest_rate'])
+            else:
+                account.interest_rate = None
+
+            if request_form.get('start_date'):
+                account.start_date = datetime.strptime(request_form['start_date'], '%Y-%m-%d').date()
+            else:
+                account.start_date = None
+
+            if request_form.get('end_date'):
+                account.end_date = datetime.strptime(request_form['end_date'], '%Y-%m-%d').date()
+            else:
+                account.end_date = None
+
+            if request_form.get('interest_frequency'):
+                account.interest_frequency = request_form['interest_frequency']
+            else:
+                account.interest_frequency = None
+
+            # Log the transaction if balance changed, in the same transaction
+            if previous_balance != new_balance:
+                db.session.add(TransactionLog(
+                    account_id=account.id,
+                    previous_balance=previous_balance,
+                    new_balance=new_balance,
+                    change_amount=round_money(new_balance - previous_balance),
+                    source="manual update"
+                ))
+            return account.account_name
+
+        account_name = run_write(update_account)
 
         # Log successful update
-        logging.info(f"Successfully updated account: {account.account_name} (ID: {account.id})")
+        logger.info("Successfully updated account: %s (ID: %s)", account_name, id)
 
         # Clear any cached report data from the session to ensure fresh data
-        if 'latest_upload_results' in session:
-            session.pop('latest_upload_results')
-        if 'latest_upload_snapshots' in session:
-            session.pop('latest_upload_snapshots')
+        if 'latest_upload_batch' in session:
+            session.pop('latest_upload_batch')
 
         flash('Account updated successfully!', 'success')
+    except WriteRejected as e:
+        flash(str(e), 'danger')
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error updating account {id}: {str(e)}", exc_info=True)
+        logger.error("Error updating account %s: %s", id, e, exc_info=True)
         flash(f'Error updating account: {str(e)}', 'danger')
 
     return redirect(url_for('accounts'))
 
-@app.route('/accounts/delete/<int:id>')
+@app.route('/accounts/delete/<int:id>', methods=['GET', 'POST'])
 def delete_account(id):
     try:
-        account = Account.query.get_or_404(id)
-        db.session.delete(account)
-        db.session.commit()
+        def remove_account():
+            db.session.delete(Account.query.get_or_404(id))
+
+        run_write(remove_account)
 
         # Clear any cached report data from the session to ensure fresh data
-        if 'latest_upload_results' in session:
-            session.pop('latest_upload_results')
-        if 'latest_upload_snapshots' in session:
-            session.pop('latest_upload_snapshots')
+        if 'latest_upload_batch' in session:
+            session.pop('latest_upload_batch')
 
         flash('Account deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error deleting account {id}: {str(e)}")
+        logger.error("Error deleting account %s: %s", id, e)
         flash(f'Error deleting account: {str(e)}', 'danger')
 
     return redirect(url_for('accounts'))
@@ -427,20 +812,19 @@ def add_bank():
         bank_name = request.form['bank_name']
         frn = request.form['frn']
 
-        new_bank = Bank(bank_name=bank_name, frn=frn)
-        db.session.add(new_bank)
-        db.session.commit()
+        def create_bank():
+            db.session.add(Bank(bank_name=bank_name, frn=frn))
+
+        run_write(create_bank)
 
         # Clear any cached report data from the session to ensure fresh data
-        if 'latest_upload_results' in session:
-            session.pop('latest_upload_results')
-        if 'latest_upload_snapshots' in session:
-            session.pop('latest_upload_snapshots')
+        if 'latest_upload_batch' in session:
+            session.pop('latest_upload_batch')
 
         flash('Bank added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error adding bank: {str(e)}")
+        logger.error("Error adding bank: %s", e)
         flash(f'Error adding bank: {str(e)}', 'danger')
 
     return redirect(url_for('banks'))
@@ -448,23 +832,24 @@ def add_bank():
 @app.route('/banks/edit/<int:id>', methods=['POST'])
 def edit_bank(id):
     try:
-        bank = Bank.query.get_or_404(id)
+        bank_name = request.form['bank_name']
+        frn = request.form['frn']
 
-        bank.bank_name = request.form['bank_name']
-        bank.frn = request.form['frn']
+        def update_bank():
+            bank = Bank.query.get_or_404(id)
+            bank.bank_name = bank_name
+            bank.frn = frn
 
-        db.session.commit()
+        run_write(update_bank)
 
         # Clear any cached report data from the session to ensure fresh data
-        if 'latest_upload_results' in session:
-            session.pop('latest_upload_results')
-        if 'latest_upload_snapshots' in session:
-            session.pop('latest_upload_snapshots')
+        if 'latest_upload_batch' in session:
+            session.pop('latest_upload_batch')
 
         flash('Bank updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error updating bank {id}: {str(e)}")
+        logger.error("Error updating bank %s: %s", id, e)
         flash(f'Error updating bank: {str(e)}', 'danger')
 
     return redirect(url_for('banks'))
@@ -472,26 +857,27 @@ def edit_bank(id):
 @app.route('/banks/delete/<int:id>')
 def delete_bank(id):
     try:
-        bank = Bank.query.get_or_404(id)
+        def remove_bank():
+            bank = Bank.query.get_or_404(id)
+
+            # Check if any accounts are associated with this bank
+            if Account.query.filter_by(bank_id=id).first():
+                raise WriteRejected('Cannot delete bank with associated accounts!')
 
-        # Check if any accounts are associated with this bank
-        if Account.query.filter_by(bank_id=id).first():
-            flash('Cannot delete bank with associated accounts!', 'danger')
-            return redirect(url_for('banks'))
+            db.session.delete(bank)
 
-        db.session.delete(bank)
-        db.session.commit()
+        run_write(remove_bank)
 
         # Clear any cached report data from the session to ensure fresh data
-        if 'latest_upload_results' in session:
-            session.pop('latest_upload_results')
-        if 'latest_upload_snapshots' in session:
-            session.pop('latest_upload_snapshots')
+        if 'latest_upload_batch' in session:
+            session.pop('latest_upload_batch')
 
         flash('Bank deleted successfully!', 'success')
+    except WriteRejected as e:
+        flash(str(e), 'danger')
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error deleting bank {id}: {str(e)}")
+        logger.error("Error deleting bank %s: %s", id, e)
         flash(f'Error deleting bank: {str(e)}', 'danger')
 
     return redirect(url_for('banks'))
@@ -500,16 +886,16 @@ def delete_bank(id):
 def upload():
     if request.method == 'POST':
         # Debug: Log the form data and files
-        logging.debug(f"Form data: {request.form}")
-        logging.debug(f"Files: {request.files}")
+        logger.debug("Form data: %s", request.form)
+        logger.debug("Files: %s", request.files)
 
         if 'file' not in request.files:
-            logging.error("No file part in the request")
+            logger.error("No file part in the request")
             flash('No file part', 'danger')
             return redirect(request.url)
 
         file = request.files['file']
-        logging.debug(f"File received: {file.filename}")
+        logger.debug("File received: %s", file.filename)
 
         if file.filename == '':
             flash('No selected file', 'danger')
@@ -517,374 +903,385 @@ def upload():
 
         if file:
             try:
-                # Process CSV file
-                logging.debug("Reading CSV file")
-                df = pd.read_csv(file)
-                logging.debug(f"CSV data: {df.head()}")
-
-                # Validate columns
-                required_columns = ['Account', 'bal']
-                if not all(col in df.columns for col in required_columns):
+                # Store the file and hand it to a background upload job
+                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+                path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}.csv")
+                file.save(path)
+
+                try:
+                    check_csv_header(path)
+                except (CSVFormatError, UnicodeDecodeError):
+                    os.remove(path)
                     flash('CSV file must contain Account and bal columns', 'danger')
                     return redirect(request.url)
 
-                # Track before/after states
-                results = {
-                    'updated': 0,
-                    'error': 0,
-                    'not_found': 0,
-                    'not_found_accounts': [],
-                    'error_accounts': [],
-                    'snapshots': []
-                }
+                job_id, batch_id = submit_upload(app, path, secure_filename(file.filename))
+                logger.debug("Queued upload job %s for %s", job_id, file.filename)
 
-                # Process each row
-                for _, row in df.iterrows():
-                    account_number = str(row['Account']).strip()
-                    try:
-                        new_balance = float(row['bal'])
-                        account = Account.query.filter_by(account_number=account_number).first()
-
-                        if account:
-                            # Create snapshot
-                            snapshot = {
-                                'account_number': account_number,
-                                'account_name': account.account_name,
-                                'bank_name': account.bank_name,
-                                'previous_balance': account.balance,
-                                'new_balance': new_balance,
-                                'change': new_balance - account.balance
-                            }
-                            results['snapshots'].append(snapshot)
-
-                            # Log the transaction
-                            log = TransactionLog(
-                                account_id=account.id,
-                                previous_balance=account.balance,
-                                new_balance=new_balance,
-                                change_amount=new_balance - account.balance,
-                                source="CSV upload"
-                            )
-                            db.session.add(log)
-
-                            # Update the account balance
-                            account.balance = new_balance
-                            account.updated_at = datetime.utcnow()
-
-                            results['updated'] += 1
-                            logging.debug(f"Updated account {account_number}: balance {account.balance} -> {new_balance}")
-                        else:
-                            results['not_found'] += 1
-                            results['not_found_accounts'].append(account_number)
-                            logging.debug(f"Account not found: {account_number}")
-                    except Exception as e:
-                        error_info = {'account': account_number, 'error': str(e)}
-                        results['error_accounts'].append(error_info)
-                        results['error'] += 1
-                        logging.error(f"Error processing account {account_number}: {str(e)}")
-
-                db.session.commit()
-
-                flash(f"Updated {results['updated']} accounts. {results['not_found']} not found. {results['error']} errors.", 'info')
-
-                # Store results in session for report view
-                session['latest_upload_results'] = {
-                    'updated': results['updated'],
-                    'not_found': results['not_found'],
-                    'error': results['error'],
-                    'not_found_accounts': results['not_found_accounts'],
-                    'error_accounts': results['error_accounts']
-                }
+                # Only the batch id goes into the session; results live in the database
+                session['latest_upload_batch'] = batch_id
 
-                # Store snapshots in session for report view
-                session_snapshots = [
-                    {
-                        'account_number': s['account_number'],
-                        'account_name': s['account_name'],
-                        'bank_name': s['bank_name'],
-                        'before': {
-                            'balance': s['previous_balance']
-                        },
-                        'after': {
-                            'balance': s['new_balance'],
-                            'change': s['change']
-                        }
-                    }
-                    for s in results['snapshots']
-                ]
-
-                session['latest_upload_snapshots'] = session_snapshots
+                if request.accept_mimetypes.best == 'application/json':
+                    return jsonify({
+                        'job_id': job_id,
+                        'batch_id': batch_id,
+                        'status_url': url_for('upload_status', job_id=job_id)
+                    }), 202
 
-                return redirect(url_for('reports'))
+                return redirect(url_for('upload', job=job_id))
 
             except Exception as e:
                 flash(f'Error processing file: {str(e)}', 'danger')
-                logging.error(f"Upload error: {str(e)}")
+                logger.error("Upload error: %s", e)
                 return redirect(request.url)
 
-    return render_template('upload.html')
+    return render_template('upload.html', job_id=request.args.get('job'))
+
+@app.route('/api/uploads')
+def upload_jobs():
+    """API endpoint listing the most recent upload jobs."""
+    with read_session() as read:
+        jobs = read.scalars(
+            sa.select(UploadJob).order_by(UploadJob.created_at.desc()).limit(20)
+        ).all()
+        return jsonify({'uploads': [job_status(job) for job in jobs]})
+
+@app.route('/api/uploads/<job_id>')
+def upload_status(job_id):
+    """API endpoint reporting an upload job's state, progress, throughput and result counts."""
+    with read_session() as read:
+        job = read.get(UploadJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Upload job not found'}), 404
+        return jsonify(job_status(job))
+
+@app.route('/api/upload-batches/<int:batch_id>')
+def upload_batch(batch_id):
+    """API endpoint returning an upload batch's result counts."""
+    with read_session() as read:
+        batch = read.get(UploadBatch, batch_id)
+        if batch is None:
+            abort(404)
+        return jsonify(batch_summary(batch))
+
+@app.route('/api/upload-batches/<int:batch_id>/snapshots')
+def upload_batch_snapshots(batch_id):
+    """API endpoint returning one page of an upload batch's before/after snapshots."""
+    with read_session() as read:
+        if read.get(UploadBatch, batch_id) is None:
+            abort(404)
+        page = SelectPagination(select=batch_snapshots_query(batch_id), session=read,
+                                per_page=app.config['SNAPSHOTS_PER_PAGE'], max_per_page=1000)
+
+        snapshots = []
+        for log in page.items:
+            snapshot = snapshot_from_log(log)
+            snapshot['before']['timestamp'] = log.timestamp.isoformat() if log.timestamp else None
+            snapshots.append(snapshot)
+
+    return jsonify({
+        'batch_id': batch_id,
+        'page': page.page,
+        'per_page': page.per_page,
+        'total': page.total,
+        'pages': page.pages,
+        'snapshots': snapshots
+    })
+
+@app.route('/export/<table_name>')
+def export_table(table_name):
+    """
+    Download a table as CSV or NDJSON (?format=), gzipped with ?gzip=1.
+
+    The file is streamed as it is read, so the response starts at once and
+    memory use does not grow with the table.
+    """
+    if table_name not in EXPORT_TABLES:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+
+    def generate():
+        with read_connection() as conn:
+            yield from iter_export(conn, table_name, fmt, compress, app.config['EXPORT_BATCH_SIZE'])
+
+    filename = f"{table_name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/export/batches/<int:from_id>/diff/<to>')
+def export_batch_diff(from_id, to):
+    """Download a whole batch diff as CSV or NDJSON (?format=, ?gzip=1, ?status=), streamed."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    status = request.args.get('status')
+    if status and status not in DIFF_STATUSES:
+        return jsonify({'error': f"status must be one of {', '.join(DIFF_STATUSES)}"}), 400
+
+    with read_connection() as conn:
+        to_batch = parse_diff_side(conn, to)
+        if parse_diff_side(conn, str(from_id)) is None or to_batch is None:
+            abort(404)
+
+    def generate():
+        with read_connection() as conn:
+            rows = iter_diff_rows(conn, from_id, to_batch, status, app.config['EXPORT_BATCH_SIZE'])
+            yield from encode_rows(rows, DIFF_COLUMNS, fmt, compress, app.config['EXPORT_BATCH_SIZE'])
+
+    filename = f"batch-{from_id}-vs-{to_batch}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# Responses computed for the current data version, shared by this worker's requests
+response_cache = VersionedCache()
+
+def _not_modified(etag):
+    """A bodyless 304 for a client that already holds etag."""
+    response = make_response('', 304)
+    return _revalidate(response, etag)
+
+def _revalidate(response, etag):
+    """Tag a response with etag and let clients keep it only while it revalidates."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _cache_etag(version, key):
+    """An ETag for the response cached under key, a tuple naming the endpoint first, at version."""
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f"{key[0]}-{version}-{digest}"
+
+def _render_reports(batch_id, as_of=None):
+    """
+    Render the reports page, with one page of the given upload batch's
+    snapshots. With as_of, the grouped FRN/owner totals are the balances
+    as they stood then.
+    """
+    # Get accounts maturing soon: the calendar says whether there are any,
+    # and only then is the end_date index range read for the list
+    today = datetime.utcnow().date()
+    maturing_accounts = []
+    if maturing_totals(db.session, today, MATURING_DAYS)[0].account_count:
+        maturing_accounts = db.session.scalars(
+            sa.select(Account).where(
+                Account.end_date >= today,
+                Account.end_date <= today + timedelta(days=MATURING_DAYS)
+            ).order_by(Account.end_date)
+        ).all()
+    calendar = maturity_calendar(db.session, today, app.config['MATURITY_CALENDAR_PERIODS'])
+
+    # Get account balances by FRN from the rollup table
+    frn_balances = [(row.frn, row.total_balance) for row in grouped_totals(db.session, 'frn')]
+    logger.debug("FRN Balances (rollups): %s", frn_balances)
+
+    # Get account balances by owner
+    owner_balances = [(row.owner, row.total_balance) for row in grouped_totals(db.session, 'owner')]
+    logger.debug("Owner Balances (rollups): %s", owner_balances)
+
+    # Get accounts by FRN and owner for the grouped report, replayed from
+    # the logs when a past date is asked for
+    accounts_by_frn_owner = []
+    if as_of is not None:
+        accounts_by_frn_owner, _ = grouped_balances(db.session, as_of, ('frn', 'owner'))
+    else:
+        for row in grouped_totals(db.session, 'frn', 'owner'):
+            accounts_by_frn_owner.append({
+                'frn': row[0],
+                'owner': row[1],
+                'account_count': row[2],
+                'total_balance': row[3]
+            })
+
+    logger.debug("Accounts by FRN and Owner (rollups): %s", accounts_by_frn_owner)
+
+    # Get the latest completed upload batch and one page of its snapshots
+    latest_upload = {}
+    account_snapshots = []
+    snapshot_page = None
+    batch = db.session.get(UploadBatch, batch_id) if batch_id else None
+    if batch is not None and (batch.job is None or batch.job.state == 'done'):
+        latest_upload = batch_summary(batch)
+        snapshot_page = db.paginate(batch_snapshots_query(batch.id),
+                                    per_page=app.config['SNAPSHOTS_PER_PAGE'],
+                                    max_per_page=1000, error_out=False)
+        account_snapshots = [snapshot_from_log(log) for log in snapshot_page.items]
+
+    return render_template('reports.html',
+                           maturing_accounts=maturing_accounts,
+                           maturing_days=MATURING_DAYS,
+                           maturity_calendar=calendar,
+                           frn_balances=frn_balances,
+                           owner_balances=owner_balances,
+                           accounts_by_frn_owner=accounts_by_frn_owner,
+                           as_of=as_of,
+                           csv_results=latest_upload,
+                           account_snapshots=account_snapshots,
+                           snapshot_page=snapshot_page)
 
 @app.route('/reports')
 def reports():
-    logging.debug("Generating reports with timestamp query param: " + str(request.args.get('_', 'none')))
+    logger.debug("Generating reports with timestamp query param: %s", request.args.get('_', 'none'))
 
     try:
         # Force a clean slate for database queries - make sure we don't have stale data
         db.session.close()
         db.session.expire_all()
 
-        # Create a completely fresh engine connection for this request
-        with app.app_context():
-            logging.debug("Explicitly refreshing database session")
-
-            # Get accounts maturing soon (within 30 days)
-            thirty_days_future = datetime.utcnow().date() + timedelta(days=30)
-
-            # Use direct SQL for reliable results
-            maturing_sql = sa.text('''
-            SELECT * FROM accounts
-            WHERE end_date <= :future_date
-            AND end_date >= :today
-            ORDER BY end_date
-            ''')
-
-            maturing_result = db.session.execute(
-                maturing_sql,
-                {'future_date': thirty_days_future, 'today': datetime.utcnow().date()}
-            )
-
-            # Convert to list of dictionaries
-            maturing_accounts = []
-            for row in maturing_result:
-                # Convert SQLAlchemy row to dict
-                account_dict = dict(row._mapping)
-                # Create an object that mimics the ORM object
-                account = type('Account', (), account_dict)
-                maturing_accounts.append(account)
-
-            # Get account balances by FRN using direct SQL
-            frn_balances_sql = sa.text('''
-            SELECT b.frn, SUM(a.balance) as total_balance
-            FROM banks b
-            JOIN accounts a ON a.bank_id = b.id
-            GROUP BY b.frn
-            ''')
-
-            frn_balances_result = db.session.execute(frn_balances_sql)
-            frn_balances = [(row[0], row[1]) for row in frn_balances_result]
-            logging.debug(f"FRN Balances (direct SQL): {frn_balances}")
-
-            # Get account balances by owner
-            owner_balances_sql = sa.text('''
-            SELECT owner, SUM(balance) as total_balance
-            FROM accounts
-            GROUP BY owner
-            ''')
-
-            owner_balances_result = db.session.execute(owner_balances_sql)
-            owner_balances = [(row[0], row[1]) for row in owner_balances_result]
-            logging.debug(f"Owner Balances (direct SQL): {owner_balances}")
-
-            # Get accounts by FRN and owner for the grouped report
-            # Using direct SQL for most reliable results
-            grouped_sql = sa.text('''
-            SELECT b.frn, a.owner,
-                   COUNT(a.id) as account_count,
-                   SUM(a.balance) as total_balance
-            FROM banks b
-            JOIN accounts a ON a.bank_id = b.id
-            GROUP BY b.frn, a.owner
-            ORDER BY b.frn, a.owner
-            ''')
-
-            # Execute with the current session connection
-            grouped_result = db.session.execute(grouped_sql)
-
-            # Process the results
-            accounts_by_frn_owner = []
-            for row in grouped_result:
-                accounts_by_frn_owner.append({
-                    'frn': row[0],
-                    'owner': row[1],
-                    'account_count': row[2],
-                    'total_balance': row[3]
-                })
-
-            logging.debug(f"Accounts by FRN and Owner (direct SQL): {accounts_by_frn_owner}")
-
-            # Get latest snapshots from session or create empty list
-            latest_upload = session.get('latest_upload_results', {})
-            account_snapshots = session.get('latest_upload_snapshots', [])
-
-            # Create a Flask response with cache control headers
-            response = make_response(render_template('reports.html',
-                                  maturing_accounts=maturing_accounts,
-                                  frn_balances=frn_balances,
-                                  owner_balances=owner_balances,
-                                  accounts_by_frn_owner=accounts_by_frn_owner,
-                                  csv_results=latest_upload,
-                                  account_snapshots=account_snapshots))
-
-            # Set cache control headers to prevent browser caching
+        batch_id = session.get('latest_upload_batch')
+
+        as_of = None
+        if request.args.get('as_of'):
+            try:
+                as_of = parse_as_of(request.args['as_of'])
+            except ValueError:
+                flash('Invalid as-of date. Use YYYY-MM-DD.', 'danger')
+                return redirect(url_for('reports'))
+
+        # A page carrying flashed messages is one-off; render it uncached
+        if '_flashes' in session:
+            response = make_response(_render_reports(batch_id, as_of))
             response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             response.headers['Pragma'] = 'no-cache'
             response.headers['Expires'] = '0'
-
             return response
 
+        # The page depends on the data, this user's upload batch, today's
+        # date (for the maturing list), as_of and the snapshot page; the
+        # cache key and the ETag both cover all of them.
+        version = current_version(db.session)
+        today = datetime.utcnow().date()
+        key = ('reports', batch_id, today, as_of, request.args.get('page'), request.args.get('per_page'))
+        etag = _cache_etag(version, key)
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
+        html = response_cache.get_or_compute(version, key, lambda: _render_reports(batch_id, as_of))
+        return _revalidate(make_response(html), etag)
+
     except Exception as e:
         # Log the full error with traceback for debugging
-        logging.error(f"Error generating reports: {str(e)}", exc_info=True)
+        logger.error("Error generating reports: %s", e, exc_info=True)
         # Return a friendly error page
         return render_template('error.html', error=str(e)), 500
 
+def _frn_owner_payload(conn):
+    accounts_by_frn_owner = []
+    for row in grouped_totals(conn, 'frn', 'owner'):
+        accounts_by_frn_owner.append({
+            'frn': row[0],
+            'owner': row[1],
+            'account_count': row[2],
+            'total_balance': row[3]
+        })
+
+    logger.debug("API FRN-Owner data: %s", accounts_by_frn_owner)
+    return {'accounts_by_frn_owner': accounts_by_frn_owner}
+
 @app.route('/api/frn-owner-data')
 def frn_owner_data():
     """API endpoint specifically for getting the accounts grouped by FRN and owner."""
     timestamp = request.args.get('_', 'none')
-    logging.debug(f"Generating FRN-Owner data with timestamp: {timestamp}")
+    logger.debug("Generating FRN-Owner data with timestamp: %s", timestamp)
 
     try:
-        # Create a completely new session to bypass any caching
-        from sqlalchemy import create_engine
-        from sqlalchemy.orm import sessionmaker
-
-        # Get a brand new connection from the database URL
-        engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"],
-                             pool_pre_ping=True,
-                             echo=True)
-        Session = sessionmaker(bind=engine)
-        fresh_session = Session()
-
-        # Direct SQL query with the fresh session
-        query = sa.text('''
-        SELECT
-            b.frn,
-            a.owner,
-            COUNT(a.id) as account_count,
-            SUM(a.balance) as total_balance
-        FROM banks b
-        JOIN accounts a ON a.bank_id = b.id
-        GROUP BY b.frn, a.owner
-        ORDER BY b.frn, a.owner
-        ''')
-
-        result = fresh_session.execute(query)
-
-        # Process the results
-        accounts_by_frn_owner = []
-        for row in result:
-            accounts_by_frn_owner.append({
-                'frn': row[0],
-                'owner': row[1],
-                'account_count': row[2],
-                'total_balance': row[3]
-            })
-
-        # Close the fresh session
-        fresh_session.close()
-
-        logging.debug(f"API FRN-Owner data: {accounts_by_frn_owner}")
-
-        # Return with aggressive no-cache headers
-        response = jsonify({'accounts_by_frn_owner': accounts_by_frn_owner})
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        # Version and rollup totals from one read transaction on the shared read pool
+        with read_connection() as conn:
+            version = current_version(conn)
+            etag = f"frn-owner-data-{version}"
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            payload = response_cache.get_or_compute(version, 'frn-owner-data',
+                                                    lambda: _frn_owner_payload(conn))
+
+        response = _revalidate(jsonify(payload), etag)
         response.headers['X-Timestamp'] = str(timestamp)  # Echo timestamp to confirm fresh response
         return response
 
     except Exception as e:
-        logging.error(f"Error generating FRN-Owner data: {str(e)}", exc_info=True)
+        logger.error("Error generating FRN-Owner data: %s", e, exc_info=True)
         return jsonify({
             'error': str(e),
             'accounts_by_frn_owner': []
         }), 500
 
+def _chart_payload(conn):
+    # Account type distribution from the rollup table
+    labels = []
+    values = []
+    for row in grouped_totals(conn, 'account_type'):
+        labels.append(row[0])
+        values.append(row[1])
+
+    account_type_data = {
+        'labels': labels,
+        'values': values
+    }
+    logger.debug("Account types (rollups): %s", account_type_data)
+
+    # Owner distribution
+    labels = []
+    values = []
+    for row in grouped_totals(conn, 'owner'):
+        labels.append(row[0])
+        values.append(row[1])
+
+    owner_data = {
+        'labels': labels,
+        'values': values
+    }
+    logger.debug("Owners (rollups): %s", owner_data)
+
+    # FRN distribution
+    labels = []
+    values = []
+    for row in grouped_totals(conn, 'frn'):
+        labels.append(row[0] if row[0] else 'Unknown')
+        values.append(row[1])
+
+    frn_data = {
+        'labels': labels,
+        'values': values
+    }
+    logger.debug("FRNs (rollups): %s", frn_data)
+
+    return {
+        'account_types': account_type_data,
+        'owners': owner_data,
+        'frns': frn_data
+    }
+
 @app.route('/api/chart-data')
 def chart_data():
-    logging.debug("Generating chart data")
+    logger.debug("Generating chart data")
 
     try:
-        # Force a clean slate for database queries
-        db.session.close()  # Close the session
-        db.session.expire_all()  # Expire all objects
-
-        # Account type distribution - using direct SQL for reliability
-        query1 = sa.text('''
-        SELECT account_type, COUNT(id) as count
-        FROM accounts
-        GROUP BY account_type
-        ''')
-        result1 = db.session.execute(query1)
-
-        labels = []
-        values = []
-        for row in result1:
-            labels.append(row[0])
-            values.append(row[1])
-
-        account_type_data = {
-            'labels': labels,
-            'values': values
-        }
-        logging.debug(f"Account types (fresh SQL): {account_type_data}")
-
-        # Owner distribution
-        query2 = sa.text('''
-        SELECT owner, COUNT(id) as count
-        FROM accounts
-        GROUP BY owner
-        ''')
-        result2 = db.session.execute(query2)
-
-        labels = []
-        values = []
-        for row in result2:
-            labels.append(row[0])
-            values.append(row[1])
-
-        owner_data = {
-            'labels': labels,
-            'values': values
-        }
-        logging.debug(f"Owners (fresh SQL): {owner_data}")
-
-        # FRN distribution
-        query3 = sa.text('''
-        SELECT b.frn, COUNT(a.id) as count
-        FROM banks b
-        JOIN accounts a ON a.bank_id = b.id
-        GROUP BY b.frn
-        ''')
-        result3 = db.session.execute(query3)
-
-        labels = []
-        values = []
-        for row in result3:
-            labels.append(row[0] if row[0] else 'Unknown')
-            values.append(row[1])
-
-        frn_data = {
-            'labels': labels,
-            'values': values
-        }
-        logging.debug(f"FRNs (fresh SQL): {frn_data}")
+        # Version and all three distributions read one consistent snapshot from the read pool
+        with read_connection() as conn:
+            version = current_version(conn)
+            etag = f"chart-data-{version}"
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            payload = response_cache.get_or_compute(version, 'chart-data', lambda: _chart_payload(conn))
 
-        # Set cache control headers
-        response = jsonify({
-            'account_types': account_type_data,
-            'owners': owner_data,
-            'frns': frn_data
-        })
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
+        return _revalidate(jsonify(payload), etag)
 
     except Exception as e:
         # Log the full error with traceback for debugging
-        logging.error(f"Error generating chart data: {str(e)}", exc_info=True)
+        logger.error("Error generating chart data: %s", e, exc_info=True)
         # Return error as JSON
         return jsonify({
             'error': str(e),
@@ -893,6 +1290,121 @@ def chart_data():
             'frns': {'labels': [], 'values': []}
         }), 500
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request and SQL metrics summed over every worker, for Prometheus to scrape."""
+    values = app.extensions['metrics'].collect()
+    return Response(render_metrics(values), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/dashboard')
+def dashboard_data():
+    """The dashboard figures and latest logs as JSON, for refreshing the homepage in place."""
+    try:
+        with read_session() as read:
+            version = current_version(read)
+            today = datetime.utcnow().date()
+            etag = f"dashboard-{version}-{today.isoformat()}"
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            payload = response_cache.get_or_compute(version, ('dashboard', today),
+                                                    lambda: dashboard_payload(read, today))
+
+        return _revalidate(jsonify(payload), etag)
+
+    except Exception as e:
+        logger.error("Error generating dashboard data: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def _as_of_groups(group_by):
+    columns = tuple(column.strip() for column in group_by.split(','))
+    if not all(column in BALANCE_GROUPS for column in columns):
+        raise ValueError(f"group_by must be account or a comma-separated list of {', '.join(BALANCE_GROUPS)}")
+    return columns
+
+@app.route('/api/balances')
+def balances_data():
+    """
+    API endpoint returning every balance as it stood at as_of (an ISO date or
+    datetime), per account or grouped with group_by=owner,frn,... .
+    """
+    if not request.args.get('as_of'):
+        return jsonify({'error': "as_of is required"}), 400
+    try:
+        as_of = parse_as_of(request.args['as_of'])
+    except ValueError:
+        return jsonify({'error': "as_of must be an ISO date or datetime"}), 400
+    group_by = request.args.get('group_by', 'account')
+    try:
+        columns = () if group_by == 'account' else _as_of_groups(group_by)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with read_connection() as conn:
+        version = current_version(conn)
+        etag = f"balances-{version}-{as_of.isoformat()}-{','.join(columns) or 'account'}"
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+        payload = response_cache.get_or_compute(version, ('balances', as_of, columns),
+                                                lambda: balances_payload(conn, as_of, columns))
+
+    return _revalidate(jsonify(payload), etag)
+
+@app.route('/api/projections')
+def projections_data():
+    """
+    API endpoint returning accrued interest and projected balances at
+    maturity, in total and by owner and FRN. horizon (days) caps how far
+    ahead accounts are projected.
+    """
+    try:
+        horizon = int(request.args.get('horizon', app.config['PROJECTION_HORIZON_DAYS']))
+    except ValueError:
+        return jsonify({'error': "horizon must be a number of days"}), 400
+    if not 0 <= horizon <= app.config['PROJECTION_MAX_HORIZON_DAYS']:
+        return jsonify({'error': f"horizon must be between 0 and {app.config['PROJECTION_MAX_HORIZON_DAYS']} days"}), 400
+
+    with read_connection() as conn:
+        version = current_version(conn)
+        today = datetime.utcnow().date()
+        etag = f"projections-{version}-{today.isoformat()}-{horizon}"
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+        payload = response_cache.get_or_compute(version, ('projections', today, horizon),
+                                                lambda: projections_payload(conn, today, horizon))
+
+    return _revalidate(jsonify(payload), etag)
+
+@app.route('/api/maturities')
+def maturities_data():
+    """
+    API endpoint returning accounts maturing within `within` days, by owner
+    and FRN, and a calendar of the next `periods` months or weeks (bucket),
+    all read from the maturity calendar.
+    """
+    try:
+        days = int(request.args.get('within', MATURING_DAYS))
+        periods = int(request.args.get('periods', app.config['MATURITY_CALENDAR_PERIODS']))
+    except ValueError:
+        return jsonify({'error': "within and periods must be integers"}), 400
+    if not 0 <= days <= app.config['MATURITY_MAX_DAYS']:
+        return jsonify({'error': f"within must be between 0 and {app.config['MATURITY_MAX_DAYS']} days"}), 400
+    if not 0 <= periods <= app.config['MATURITY_MAX_PERIODS']:
+        return jsonify({'error': f"periods must be between 0 and {app.config['MATURITY_MAX_PERIODS']}"}), 400
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in CALENDAR_BUCKETS:
+        return jsonify({'error': f"bucket must be one of {', '.join(CALENDAR_BUCKETS)}"}), 400
+
+    with read_connection() as conn:
+        version = current_version(conn)
+        today = datetime.utcnow().date()
+        etag = f"maturities-{version}-{today.isoformat()}-{days}-{periods}-{bucket}"
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+        payload = response_cache.get_or_compute(version, ('maturities', today, days, periods, bucket),
+                                                lambda: maturities_payload(conn, today, days, periods, bucket))
+
+    return _revalidate(jsonify(payload), etag)
+
 # Run the app
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
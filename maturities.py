@@ -0,0 +1,164 @@
+from bisect import bisect_right
+from datetime import date, timedelta
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from models import Account, Bank, MaturityBucket
+from money import round_money
+from rollups import NO_FRN, collect_deltas, compare_totals, mark_stale_on_bulk_writes, upsert_deltas
+
+# Accounts ending within this many days count as maturing soon
+MATURING_DAYS = 30
+
+# Account columns that, with frn, key the maturity calendar
+MATURITY_COLUMNS = ('end_date', 'owner')
+
+# Period lengths the calendar can be read back in
+CALENDAR_BUCKETS = ('month', 'week')
+
+def maturing_totals(conn, today, days, *columns):
+    """
+    Account counts and balance totals for accounts ending between today and
+    days from now, read from the calendar. Grouped by the given calendar
+    columns (frn, owner) and ordered by them, or a single total row when
+    none are given. Grouping by frn leaves out accounts without a bank.
+    """
+    group = [getattr(MaturityBucket, column) for column in columns]
+    stmt = sa.select(
+        *group,
+        sa.func.coalesce(sa.func.sum(MaturityBucket.account_count), 0).label('account_count'),
+        sa.func.coalesce(sa.func.sum(MaturityBucket.total_balance), 0.0).label('total_balance')
+    ).where(
+        MaturityBucket.end_date >= today,
+        MaturityBucket.end_date <= today + timedelta(days=days)
+    )
+    if columns:
+        stmt = stmt.group_by(*group).order_by(*group)
+    if 'frn' in columns:
+        stmt = stmt.where(MaturityBucket.frn != NO_FRN)
+    return conn.execute(stmt).all()
+
+def _bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def _next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+def maturity_calendar(conn, today, periods, bucket='month'):
+    """
+    Accounts maturing in each of the next periods months or weeks (weeks
+    start on Monday), the first period running from today. Returns a list
+    of dicts with start, end, account_count and total_balance.
+    """
+    if bucket not in CALENDAR_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(CALENDAR_BUCKETS)}")
+
+    calendar = []
+    start = _bucket_start(today, bucket)
+    for _ in range(periods):
+        following = _next_bucket(start, bucket)
+        calendar.append({'start': max(start, today), 'end': following - timedelta(days=1),
+                         'account_count': 0, 'total_balance': 0.0})
+        start = following
+    if not calendar:
+        return calendar
+
+    rows = conn.execute(
+        sa.select(
+            MaturityBucket.end_date,
+            sa.func.sum(MaturityBucket.account_count),
+            sa.func.sum(MaturityBucket.total_balance)
+        ).where(
+            MaturityBucket.end_date >= today,
+            MaturityBucket.end_date <= calendar[-1]['end']
+        ).group_by(MaturityBucket.end_date)
+    ).all()
+
+    starts = [period['start'] for period in calendar]
+    for end_date, count, balance in rows:
+        period = calendar[bisect_right(starts, end_date) - 1]
+        period['account_count'] += count
+        period['total_balance'] = round_money(period['total_balance'] + balance)
+    return calendar
+
+def maturities_payload(conn, today, days, periods, bucket):
+    """The maturity window totals, their owner and FRN breakdowns and the calendar, for the API."""
+    def totals(row):
+        return {'account_count': row.account_count, 'total_balance': row.total_balance}
+
+    return {
+        'as_of': today.isoformat(),
+        'within_days': days,
+        'maturing': totals(maturing_totals(conn, today, days)[0]),
+        'by_owner': [dict(totals(row), owner=row.owner) for row in maturing_totals(conn, today, days, 'owner')],
+        'by_frn': [dict(totals(row), frn=row.frn) for row in maturing_totals(conn, today, days, 'frn')],
+        'bucket': bucket,
+        'calendar': [
+            dict(period, start=period['start'].isoformat(), end=period['end'].isoformat())
+            for period in maturity_calendar(conn, today, periods, bucket)
+        ],
+    }
+
+def _aggregate_select():
+    """Calendar rows computed from scratch over accounts with an end date."""
+    frn = sa.func.coalesce(Bank.frn, NO_FRN)
+    return sa.select(
+        Account.end_date,
+        frn.label('frn'),
+        Account.owner,
+        sa.func.count(Account.id).label('account_count'),
+        sa.func.coalesce(sa.func.sum(Account.balance), 0.0).label('total_balance')
+    ).select_from(Account).outerjoin(Bank, Bank.id == Account.bank_id).where(
+        Account.end_date.is_not(None)
+    ).group_by(Account.end_date, frn, Account.owner)
+
+def rebuild_maturities(conn):
+    """Replace the maturity calendar's contents with a full recomputation."""
+    conn.execute(sa.delete(MaturityBucket))
+    conn.execute(sa.insert(MaturityBucket).from_select(
+        ['end_date', 'frn', 'owner', 'account_count', 'total_balance'],
+        _aggregate_select()
+    ))
+
+def check_maturities(conn, tolerance=0.005):
+    """Compare the maturity calendar with a full recomputation; see check_rollups."""
+    stored = {
+        (r.end_date, r.frn, r.owner): (r.account_count, r.total_balance)
+        for r in conn.execute(sa.select(MaturityBucket))
+    }
+    expected = {
+        (r.end_date, r.frn, r.owner): (r.account_count, r.total_balance)
+        for r in conn.execute(_aggregate_select())
+    }
+    return compare_totals(stored, expected, tolerance)
+
+def apply_maturity_deltas(conn, deltas):
+    """
+    Add {(frn, end_date, owner): (count_delta, balance_delta)} to the
+    calendar, ignoring accounts without an end date.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if key[1] is not None}
+    upsert_deltas(conn, MaturityBucket, ('frn',) + MATURITY_COLUMNS, deltas)
+
+@sa.event.listens_for(Session, 'before_flush')
+def _maintain_maturities(session, flush_context, instances):
+    deltas = collect_deltas(session, MATURITY_COLUMNS)
+    if deltas:
+        apply_maturity_deltas(session.connection(), deltas)
+
+# As with the rollups, bulk writes that did not apply their own deltas have
+# the calendar rebuilt before commit
+mark_stale_on_bulk_writes('maturities_stale')
+
+@sa.event.listens_for(Session, 'before_commit')
+def _rebuild_stale_maturities(session):
+    if session.info.pop('maturities_stale', False):
+        session.flush()
+        rebuild_maturities(session.connection())
+
+@sa.event.listens_for(Session, 'after_rollback')
+def _forget_stale_maturities(session):
+    session.info.pop('maturities_stale', None)
@@ -0,0 +1,218 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import sqlalchemy as sa
+from flask import current_app, request
+
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metric families /metrics reports: name -> (type, help)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route and method.'),
+    'http_requests_total': ('counter', 'Requests by route, method and status.'),
+    'db_queries_total': ('counter', 'SQL statements run by requests, by route.'),
+    'db_query_seconds_total': ('counter', 'Time requests spent running SQL, by route.'),
+    'db_slow_queries_total': ('counter', 'SQL statements slower than SLOW_QUERY_MS, by route.'),
+}
+
+logger = logging.getLogger(__name__)
+
+# The request in progress on this thread. A context variable rather than
+# flask.g so that work run inline under its own app context (an upload
+# job with UPLOAD_WORKERS=0) still counts towards the request.
+_current = ContextVar('request_metrics', default=None)
+
+class RequestMetrics:
+    """Timings for the request in progress."""
+
+    def __init__(self, path, slow_seconds):
+        self.path = path
+        self.started = time.perf_counter()
+        self.slow_seconds = slow_seconds
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slow_queries = 0
+
+def current_request_metrics():
+    """The RequestMetrics of the request running on this thread, if any."""
+    return _current.get()
+
+@contextmanager
+def counted_towards(state):
+    """Count SQL run inside the block towards state, a request's RequestMetrics, from any thread."""
+    token = _current.set(state)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+@sa.event.listens_for(sa.engine.Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@sa.event.listens_for(sa.engine.Engine, 'after_cursor_execute')
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    state = _current.get()
+    if state is None:
+        return
+    state.queries += 1
+    state.sql_seconds += elapsed
+    if elapsed >= state.slow_seconds:
+        state.slow_queries += 1
+        logger.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000, state.path, ' '.join(statement.split()),
+                       extra={'duration_ms': round(elapsed * 1000, 1), 'path': state.path})
+
+@sa.event.listens_for(sa.engine.Engine, 'handle_error')
+def _abandon_query(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+class MetricsStore:
+    """
+    Counters for this worker process, shared with the others through a
+    directory.
+
+    Every value, histogram buckets included, is a counter keyed by metric
+    name and labels. Each process writes its own counters to a file of its
+    own in directory, within flush_interval seconds of a change, so any
+    worker can answer /metrics by summing every file there. Counters from
+    workers that have exited stay in the sum, as Prometheus expects of
+    counters; empty the directory when the whole server restarts.
+    """
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._values = {}
+        self._timer = None
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # Forked from a process that had already counted requests
+            self._pid, self._values, self._timer = os.getpid(), {}, None
+
+    def _add(self, name, labels, amount=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def record_request(self, route, method, status, seconds, state):
+        """Count one finished request and the SQL it ran."""
+        with self._lock:
+            self._check_fork()
+            labels = {'route': route, 'method': method}
+            for bound in LATENCY_BUCKETS:
+                self._add('http_request_duration_seconds_bucket', dict(labels, le=str(bound)),
+                          1.0 if seconds <= bound else 0.0)
+            self._add('http_request_duration_seconds_bucket', dict(labels, le='+Inf'))
+            self._add('http_request_duration_seconds_sum', labels, seconds)
+            self._add('http_request_duration_seconds_count', labels)
+            self._add('http_requests_total', dict(labels, status=str(status)))
+
+            labels = {'route': route}
+            self._add('db_queries_total', labels, state.queries)
+            self._add('db_query_seconds_total', labels, state.sql_seconds)
+            self._add('db_slow_queries_total', labels, state.slow_queries)
+
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write this process's counters to its file in the shared directory."""
+        with self._lock:
+            self._check_fork()
+            self._timer = None
+            values = [[name, list(labels), value] for (name, labels), value in self._values.items()]
+            path = os.path.join(self.directory, f"metrics-{self._pid}.json")
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(values, f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Every worker's counters summed, {(name, labels): value}, after flushing this one's."""
+        self.flush()
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                # A worker's file vanished or is being replaced
+                continue
+            for name, labels, value in values:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+def _sample_order(item):
+    # Buckets in ascending le order within each label set
+    (name, labels), _ = item
+    le = dict(labels).get('le')
+    return name, [pair for pair in labels if pair[0] != 'le'], float(le) if le else 0.0
+
+def render_metrics(values):
+    """Counters from MetricsStore.collect in the Prometheus text exposition format."""
+    lines = []
+    for family, (kind, help_text) in METRICS.items():
+        names = {f"{family}_bucket", f"{family}_sum", f"{family}_count"} if kind == 'histogram' else {family}
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for (name, labels), value in sorted(
+            ((key, value) for key, value in values.items() if key[0] in names), key=_sample_order
+        ):
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+def init_metrics(app):
+    """
+    Time every request of app and the SQL it runs.
+
+    Each response gets a Server-Timing header with the request's total and
+    SQL time, and the figures are added to the app's MetricsStore, which
+    the /metrics endpoint reads. Statements slower than SLOW_QUERY_MS are
+    logged as warnings.
+    """
+    store = MetricsStore(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_SECONDS'])
+    app.extensions['metrics'] = store
+
+    @app.before_request
+    def _start_request_metrics():
+        _current.set(RequestMetrics(f"{request.method} {request.path}", current_app.config['SLOW_QUERY_MS'] / 1000.0))
+
+    @app.after_request
+    def _record_request_metrics(response):
+        state = _current.get()
+        _current.set(None)
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state.started
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, db;dur={state.sql_seconds * 1000:.1f};desc="{state.queries} queries"'
+        )
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        store.record_request(route, request.method, response.status_code, elapsed, state)
+        return response
+
+    return store
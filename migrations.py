@@ -0,0 +1,227 @@
+import re
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn, CreateTable
+from models import db
+from money import PENCE, Money
+from maturities import rebuild_maturities
+from rollups import rebuild_rollups
+from versions import bump_version
+
+# Pages whose queries must be served from indexes, checked by check_index_usage
+INDEXED_PATHS = ['/', '/reports', '/api/chart-data', '/api/frn-owner-data', '/api/dashboard']
+
+# Tables large enough that a full scan on a hot path is a regression
+INDEXED_TABLES = ('accounts', 'transaction_logs')
+
+# Indexes earlier versions declared that no query reads any more, dropped
+# by upgrade_schema: the covering indexes for the dashboard group-bys, which
+# balance_rollups replaced
+RETIRED_INDEXES = {
+    'accounts': ('ix_accounts_type_balance', 'ix_accounts_owner_balance', 'ix_accounts_bank_owner_balance'),
+}
+
+# Most SELECTs a request to each page may run, enforced by
+# tests/test_query_budgets.py; flask check-queries reports the same
+QUERY_BUDGETS = {
+    '/': 2,
+    '/api/dashboard': 3,
+}
+
+# Derived tables filled from existing data when upgrade_schema creates them
+POPULATE = {
+    'balance_rollups': rebuild_rollups,
+    'maturity_calendar': rebuild_maturities,
+    'data_version': bump_version,
+}
+
+# "FROM accounts a" / "JOIN banks AS b": EXPLAIN QUERY PLAN reports the alias
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIASES = {'where', 'join', 'inner', 'left', 'cross', 'on', 'group', 'order', 'limit', 'union'}
+
+def upgrade_schema():
+    """
+    Bring an existing database up to the current models in place.
+
+    Creates missing tables, adds columns that newer models declare but the
+    existing tables lack, converts money columns to pence, creates missing
+    indexes and drops retired ones. Returns a list of the changes made.
+    """
+    changes = []
+    inspector = sa.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append(f"created table {table.name}")
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(sa.text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                changes.append(f"added column {table.name}.{column.name}")
+
+        changes.extend(convert_money_columns(conn))
+
+        # Derived tables are filled last, from the converted columns
+        for name, populate in POPULATE.items():
+            if name not in existing_tables:
+                populate(conn)
+                changes.append(f"populated table {name}")
+
+    changes.extend(create_missing_indexes())
+    changes.extend(drop_retired_indexes())
+    return changes
+
+def convert_money_columns(conn):
+    """
+    Convert money columns still stored as floating-point pounds to integer
+    pence, rounding every amount to the penny in one bulk statement per
+    table.
+
+    SQLite cannot change a column's type in place, so there the table is
+    rebuilt: created afresh under a temporary name, filled with a single
+    INSERT ... SELECT and swapped in; create_missing_indexes then recreates
+    its indexes. Columns the models no longer declare are not carried over.
+    Returns a list of the columns converted.
+    """
+    changes = []
+    inspector = sa.inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        stored = {c['name']: c['type'] for c in inspector.get_columns(table.name)}
+        money = [c.name for c in table.columns
+                 if isinstance(c.type, Money) and isinstance(stored.get(c.name), sa.Float)]
+        if not money:
+            continue
+
+        if conn.dialect.name == 'sqlite':
+            _rebuild_sqlite_table(conn, table, [c.name for c in table.columns if c.name in stored], money)
+        else:
+            conn.execute(sa.text(f"ALTER TABLE {table.name} " + ", ".join(
+                f"ALTER COLUMN {name} TYPE BIGINT USING ROUND({name} * {PENCE})" for name in money
+            )))
+        changes.extend(f"converted {table.name}.{name} to pence" for name in money)
+    return changes
+
+def _rebuild_sqlite_table(conn, table, columns, money):
+    rebuilt = f"{table.name}_rebuild"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.execute(sa.text(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {rebuilt} ", 1)))
+    values = [f"CAST(ROUND({name} * {PENCE}) AS INTEGER)" if name in money else name for name in columns]
+    conn.execute(sa.text(
+        f"INSERT INTO {rebuilt} ({', '.join(columns)}) SELECT {', '.join(values)} FROM {table.name}"
+    ))
+    conn.execute(sa.text(f"DROP TABLE {table.name}"))
+    conn.execute(sa.text(f"ALTER TABLE {rebuilt} RENAME TO {table.name}"))
+
+def create_missing_indexes():
+    """
+    Create every index the models declare that the database lacks.
+
+    Indexes are built in place on the existing tables, so no rebuild or data
+    copy is needed. Returns a list of the indexes created.
+    """
+    created = []
+    inspector = sa.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    created.append(f"created index {index.name}")
+        if created:
+            # Refresh planner statistics so the new indexes get picked up
+            conn.execute(sa.text("ANALYZE"))
+    return created
+
+def drop_retired_indexes():
+    """Drop the RETIRED_INDEXES the database still has. Returns a list of the indexes dropped."""
+    dropped = []
+    inspector = sa.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    with db.engine.begin() as conn:
+        for table_name, names in RETIRED_INDEXES.items():
+            if table_name not in existing_tables:
+                continue
+            existing = {ix['name'] for ix in inspector.get_indexes(table_name)}
+            for name in names:
+                if name in existing:
+                    conn.execute(sa.text(f"DROP INDEX {name}"))
+                    dropped.append(f"dropped index {name}")
+    return dropped
+
+def _capture_selects(app, path):
+    """Request path through the test client and return the (sql, parameters) of every SELECT it ran."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    sa.event.listen(sa.engine.Engine, 'before_cursor_execute', capture)
+    try:
+        app.test_client().get(path)
+    finally:
+        sa.event.remove(sa.engine.Engine, 'before_cursor_execute', capture)
+    return statements
+
+def check_index_usage(app, paths=INDEXED_PATHS):
+    """
+    Request each path through the test client, EXPLAIN every SELECT it runs
+    and report plan steps that scan an indexed table without an index.
+
+    Returns a list of (path, sql, plan detail) problems; empty means every
+    query on those pages is served from an index.
+    """
+    problems = []
+    for path in paths:
+        statements = _capture_selects(app, path)
+
+        with app.app_context():
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                    aliases = _table_aliases(statement)
+                    for step in plan:
+                        detail = step[-1]
+                        if _is_unindexed_scan(detail, aliases):
+                            problems.append((path, statement.strip(), detail))
+    return problems
+
+def check_query_budgets(app, budgets=QUERY_BUDGETS):
+    """
+    Request each path through the test client and count the SELECTs it runs.
+
+    Returns a list of (path, statements, budget) for every path that ran
+    more than its budget; empty means every page is within budget.
+    """
+    problems = []
+    for path, budget in budgets.items():
+        statements = [statement for statement, _ in _capture_selects(app, path)]
+        if len(statements) > budget:
+            problems.append((path, statements, budget))
+    return problems
+
+def _table_aliases(statement):
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(statement):
+        aliases[table] = table
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+def _is_unindexed_scan(detail, aliases):
+    words = detail.split()
+    if len(words) < 2 or words[0] != 'SCAN':
+        return False
+    return aliases.get(words[1], words[1]) in INDEXED_TABLES and 'INDEX' not in detail
@@ -0,0 +1,213 @@
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase
+from money import Money
+
+# Initialize the database
+class Base(DeclarativeBase):
+    pass
+
+db = SQLAlchemy(model_class=Base)
+
+# Define models
+class Account(db.Model):
+    __tablename__ = 'accounts'
+    __table_args__ = (
+        db.Index('ix_accounts_end_date', 'end_date'),
+        db.Index('ix_accounts_account_name', 'account_name'),
+        # The dashboard and report totals come from balance_rollups, so no
+        # index here includes balance: every balance update would pay for it
+        db.Index('ix_accounts_bank_id', 'bank_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_name = db.Column(db.String(100), nullable=False)
+    account_number = db.Column(db.String(50), nullable=False, unique=True)
+    balance = db.Column(Money, default=0.0)
+    account_type = db.Column(db.String(20), nullable=False)  # isa, depo, nsi, none
+    owner = db.Column(db.String(10), nullable=False)  # a, i, j
+    savings = db.Column(db.String(1), nullable=False)  # y, n
+    bank_name = db.Column(db.String(100), nullable=False)
+
+    interest_rate = db.Column(db.Float, nullable=True)
+    start_date = db.Column(db.Date, nullable=True)
+    end_date = db.Column(db.Date, nullable=True)
+    interest_frequency = db.Column(db.String(20), nullable=True)  # per year or per month
+
+    bank_id = db.Column(db.Integer, db.ForeignKey('banks.id'), nullable=True)
+    bank = db.relationship('Bank', backref=db.backref('accounts', lazy=True))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Account {self.account_name}>"
+
+class Bank(db.Model):
+    __tablename__ = 'banks'
+    __table_args__ = (
+        db.Index('ix_banks_frn', 'frn'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bank_name = db.Column(db.String(100), nullable=False, unique=True)
+    frn = db.Column(db.String(50), nullable=False)  # Financial Reference Number
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Bank {self.bank_name}>"
+
+class TransactionLog(db.Model):
+    __tablename__ = 'transaction_logs'
+    __table_args__ = (
+        db.Index('ix_transaction_logs_timestamp', 'timestamp'),
+        db.Index('ix_transaction_logs_account_timestamp', 'account_id', 'timestamp'),
+        db.Index('ix_transaction_logs_source_timestamp', 'source', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    previous_balance = db.Column(Money, nullable=False)
+    new_balance = db.Column(Money, nullable=False)
+    change_amount = db.Column(Money, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    source = db.Column(db.String(50), nullable=False)  # e.g., "CSV upload", "manual"
+    batch_id = db.Column(db.Integer, db.ForeignKey('upload_batches.id'), nullable=True, index=True)
+
+    account = db.relationship('Account', backref=db.backref('transactions', lazy=True))
+
+    def __repr__(self):
+        return f"<TransactionLog {self.id}>"
+
+class ArchivedTransactionLog(db.Model):
+    __tablename__ = 'transaction_logs_archive'
+    __table_args__ = (
+        db.Index('ix_transaction_logs_archive_timestamp', 'timestamp'),
+        db.Index('ix_transaction_logs_archive_account_timestamp', 'account_id', 'timestamp'),
+    )
+
+    # Logs moved out of transaction_logs by archive.py, keeping their ids.
+    # No foreign keys: archived history outlives the accounts and batches.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    account_id = db.Column(db.Integer, nullable=False)
+    previous_balance = db.Column(Money, nullable=False)
+    new_balance = db.Column(Money, nullable=False)
+    change_amount = db.Column(Money, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=True)
+    source = db.Column(db.String(50), nullable=False)
+    batch_id = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ArchivedTransactionLog {self.id}>"
+
+class MonthlyBalanceSummary(db.Model):
+    __tablename__ = 'monthly_balance_summaries'
+
+    # One row per account per month of archived logs; month is the first
+    # day of the month. Merged into as each compaction batch is archived.
+    account_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    opening_balance = db.Column(Money, nullable=False)
+    closing_balance = db.Column(Money, nullable=False)
+    net_change = db.Column(Money, nullable=False, default=0.0)
+    log_count = db.Column(db.Integer, nullable=False, default=0)
+    first_logged_at = db.Column(db.DateTime, nullable=False)
+    last_logged_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<MonthlyBalanceSummary {self.account_id} {self.month}>"
+
+class UploadBatch(db.Model):
+    __tablename__ = 'upload_batches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    source = db.Column(db.String(50), nullable=False)  # source written on the batch's logs
+
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    not_found = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Integer, nullable=False, default=0)
+    not_found_accounts = db.Column(db.JSON, nullable=True)
+    error_accounts = db.Column(db.JSON, nullable=True)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    peak_rss_mb = db.Column(db.Float, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    transactions = db.relationship('TransactionLog', backref='batch', lazy='dynamic')
+
+    def __repr__(self):
+        return f"<UploadBatch {self.id} {self.filename}>"
+
+class UploadJob(db.Model):
+    __tablename__ = 'upload_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    filename = db.Column(db.String(255), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+    batch_id = db.Column(db.Integer, db.ForeignKey('upload_batches.id'), nullable=True)
+    batch = db.relationship('UploadBatch', backref=db.backref('job', uselist=False))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<UploadJob {self.id} {self.state}>"
+
+class BalanceRollup(db.Model):
+    __tablename__ = 'balance_rollups'
+
+    # One row per (frn, owner, account_type, savings) group; frn is '' for
+    # accounts without a bank. Kept current by rollups.py on every write.
+    frn = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(10), primary_key=True)
+    account_type = db.Column(db.String(20), primary_key=True)
+    savings = db.Column(db.String(1), primary_key=True)
+    account_count = db.Column(db.Integer, nullable=False, default=0)
+    total_balance = db.Column(Money, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<BalanceRollup {self.frn}/{self.owner}/{self.account_type}/{self.savings}>"
+
+class MaturityBucket(db.Model):
+    __tablename__ = 'maturity_calendar'
+
+    # One row per (end_date, frn, owner) for accounts with an end date; frn
+    # is '' for accounts without a bank. Kept current by maturities.py on
+    # every write, so maturity windows never scan accounts.
+    end_date = db.Column(db.Date, primary_key=True)
+    frn = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(10), primary_key=True)
+    account_count = db.Column(db.Integer, nullable=False, default=0)
+    total_balance = db.Column(Money, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<MaturityBucket {self.end_date}/{self.frn}/{self.owner}>"
+
+class BalanceCheckpoint(db.Model):
+    __tablename__ = 'balance_checkpoints'
+
+    # Every account's balance as of taken_at, reconstructed from the logs;
+    # as-of queries start from the nearest one. See asof.py.
+    taken_at = db.Column(db.DateTime, primary_key=True)
+    account_id = db.Column(db.Integer, primary_key=True)
+    balance = db.Column(Money, nullable=False)
+
+    def __repr__(self):
+        return f"<BalanceCheckpoint {self.taken_at} {self.account_id}>"
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+
+    # Single row (id 1) whose version every committed write increments;
+    # ETags and cached responses are keyed by it. See versions.py.
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion {self.version}>"
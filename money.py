@@ -0,0 +1,66 @@
+import math
+import sqlalchemy as sa
+
+# Minor units per pound; money columns store whole pence
+PENCE = 100
+
+def to_pence(amount):
+    """An amount in pounds as whole pence, rounded to the nearest penny."""
+    return int(round(float(amount) * PENCE))
+
+def from_pence(pence):
+    return pence / PENCE
+
+def round_money(amount):
+    """An amount in pounds rounded to whole pence, as the database would store it."""
+    return from_pence(to_pence(amount))
+
+def parse_money(value):
+    """
+    A form or CSV value as pounds rounded to whole pence. Raises ValueError
+    for anything that is not a finite number.
+    """
+    amount = float(value)
+    if not math.isfinite(amount):
+        raise ValueError(f"{value!r} is not an amount of money")
+    return round_money(amount)
+
+def pence_array(amounts):
+    """Amounts in pounds (array or Series) as an int64 array of pence, rounded as to_pence rounds."""
+    import numpy as np
+
+    return np.rint(np.asarray(amounts, dtype=float) * PENCE).astype(np.int64)
+
+def round_money_array(amounts):
+    """Amounts in pounds (array or Series) rounded to whole pence; NaN stays NaN."""
+    import numpy as np
+
+    return np.rint(amounts * PENCE) / PENCE
+
+def format_money(amount):
+    """An amount as the templates show it, e.g. £1234.50."""
+    return "£%.2f" % amount
+
+class Money(sa.types.TypeDecorator):
+    """
+    Money stored exactly as an integer number of pence and handled in
+    Python as float pounds.
+
+    Values are rounded to the penny on the way in, so sums and comparisons
+    in SQL are exact integer arithmetic, and a balance read back is always
+    the nearest float to its two-decimal amount. Arithmetic on Money
+    columns comes back typed as a plain integer; wrap it in
+    sa.type_coerce(..., Money) to read the result as pounds.
+    """
+    impl = sa.BigInteger
+    cache_ok = True
+
+    @property
+    def python_type(self):
+        return float
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_pence(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_pence(value)
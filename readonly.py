@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.orm import Session
+
+_engine_lock = threading.Lock()
+
+def get_read_engine(app):
+    """
+    Return the app's shared read-only engine, creating it on first use.
+
+    The pool is sized from READ_POOL_SIZE / READ_POOL_MAX_OVERFLOW and
+    checks connections with READ_POOL_PRE_PING. On SQLite, connections are
+    opened query_only and every checkout runs inside an explicit BEGIN, so a
+    request sees one consistent snapshot of everything committed before its
+    first read.
+    """
+    engine = app.extensions.get('read_engine')
+    if engine is not None:
+        return engine
+
+    with _engine_lock:
+        engine = app.extensions.get('read_engine')
+        if engine is None:
+            engine = _create_read_engine(app.config)
+            app.extensions['read_engine'] = engine
+    return engine
+
+def _create_read_engine(config):
+    url = sa.engine.make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {
+        'poolclass': sa.pool.QueuePool,
+        'pool_size': config['READ_POOL_SIZE'],
+        'max_overflow': config['READ_POOL_MAX_OVERFLOW'],
+        'pool_pre_ping': config['READ_POOL_PRE_PING'],
+        'pool_recycle': config['READ_POOL_RECYCLE'],
+    }
+
+    if url.get_backend_name() != 'sqlite':
+        return sa.create_engine(url, isolation_level='REPEATABLE READ', **options)
+
+    engine = sa.create_engine(url, connect_args={'check_same_thread': False}, **options)
+
+    @sa.event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy issue BEGIN itself instead of pysqlite's implicit
+        # transactions, which never start one for plain SELECTs.
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute('PRAGMA query_only = ON')
+
+    @sa.event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+    return engine
+
+@contextmanager
+def read_connection():
+    """Yield a pooled read-only connection inside a fresh read transaction."""
+    with get_read_engine(current_app).connect() as conn:
+        with conn.begin():
+            yield conn
+
+@contextmanager
+def read_session():
+    """Yield an ORM session bound to a read_connection()."""
+    with read_connection() as conn:
+        with Session(bind=conn) as session:
+            yield session
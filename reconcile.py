@@ -0,0 +1,453 @@
+import csv
+import logging
+import os
+import resource
+from datetime import datetime
+import sqlalchemy as sa
+from models import db, Account, Bank, TransactionLog
+from money import from_pence, parse_money, pence_array, round_money, round_money_array, to_pence
+from maturities import MATURITY_COLUMNS, apply_maturity_deltas
+from rollups import GROUP_COLUMNS, MAINTAINED, NO_FRN, apply_deltas
+from logconfig import sampled
+
+# SQLite limits the number of bound parameters per statement, so account
+# lookups are split into IN-lists of at most this many values.
+LOOKUP_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['Account', 'bal']
+
+# Read both columns as text: left to guess, pandas types each chunk on its
+# own, so an account number like 007 would become 7 in a chunk that happens
+# to be all digits. Balances are parsed with parse_money.
+CSV_DTYPES = {'Account': str, 'bal': str}
+
+# What a bulk reconciliation reads of each account besides its identity, and
+# re-checks before writing: its balance, rollup group and maturity day
+ACCOUNT_STATE_COLUMNS = ('balance', 'frn') + GROUP_COLUMNS + ('end_date',)
+
+# Recorded for a row whose account is stored without a balance to reconcile from
+NO_BALANCE_ERROR = "Account has no stored balance"
+
+class CSVFormatError(ValueError):
+    """Raised when an uploaded CSV is missing the required columns."""
+
+def new_results():
+    """Return an empty results dict in the shape the upload report expects."""
+    return {
+        'updated': 0,
+        'error': 0,
+        'not_found': 0,
+        'not_found_accounts': [],
+        'error_accounts': [],
+        'snapshots': []
+    }
+
+def reconcile_rows(df, results=None, source="CSV upload", batch_id=None):
+    """
+    Apply balance updates one row at a time.
+
+    Each row looks up its account and adds a TransactionLog through the ORM.
+    Kept as the reference implementation for reconcile_bulk; the caller
+    commits the session.
+    """
+    if results is None:
+        results = new_results()
+
+    for _, row in df.iterrows():
+        account_number = str(row['Account']).strip()
+        try:
+            new_balance = parse_money(row['bal'])
+            account = Account.query.filter_by(account_number=account_number).first()
+
+            if account:
+                if account.balance is None:
+                    raise ValueError(NO_BALANCE_ERROR)
+
+                # Create snapshot
+                snapshot = {
+                    'account_number': account_number,
+                    'account_name': account.account_name,
+                    'bank_name': account.bank_name,
+                    'previous_balance': account.balance,
+                    'new_balance': new_balance,
+                    'change': round_money(new_balance - account.balance)
+                }
+                results['snapshots'].append(snapshot)
+
+                # Log the transaction
+                log = TransactionLog(
+                    account_id=account.id,
+                    previous_balance=account.balance,
+                    new_balance=new_balance,
+                    change_amount=round_money(new_balance - account.balance),
+                    source=source,
+                    batch_id=batch_id
+                )
+                db.session.add(log)
+
+                # Update the account balance
+                account.balance = new_balance
+                account.updated_at = datetime.utcnow()
+
+                results['updated'] += 1
+                if sampled(logger):
+                    logger.debug("Updated account %s: balance %s -> %s", account_number, snapshot['previous_balance'],
+                                 new_balance)
+            else:
+                results['not_found'] += 1
+                results['not_found_accounts'].append(account_number)
+                if sampled(logger):
+                    logger.debug("Account not found: %s", account_number)
+        except Exception as e:
+            error_info = {'account': account_number, 'error': str(e)}
+            results['error_accounts'].append(error_info)
+            results['error'] += 1
+            if sampled(logger, logging.ERROR):
+                logger.error("Error processing account %s: %s", account_number, e)
+
+    return results
+
+def _parse_balances(values):
+    """
+    Convert the 'bal' column to pounds rounded to whole pence column-wise.
+
+    Returns (balances, errors) where errors maps row labels to the message
+    parse_money() would have raised, so results match reconcile_rows exactly.
+    """
+    import numpy as np
+    import pandas as pd
+
+    balances = pd.to_numeric(values, errors='coerce').astype(float)
+    errors = {}
+
+    # to_numeric is stricter than float() on a few inputs, and blanks and
+    # infinities are not amounts; retry only the rows it could not convert
+    # to a finite number so the slow path is proportional to the bad rows.
+    for label in values.index[~np.isfinite(balances)]:
+        try:
+            balances.at[label] = parse_money(values.at[label])
+        except Exception as e:
+            errors[label] = str(e)
+
+    # Round to the penny as parse_money does, leaving failed rows NaN
+    return round_money_array(balances), errors
+
+def _lookup_accounts(account_numbers):
+    """
+    Fetch id, name, bank, balance, rollup group and end date for the given
+    account numbers in batched IN-lookups.
+    """
+    import pandas as pd
+
+    columns = [Account.id, Account.account_number, Account.account_name, Account.bank_name, Account.balance,
+               Account.owner, Account.account_type, Account.savings, Account.end_date, Bank.frn]
+    names = [c.key for c in columns]
+    frames = []
+    for start in range(0, len(account_numbers), LOOKUP_BATCH_SIZE):
+        batch = account_numbers[start:start + LOOKUP_BATCH_SIZE]
+        rows = db.session.execute(
+            sa.select(*columns).outerjoin(Bank, Bank.id == Account.bank_id)
+            .where(Account.account_number.in_(batch))
+        ).all()
+        frames.append(pd.DataFrame(rows, columns=names))
+
+    if not frames:
+        return pd.DataFrame(columns=names)
+    accounts = pd.concat(frames, ignore_index=True)
+    accounts['frn'] = accounts['frn'].fillna(NO_FRN)
+    return accounts
+
+# Columns of a bulk plan's log rows that go into the upload snapshots
+SNAPSHOT_COLUMNS = ['account_number', 'account_name', 'bank_name', 'previous_balance', 'new_balance', 'change']
+
+def reconcile_bulk(df, results=None, source="CSV upload", batch_id=None):
+    """
+    Apply balance updates set-wise: prepare_bulk then apply_bulk in the
+    same session. Results match reconcile_rows, including repeated account
+    numbers within a file; the caller commits the session.
+    """
+    if results is None:
+        results = new_results()
+    plan = prepare_bulk(df, results)
+    if plan is not None:
+        apply_bulk(plan, results, source, batch_id)
+    return results
+
+def prepare_bulk(df, results):
+    """
+    The read-only half of a bulk reconciliation, which can run outside the
+    write transaction.
+
+    Balances are parsed column-wise and accounts resolved with batched
+    IN-lookups; rows that fail to parse or name no account are recorded in
+    results. Returns a plan for apply_bulk, or None when no row updates an
+    account: the log rows with their before/after balances chained per
+    account, each account's final balance, and the rollup and maturity
+    calendar deltas in pence, all worked out from the balances as they
+    were read here.
+    """
+    import pandas as pd
+
+    if df.empty:
+        return None
+
+    rows = pd.DataFrame({
+        'account_number': df['Account'].astype(str).str.strip().to_numpy(),
+        'raw_balance': df['bal'].to_numpy(),
+    })
+    rows['new_balance'], parse_errors = _parse_balances(rows['raw_balance'])
+
+    accounts = _lookup_accounts(rows['account_number'].drop_duplicates().tolist())
+    rows = rows.reset_index().merge(accounts, on='account_number', how='left').set_index('index').sort_index()
+
+    # Rows for the same account chain: each one starts from the balance the
+    # previous row left behind, exactly as the row-by-row path does.
+    found = rows['id'].notna() & ~rows.index.isin(list(parse_errors))
+
+    # An account stored without a balance cannot be reconciled.
+    null_balance = found & rows['balance'].isna()
+    for label in rows.index[null_balance]:
+        parse_errors[label] = NO_BALANCE_ERROR
+    found &= ~null_balance
+
+    grouped = rows.loc[found].groupby('id')
+    previous = grouped['new_balance'].shift(1)
+    first = grouped.cumcount() == 0
+    previous[first] = rows.loc[found].loc[first, 'balance']
+    rows['previous_balance'] = previous
+    rows['change'] = round_money_array(rows['new_balance'] - rows['previous_balance'])
+
+    for label, row in rows.loc[~found].iterrows():
+        if label in parse_errors:
+            results['error_accounts'].append({'account': row['account_number'], 'error': parse_errors[label]})
+            results['error'] += 1
+            if sampled(logger, logging.ERROR):
+                logger.error("Error processing account %s: %s", row['account_number'], parse_errors[label])
+        else:
+            results['not_found'] += 1
+            results['not_found_accounts'].append(row['account_number'])
+
+    updated = rows.loc[found]
+    if updated.empty:
+        return None
+
+    updated = updated.assign(account_id=updated['id'].astype(int), position=range(len(updated)))
+    final = updated.drop_duplicates('account_id', keep='last')
+    first = updated.drop_duplicates('account_id', keep='first')
+
+    # Move each rollup group's balance by the net change of its accounts,
+    # summed exactly in pence, and each maturity calendar day's likewise
+    final = final.assign(net_pence=pence_array(final['new_balance']) - pence_array(final['balance']))
+    rollup_deltas = final.groupby([final[column] for column in ('frn',) + GROUP_COLUMNS])['net_pence'].sum()
+    dated = final[final['end_date'].notna()]
+    maturity_deltas = dated.groupby([dated[column] for column in ('frn',) + MATURITY_COLUMNS])['net_pence'].sum()
+
+    return {
+        'rows': updated[['account_id'] + SNAPSHOT_COLUMNS].to_dict('records'),
+        'final_balances': dict(zip(final['account_id'].tolist(), final['new_balance'].tolist())),
+        'first_rows': dict(zip(first['account_id'].tolist(), first['position'].tolist())),
+        'states': {
+            account_id: _account_state(state)
+            for account_id, *state in zip(final['account_id'].tolist(),
+                                          *(final[column].tolist() for column in ACCOUNT_STATE_COLUMNS))
+        },
+        'rollup_deltas': {key: int(change) for key, change in rollup_deltas.items()},
+        'maturity_deltas': {key: int(change) for key, change in maturity_deltas.items()},
+    }
+
+def apply_bulk(plan, results, source="CSV upload", batch_id=None):
+    """
+    Write a prepare_bulk plan: one bulk INSERT of the log rows, one bulk
+    UPDATE of the balances and the rollup and maturity calendar upserts.
+
+    Run inside the write transaction. Each account's balance, rollup group
+    and maturity day are read again first, and an account that changed
+    since the plan was made is re-chained from its current state: its
+    first log row starts from the current balance and its deltas move from
+    its current groups. Rows for an account deleted or left without a
+    balance in between are recorded in results like the plan's own.
+    """
+    rows = plan['rows']
+    rollup_deltas = dict(plan['rollup_deltas'])
+    maturity_deltas = dict(plan['maturity_deltas'])
+
+    current = _current_states(list(plan['states']))
+    dropped = {}
+    for account_id, planned in plan['states'].items():
+        state = current.get(account_id)
+        if state == planned:
+            continue
+
+        final_pence = to_pence(plan['final_balances'][account_id])
+        _add_deltas(rollup_deltas, maturity_deltas, planned, -(final_pence - to_pence(planned[0])))
+        if state is None or state[0] is None:
+            # Deleted, or its balance cleared, since the plan was made
+            dropped[account_id] = state is not None
+            continue
+        _add_deltas(rollup_deltas, maturity_deltas, state, final_pence - to_pence(state[0]))
+
+        first = rows[plan['first_rows'][account_id]]
+        first['previous_balance'] = state[0]
+        first['change'] = round_money(first['new_balance'] - state[0])
+
+    if dropped:
+        for row in rows:
+            if row['account_id'] not in dropped:
+                continue
+            if dropped[row['account_id']]:
+                results['error_accounts'].append({'account': row['account_number'], 'error': NO_BALANCE_ERROR})
+                results['error'] += 1
+            else:
+                results['not_found'] += 1
+                results['not_found_accounts'].append(row['account_number'])
+        rows = [row for row in rows if row['account_id'] not in dropped]
+        if not rows:
+            return results
+
+    now = datetime.utcnow()
+    db.session.execute(sa.insert(TransactionLog), [
+        {
+            'account_id': row['account_id'],
+            'previous_balance': row['previous_balance'],
+            'new_balance': row['new_balance'],
+            'change_amount': row['change'],
+            'timestamp': now,
+            'source': source,
+            'batch_id': batch_id
+        }
+        for row in rows
+    ])
+
+    db.session.execute(sa.update(Account), [
+        {'id': account_id, 'balance': balance, 'updated_at': now}
+        for account_id, balance in plan['final_balances'].items() if account_id not in dropped
+    ], execution_options={MAINTAINED: True})
+
+    conn = db.session.connection()
+    apply_deltas(conn, {key: (0, from_pence(change)) for key, change in rollup_deltas.items()})
+    apply_maturity_deltas(conn, {key: (0, from_pence(change)) for key, change in maturity_deltas.items()})
+
+    results['snapshots'].extend({column: row[column] for column in SNAPSHOT_COLUMNS} for row in rows)
+    results['updated'] += len(rows)
+    logger.debug("Bulk reconciled %d rows across %d accounts", len(rows), len(plan['final_balances']) - len(dropped))
+
+    return results
+
+def _account_state(values):
+    """An account's ACCOUNT_STATE_COLUMNS values as a tuple, with a missing end date as None."""
+    *values, end_date = values
+    if end_date is not None and end_date != end_date:
+        # NaN from the lookup's merge
+        end_date = None
+    return tuple(values) + (end_date,)
+
+def _current_states(account_ids):
+    """The ACCOUNT_STATE_COLUMNS of the given accounts as they are now, by id; deleted ones are left out."""
+    columns = [getattr(Account, column) for column in ACCOUNT_STATE_COLUMNS if column != 'frn']
+    columns.insert(ACCOUNT_STATE_COLUMNS.index('frn'), sa.func.coalesce(Bank.frn, NO_FRN))
+    states = {}
+    for start in range(0, len(account_ids), LOOKUP_BATCH_SIZE):
+        batch = account_ids[start:start + LOOKUP_BATCH_SIZE]
+        for account_id, *state in db.session.execute(
+            sa.select(Account.id, *columns).outerjoin(Bank, Bank.id == Account.bank_id)
+            .where(Account.id.in_(batch))
+        ):
+            states[account_id] = tuple(state)
+    return states
+
+def _add_deltas(rollup_deltas, maturity_deltas, state, pence):
+    """Add pence to the rollup group and maturity calendar day of an account in state."""
+    balance, frn, owner, account_type, savings, end_date = state
+    key = (frn, owner, account_type, savings)
+    rollup_deltas[key] = rollup_deltas.get(key, 0) + pence
+    if end_date is not None:
+        key = (frn, end_date, owner)
+        maturity_deltas[key] = maturity_deltas.get(key, 0) + pence
+
+def _rss_bytes():
+    """Current resident set size of this process, in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # No procfs (e.g. macOS): fall back to the process high-water mark.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def check_csv_header(path):
+    """Raise CSVFormatError unless the CSV file at path has the required columns."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), [])
+    if not all(col in header for col in REQUIRED_COLUMNS):
+        raise CSVFormatError("CSV must contain 'Account' and 'bal' columns")
+
+def ingest_csv(stream, chunk_size, mode='bulk', source="CSV upload", batch_id=None,
+               snapshot_limit=None, on_chunk=None, writer=None):
+    """
+    Reconcile a CSV upload chunk by chunk.
+
+    The stream is parsed chunk_size rows at a time and each chunk is
+    reconciled and flushed before the next one is read, so peak memory
+    depends on the chunk size rather than the file size. Logs are tagged
+    with batch_id, and at most snapshot_limit snapshots are kept in the
+    results (pass 0 when the batch's logs are the snapshot record).
+    on_chunk(results), if given, is called after each chunk is flushed.
+
+    writer(fn, *args), if given, runs each chunk's writes, flush and
+    on_chunk as one write (writes.run_write commits it with whatever else
+    is queued); otherwise the caller commits the session. In bulk mode only
+    apply_bulk goes to the writer: the parsing and account lookups of
+    prepare_bulk run here, so other writes are not held up behind them.
+    """
+    import pandas as pd
+
+    results = new_results()
+    results['rows_processed'] = 0
+    peak_rss = _rss_bytes()
+
+    if mode == 'row':
+        def prepare(chunk):
+            return chunk
+
+        def apply(chunk):
+            reconcile_rows(chunk, results, source, batch_id)
+    else:
+        def prepare(chunk):
+            return prepare_bulk(chunk, results)
+
+        def apply(plan):
+            if plan is not None:
+                apply_bulk(plan, results, source, batch_id)
+
+    def write_chunk(prepared, rows):
+        apply(prepared)
+        db.session.flush()
+        results['rows_processed'] += rows
+
+        if snapshot_limit is not None and len(results['snapshots']) > snapshot_limit:
+            del results['snapshots'][snapshot_limit:]
+            results['snapshots_truncated'] = True
+
+        results['peak_rss_mb'] = round(max(peak_rss, _rss_bytes()) / (1024 * 1024), 1)
+        logger.debug("Reconciled %d rows so far", results['rows_processed'])
+        if on_chunk is not None:
+            on_chunk(results)
+
+    with pd.read_csv(stream, chunksize=chunk_size, dtype=CSV_DTYPES) as reader:
+        for chunk in reader:
+            if not all(col in chunk.columns for col in REQUIRED_COLUMNS):
+                raise CSVFormatError("CSV must contain 'Account' and 'bal' columns")
+
+            prepared = prepare(chunk)
+            if writer is None:
+                write_chunk(prepared, len(chunk))
+            else:
+                # End this thread's read transaction, so the next chunk's
+                # lookups see what the writer has committed since
+                db.session.rollback()
+                writer(write_chunk, prepared, len(chunk))
+            peak_rss = max(peak_rss, _rss_bytes())
+
+    results['peak_rss_mb'] = round(peak_rss / (1024 * 1024), 1)
+    return results
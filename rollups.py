@@ -0,0 +1,251 @@
+from collections import defaultdict
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, attributes
+from models import Account, Bank, BalanceRollup
+
+# frn recorded for accounts that have no bank
+NO_FRN = ''
+
+# Account columns that decide which rollup group an account belongs to
+GROUP_COLUMNS = ('owner', 'account_type', 'savings')
+
+# ORM statements run with this execution option have already applied
+# their deltas to the rollup and maturity tables; any other bulk write
+# marks them stale.
+MAINTAINED = 'rollups_maintained'
+
+def grouped_totals(conn, *columns):
+    """
+    Account counts and balance totals from the rollup table, grouped by the
+    given rollup columns and ordered by them. Grouping by frn leaves out
+    accounts without a bank, as the banks join in the reports always has.
+    """
+    group = [getattr(BalanceRollup, column) for column in columns]
+    stmt = sa.select(
+        *group,
+        sa.func.sum(BalanceRollup.account_count).label('account_count'),
+        sa.func.sum(BalanceRollup.total_balance).label('total_balance')
+    ).group_by(*group).order_by(*group)
+    if 'frn' in columns:
+        stmt = stmt.where(BalanceRollup.frn != NO_FRN)
+    return conn.execute(stmt).all()
+
+def _aggregate_select():
+    """Rollup rows computed from scratch: one per group over accounts left-joined to banks."""
+    frn = sa.func.coalesce(Bank.frn, NO_FRN)
+    return sa.select(
+        frn.label('frn'),
+        Account.owner,
+        Account.account_type,
+        Account.savings,
+        sa.func.count(Account.id).label('account_count'),
+        sa.func.coalesce(sa.func.sum(Account.balance), 0.0).label('total_balance')
+    ).select_from(Account).outerjoin(Bank, Bank.id == Account.bank_id).group_by(
+        frn, Account.owner, Account.account_type, Account.savings
+    )
+
+def rebuild_rollups(conn):
+    """Replace the rollup table's contents with a full recomputation."""
+    conn.execute(sa.delete(BalanceRollup))
+    conn.execute(sa.insert(BalanceRollup).from_select(
+        ['frn', 'owner', 'account_type', 'savings', 'account_count', 'total_balance'],
+        _aggregate_select()
+    ))
+
+def check_rollups(conn, tolerance=0.005):
+    """
+    Compare the rollup table with a full recomputation.
+
+    Returns a list of (key, stored, expected) for every group whose count
+    differs or whose balance is off by more than tolerance.
+    """
+    stored = {
+        (r.frn, r.owner, r.account_type, r.savings): (r.account_count, r.total_balance)
+        for r in conn.execute(sa.select(BalanceRollup))
+    }
+    expected = {
+        (r.frn, r.owner, r.account_type, r.savings): (r.account_count, r.total_balance)
+        for r in conn.execute(_aggregate_select())
+    }
+    return compare_totals(stored, expected, tolerance)
+
+def compare_totals(stored, expected, tolerance=0.005):
+    """
+    Diff two {key: (account_count, total_balance)} maps, returning (key,
+    stored, expected) for every key whose count or balance differs.
+    """
+    drift = []
+    for key in sorted(set(stored) | set(expected)):
+        have = stored.get(key, (0, 0.0))
+        want = expected.get(key, (0, 0.0))
+        if have[0] != want[0] or abs(have[1] - want[1]) > tolerance:
+            drift.append((key, have, want))
+    return drift
+
+def apply_deltas(conn, deltas):
+    """
+    Add {(frn, owner, account_type, savings): (count_delta, balance_delta)}
+    to the rollup table with one upsert, dropping groups left empty.
+    """
+    upsert_deltas(conn, BalanceRollup, ('frn',) + GROUP_COLUMNS, deltas)
+
+def upsert_deltas(conn, model, key_names, deltas):
+    """
+    Add {key: (count_delta, balance_delta)} to a table of account_count and
+    total_balance keyed on key_names with one upsert, dropping rows left
+    empty.
+    """
+    params = [
+        dict(zip(key_names, key), account_count=count, total_balance=balance)
+        for key, (count, balance) in deltas.items()
+        if count or balance
+    ]
+    if not params:
+        return
+
+    dialect = sqlite if conn.dialect.name == 'sqlite' else postgresql
+    stmt = dialect.insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_names),
+        set_={
+            'account_count': model.account_count + stmt.excluded.account_count,
+            'total_balance': model.total_balance + stmt.excluded.total_balance,
+        }
+    )
+    conn.execute(stmt, params)
+    conn.execute(sa.delete(model).where(model.account_count <= 0))
+
+def _value(obj, key, original):
+    """An attribute's current value, or its value as loaded from the database."""
+    if not original:
+        return getattr(obj, key)
+    history = attributes.get_history(obj, key)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, key)
+
+def _account_key(obj, frns, columns, original=False):
+    bank_id = _value(obj, 'bank_id', original)
+    if not original and bank_id is None and obj.bank is not None:
+        frn = obj.bank.frn
+    else:
+        frn = frns.get(bank_id, NO_FRN)
+    return (frn,) + tuple(_value(obj, key, original) for key in columns)
+
+def _balance(value):
+    return value or 0.0
+
+def collect_deltas(session, columns=GROUP_COLUMNS):
+    """
+    Work out the rollup deltas for the Account and Bank changes pending in a
+    session, before they are flushed, keyed on (frn,) plus the given account
+    columns.
+    """
+    accounts_new = [o for o in session.new if isinstance(o, Account)]
+    accounts_deleted = [o for o in session.deleted if isinstance(o, Account)]
+    accounts_dirty = [o for o in session.dirty if isinstance(o, Account) and session.is_modified(o)]
+    banks_dirty = [o for o in session.dirty if isinstance(o, Bank)
+                   and attributes.get_history(o, 'frn').has_changes() and o.id is not None]
+
+    bank_ids = set()
+    for obj in accounts_new + accounts_dirty:
+        bank_ids.add(obj.bank_id)
+    for obj in accounts_deleted + accounts_dirty:
+        bank_ids.add(_value(obj, 'bank_id', True))
+    bank_ids.discard(None)
+
+    frns = {}
+    if bank_ids:
+        frns = dict(session.connection().execute(
+            sa.select(Bank.id, Bank.frn).where(Bank.id.in_(bank_ids))
+        ).all())
+    # A bank whose frn changes in this flush: accounts moving onto it land on
+    # the new frn, accounts leaving it come off the old one.
+    old_frns = dict(frns)
+    for bank in banks_dirty:
+        frns[bank.id] = bank.frn
+        old_frns[bank.id] = _value(bank, 'frn', True)
+
+    deltas = defaultdict(lambda: [0, 0.0])
+
+    def add(key, count, balance):
+        deltas[key][0] += count
+        deltas[key][1] += balance
+
+    for obj in accounts_new:
+        add(_account_key(obj, frns, columns), 1, _balance(obj.balance))
+    for obj in accounts_deleted:
+        add(_account_key(obj, old_frns, columns, original=True), -1, -_balance(_value(obj, 'balance', True)))
+    for obj in accounts_dirty:
+        add(_account_key(obj, old_frns, columns, original=True), -1, -_balance(_value(obj, 'balance', True)))
+        add(_account_key(obj, frns, columns), 1, _balance(obj.balance))
+
+    # Accounts untouched in this flush whose bank changes frn move groups
+    dirty_ids = {obj.id for obj in accounts_dirty + accounts_deleted}
+    for bank in banks_dirty:
+        rows = session.connection().execute(
+            sa.select(Account.id, Account.balance, *[getattr(Account, column) for column in columns])
+            .where(Account.bank_id == bank.id)
+        ).all()
+        for row in rows:
+            if row.id in dirty_ids:
+                continue
+            group = tuple(row[2:])
+            add((old_frns[bank.id],) + group, -1, -_balance(row.balance))
+            add((frns[bank.id],) + group, 1, _balance(row.balance))
+
+    return {key: tuple(value) for key, value in deltas.items()}
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+# Load the old value whenever a grouping attribute is set, even if it was
+# expired, so collect_deltas always knows which group an account left.
+for _attr in (Account.balance, Account.bank_id, Account.owner, Account.account_type, Account.savings,
+              Account.end_date, Bank.frn):
+    sa.event.listen(_attr, 'set', _keep_old_value, active_history=True, retval=True)
+
+@sa.event.listens_for(Session, 'before_flush')
+def _maintain_rollups(session, flush_context, instances):
+    deltas = collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+# session.info flags that bulk writes to accounts or banks set; see
+# mark_stale_on_bulk_writes
+_STALE_FLAGS = []
+
+def mark_stale_on_bulk_writes(flag):
+    """
+    Have bulk UPDATE/DELETE/INSERT statements on accounts or banks set
+    session.info[flag], unless the caller applied the deltas itself (the
+    MAINTAINED option), for a derived table to rebuild before commit.
+    """
+    _STALE_FLAGS.append(flag)
+
+@sa.event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_writes(orm_execute_state):
+    # Bulk statements skip the flush, so the before_flush deltas miss them
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    if orm_execute_state.execution_options.get(MAINTAINED):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Account, Bank):
+        for flag in _STALE_FLAGS:
+            orm_execute_state.session.info[flag] = True
+
+mark_stale_on_bulk_writes('rollups_stale')
+
+@sa.event.listens_for(Session, 'before_commit')
+def _rebuild_stale_rollups(session):
+    if session.info.pop('rollups_stale', False):
+        session.flush()
+        rebuild_rollups(session.connection())
+
+@sa.event.listens_for(Session, 'after_rollback')
+def _forget_stale_rollups(session):
+    session.info.pop('rollups_stale', None)
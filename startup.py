@@ -0,0 +1,78 @@
+import importlib
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules slow enough to import that the app only imports them on the code
+# paths that use them (uploads, projections, as-of balances, snapshots), so
+# workers and CLI commands start without paying for them
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow')
+
+_TIMED_IMPORT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps([elapsed, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+def _run_import(directory, module, *options):
+    result = subprocess.run(
+        [sys.executable, *options, '-c', _TIMED_IMPORT.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=directory, capture_output=True, text=True, check=True
+    )
+    seconds, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return seconds, heavy, result.stderr
+
+def time_import(directory, module='main', runs=5, best=False):
+    """
+    Import module in runs fresh interpreters started in directory. Returns
+    (median seconds, heavy modules the import loaded); best returns the
+    fastest run instead, which a busy machine can only slow down.
+    """
+    timings = []
+    heavy = []
+    for _ in range(runs):
+        seconds, heavy, _ = _run_import(directory, module)
+        timings.append(seconds)
+    return (min(timings) if best else statistics.median(timings)), heavy
+
+def import_report(directory, module='main'):
+    """
+    Import module in a fresh interpreter under -X importtime. Returns
+    (seconds, heavy modules loaded, imports) where imports lists module and
+    everything importing it pulled in as (depth, name, self seconds,
+    cumulative seconds), in the order the interpreter reported them.
+    """
+    seconds, heavy, stderr = _run_import(directory, module, '-X', 'importtime')
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # The column headings
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((depth, name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+
+    # Each import is reported after the ones it triggered, so module's are
+    # those between the previous top-level import and module itself
+    end = max(i for i, entry in enumerate(imports) if entry[:2] == (0, module))
+    start = max((i for i, entry in enumerate(imports[:end]) if entry[0] == 0), default=-1) + 1
+    return seconds, heavy, imports[start:end + 1]
+
+def preload_heavy_modules():
+    """
+    Import the HEAVY_MODULES that are installed, for a gunicorn master to
+    share with the workers it forks. Returns the names imported.
+    """
+    loaded = []
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        loaded.append(name)
+    return loaded
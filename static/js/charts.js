@@ -223,6 +223,62 @@ function createFrnChart(data) {
     });
 }
 
+// How often the dashboard refreshes itself, in milliseconds
+const DASHBOARD_REFRESH_INTERVAL = 60000;
+
+/**
+ * Refresh the dashboard cards and recent transactions from the API.
+ * Unchanged data is answered with a 304 and served from the browser cache.
+ */
+function loadDashboardData() {
+    fetch('/api/dashboard')
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            document.getElementById('dashboard-account-count').textContent = data.account_count;
+            document.getElementById('dashboard-total-balance').textContent = '£' + data.total_balance.toFixed(2);
+            document.getElementById('dashboard-maturing-soon').textContent = data.maturing_soon;
+            updateRecentTransactions(data.latest_transactions);
+        })
+        .catch(error => {
+            console.error('Error loading dashboard data:', error);
+        });
+}
+
+/**
+ * Replace the rows of the recent transactions table
+ * @param {Array} transactions - The latest transactions, newest first
+ */
+function updateRecentTransactions(transactions) {
+    const tbody = document.getElementById('recent-transactions-body');
+    if (!tbody) return;
+
+    tbody.innerHTML = '';
+    if (transactions.length === 0) {
+        const row = tbody.insertRow();
+        const cell = row.insertCell();
+        cell.colSpan = 6;
+        cell.className = 'text-center';
+        cell.textContent = 'No transactions yet';
+        return;
+    }
+
+    transactions.forEach(transaction => {
+        const row = tbody.insertRow();
+        const change = transaction.change_amount;
+        row.insertCell().textContent = transaction.account_name;
+        row.insertCell().textContent = '£' + transaction.previous_balance.toFixed(2);
+        row.insertCell().textContent = '£' + transaction.new_balance.toFixed(2);
+        const changeCell = row.insertCell();
+        changeCell.className = change > 0 ? 'text-success' : (change < 0 ? 'text-danger' : '');
+        changeCell.textContent = (change > 0 ? '+' : '') + '£' + change.toFixed(2);
+        row.insertCell().textContent = transaction.timestamp ? transaction.timestamp.slice(0, 16).replace('T', ' ') : '';
+        row.insertCell().textContent = transaction.source;
+    });
+}
+
 // Initialize charts when DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
     // Check if we're on a page with charts
@@ -230,6 +286,12 @@ document.addEventListener('DOMContentLoaded', function() {
         // If we're on the dashboard, initialize charts right away
         if (window.location.pathname === '/' || window.location.pathname === '') {
             loadChartData();
+
+            // Keep the figures current without reloading the page
+            setInterval(function() {
+                loadDashboardData();
+                loadChartData();
+            }, DASHBOARD_REFRESH_INTERVAL);
         }
     }
 });
@@ -0,0 +1,238 @@
+import csv
+import random
+from datetime import date, datetime
+import sqlalchemy as sa
+from models import Account, Bank, TransactionLog
+from maturities import rebuild_maturities
+from money import PENCE
+from rollups import rebuild_rollups
+from versions import bump_version
+
+# Named dataset sizes: (banks, accounts, logs per account)
+SCALES = {
+    '1k': (20, 1000, 10),
+    '100k': (200, 100000, 5),
+    '1m': (1000, 1000000, 2),
+}
+
+# Rows inserted per transaction when loading
+INSERT_BATCH_SIZE = 500000
+
+# Accounts generated together from one random stream; fixed so the same
+# seed generates the same rows whatever the batch size
+GENERATE_CHUNK = 10000
+
+ACCOUNT_TYPES = ('isa', 'depo', 'nsi', 'none')
+OWNERS = ('a', 'i', 'j')
+FREQUENCIES = (None, 'per_year', 'per_month')
+
+# Bind markers by DB-API paramstyle
+_MARKERS = {'qmark': '?', 'format': '%s', 'numeric': ':{n}', 'named': ':{name}', 'pyformat': '%({name})s'}
+
+def synthetic_banks(count, now):
+    """count banks, named and numbered by position."""
+    return [
+        {'bank_name': f"Bank {i:05d}", 'frn': f"FRN{i:06d}", 'created_at': now}
+        for i in range(count)
+    ]
+
+def account_number(index):
+    return f"SYN{index:08d}"
+
+def _dates(base, days_back):
+    import numpy as np
+
+    return np.datetime_as_string(np.datetime64(base, 'D') - days_back.astype('timedelta64[D]'))
+
+def _timestamps(base, seconds_back):
+    import numpy as np
+
+    stamps = np.datetime64(base, 'us') - (seconds_back * 1000000).astype('timedelta64[us]')
+    # The text SQLAlchemy stores SQLite DATETIMEs as, which other
+    # databases also accept
+    return np.char.replace(np.datetime_as_string(stamps, unit='us'), 'T', ' ')
+
+def generate_chunk(seed, start, stop, bank_ids, logs_per_account, today, now):
+    """
+    Accounts start..stop and their logs as column lists of stored values
+    (money in pence, dates and times as text), generated in one vectorized
+    pass from a random stream seeded by seed and start.
+
+    Each account's logs chain from an earlier balance to its current one,
+    a day to two months apart, ending within the last 30 days. Returns
+    (accounts, logs), logs being logs_per_account per account in order.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng([seed, start])
+    n = stop - start
+    index = np.arange(start, stop)
+
+    balance = rng.integers(0, 100000 * PENCE, n)
+    has_rate = rng.random(n) < 0.7
+    rate = np.round(rng.uniform(0.5, 6.0, n), 2)
+    frequency = rng.integers(0, len(FREQUENCIES), n)
+    start_days = rng.integers(0, 1501, n)
+    term = rng.integers(90, 3651, n)
+    has_start = rng.random(n) < 0.8
+    has_end = rng.random(n) < 0.6
+    start_dates = _dates(today, start_days)
+    end_dates = _dates(today, start_days - term)
+    stamp = _timestamps(now, np.zeros(1))[0]
+
+    accounts = {
+        'account_name': [f"Account {i:07d}" for i in index.tolist()],
+        'account_number': [account_number(i) for i in index.tolist()],
+        'balance': balance.tolist(),
+        'account_type': np.array(ACCOUNT_TYPES)[rng.integers(0, len(ACCOUNT_TYPES), n)].tolist(),
+        'owner': np.array(OWNERS)[rng.integers(0, len(OWNERS), n)].tolist(),
+        'savings': np.array(['y', 'n'])[rng.integers(0, 2, n)].tolist(),
+        'bank_name': [f"Bank {b:05d}" for b in (index % len(bank_ids)).tolist()],
+        'bank_id': np.array(bank_ids)[index % len(bank_ids)].tolist(),
+        'interest_rate': [r if has else None for r, has in zip(rate.tolist(), has_rate.tolist())],
+        'interest_frequency': [FREQUENCIES[f] if has else None for f, has in zip(frequency.tolist(), has_rate.tolist())],
+        'start_date': [d if has else None for d, has in zip(start_dates.tolist(), has_start.tolist())],
+        'end_date': [d if has else None for d, has in zip(end_dates.tolist(), has_end.tolist())],
+        'created_at': [stamp] * n,
+        'updated_at': [stamp] * n,
+    }
+
+    k = logs_per_account
+    change = rng.integers(-500 * PENCE, 1000 * PENCE, (n, k))
+    # Changes after each log, summed from the right: the last log ends at
+    # the account's balance and each earlier one where the next started
+    later = np.cumsum(change[:, ::-1], axis=1)[:, ::-1] - change
+    new_balance = balance[:, None] - later
+    gaps = rng.integers(86400, 61 * 86400, (n, k))
+    ago = rng.integers(86400, 30 * 86400, n)[:, None] + np.cumsum(gaps[:, ::-1], axis=1)[:, ::-1] - gaps
+
+    logs = {
+        'previous_balance': (new_balance - change).ravel().tolist(),
+        'new_balance': new_balance.ravel().tolist(),
+        'change_amount': change.ravel().tolist(),
+        'timestamp': _timestamps(now, ago.ravel()).tolist(),
+        'source': ['synthetic'] * (n * k),
+    }
+    return accounts, logs
+
+def _insert_many(conn, table, columns):
+    """
+    executemany a {column: values} dict of stored values straight on the
+    driver, skipping SQLAlchemy's per-value type conversion.
+    """
+    names = list(columns)
+    marker = _MARKERS[conn.dialect.paramstyle]
+    sql = (f"INSERT INTO {table.name} ({', '.join(names)}) VALUES "
+           f"({', '.join(marker.format(n=i + 1, name=name) for i, name in enumerate(names))})")
+    rows = list(zip(*columns.values()))
+    if not conn.dialect.positional:
+        rows = [dict(zip(names, row)) for row in rows]
+    if rows:
+        conn.exec_driver_sql(sql, rows)
+    return len(rows)
+
+def _select_rows(columns, keep):
+    return {name: [value for value, kept in zip(values, keep) if kept] for name, values in columns.items()}
+
+def load_synthetic(engine, banks, accounts, logs_per_account, seed=42, batch_size=INSERT_BATCH_SIZE,
+                   drop_indexes=True, progress=None):
+    """
+    Generate banks, accounts and their logs into the database, idempotently
+    by natural key: banks already there by name and accounts by number are
+    skipped, and logs are only added for the accounts this run inserts.
+    The same seed always generates the same rows.
+
+    Rows go in with driver-level executemany, committed every batch_size
+    rows. drop_indexes drops the secondary indexes on accounts and
+    transaction_logs for the load and rebuilds them after it, which is
+    much faster than maintaining them row by row. The rollups and maturity
+    calendar are rebuilt at the end if anything was inserted.
+    progress(counts), if given, is called after each chunk. Returns
+    {table: rows inserted}.
+    """
+    today = date.today()
+    now = datetime.utcnow()
+    counts = {'banks': 0, 'accounts': 0, 'transaction_logs': 0}
+    tables = (Account.__table__, TransactionLog.__table__)
+
+    with engine.begin() as conn:
+        existing = set(conn.execute(sa.select(Bank.bank_name)).scalars())
+        rows = [row for row in synthetic_banks(banks, now) if row['bank_name'] not in existing]
+        if rows:
+            conn.execute(sa.insert(Bank), rows)
+        counts['banks'] = len(rows)
+        ids = dict(conn.execute(sa.select(Bank.bank_name, Bank.id)).all())
+        bank_ids = [ids[row['bank_name']] for row in synthetic_banks(banks, now)]
+
+    with engine.connect() as conn:
+        dropped = False
+        pending = 0
+        try:
+            for start in range(0, accounts, GENERATE_CHUNK):
+                stop = min(start + GENERATE_CHUNK, accounts)
+                account_rows, log_rows = generate_chunk(seed, start, stop, bank_ids, logs_per_account, today, now)
+
+                numbers = account_rows['account_number']
+                existing = set(conn.execute(
+                    sa.select(Account.account_number).where(Account.account_number.between(numbers[0], numbers[-1]))
+                ).scalars())
+                if existing:
+                    keep = [number not in existing for number in numbers]
+                    account_rows = _select_rows(account_rows, keep)
+                    log_rows = _select_rows(log_rows, [kept for kept in keep for _ in range(logs_per_account)])
+                if drop_indexes and not dropped and account_rows['account_number']:
+                    # Only once there is something to insert, so a re-run that
+                    # finds everything already loaded leaves the indexes alone
+                    for table in tables:
+                        for index in table.indexes:
+                            index.drop(conn, checkfirst=True)
+                    dropped = True
+                inserted = _insert_many(conn, Account.__table__, account_rows)
+                counts['accounts'] += inserted
+
+                if inserted and logs_per_account:
+                    numbers = account_rows['account_number']
+                    ids = dict(conn.execute(
+                        sa.select(Account.account_number, Account.id)
+                        .where(Account.account_number.between(numbers[0], numbers[-1]))
+                    ).all())
+                    log_rows['account_id'] = [ids[number] for number in numbers for _ in range(logs_per_account)]
+                    counts['transaction_logs'] += _insert_many(conn, TransactionLog.__table__, log_rows)
+
+                pending += inserted * (1 + logs_per_account)
+                if pending >= batch_size:
+                    conn.commit()
+                    pending = 0
+                if progress is not None:
+                    progress(counts)
+            conn.commit()
+        finally:
+            if dropped:
+                # Put the indexes back even if the load failed part way,
+                # keeping what it committed
+                conn.rollback()
+                for table in tables:
+                    for index in table.indexes:
+                        index.create(conn, checkfirst=True)
+                conn.execute(sa.text("ANALYZE"))
+                conn.commit()
+
+    if not any(counts.values()):
+        return counts
+    with engine.begin() as conn:
+        rebuild_rollups(conn)
+        rebuild_maturities(conn)
+        bump_version(conn)
+    return counts
+
+def write_upload_csv(path, accounts, rows, seed=0):
+    """
+    Write an upload CSV of rows new balances for synthetic accounts drawn
+    from the first accounts account numbers.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Account', 'bal'])
+        for _ in range(rows):
+            writer.writerow([account_number(rng.randrange(accounts)), f"{rng.uniform(0, 100000):.2f}"])
@@ -0,0 +1,72 @@
+import os
+import sys
+from contextlib import contextmanager
+import pytest
+import sqlalchemy as sa
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# A small synthetic dataset: enough rows that a page issuing a query per
+# bank or per account shows up in its query count
+SEED_BANKS = 5
+SEED_ACCOUNTS = 100
+SEED_LOGS_PER_ACCOUNT = 3
+
+def scratch_environ(workdir):
+    """Settings pointing the app at a scratch database and folders under workdir."""
+    return {
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'test.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'WRITE_LOCK_FILE': os.path.join(workdir, 'write.lock'),
+        # Reconcile uploads inline, within the request
+        'UPLOAD_WORKERS': '0',
+        'LOG_LEVEL': 'WARNING',
+    }
+
+@pytest.fixture
+def scratch_env(tmp_path, monkeypatch):
+    """Point the app at scratch files for subprocesses started by the test."""
+    for name, value in scratch_environ(str(tmp_path)).items():
+        monkeypatch.setenv(name, value)
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The app, on a scratch SQLite database seeded with synthetic data."""
+    os.environ.update(scratch_environ(str(tmp_path_factory.mktemp('app'))))
+    from main import app, db
+    from migrations import upgrade_schema
+    from synthetic import load_synthetic
+
+    with app.app_context():
+        upgrade_schema()
+        load_synthetic(db.engine, SEED_BANKS, SEED_ACCOUNTS, SEED_LOGS_PER_ACCOUNT)
+    return app
+
+@pytest.fixture
+def client(app):
+    from main import response_cache
+
+    # Every request computes its response rather than reusing another test's
+    response_cache.clear()
+    return app.test_client()
+
+@pytest.fixture
+def captured_selects():
+    """A context manager that collects the SQL of every SELECT run inside it."""
+    @contextmanager
+    def capture():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        sa.event.listen(sa.engine.Engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            sa.event.remove(sa.engine.Engine, 'before_cursor_execute', record)
+
+    return capture
@@ -0,0 +1,14 @@
+from datetime import datetime
+from asof import parse_as_of
+
+def test_parse_as_of_converts_offsets_to_naive_utc():
+    assert parse_as_of('2026-10-01T10:00:00+01:00') == datetime(2026, 10, 1, 9, 0)
+    assert parse_as_of('2026-10-01') == datetime(2026, 10, 1, 23, 59, 59, 999999)
+
+def test_balances_as_of_with_offset_matches_utc(client):
+    aware = client.get('/api/balances?as_of=2026-10-01T10:00:00%2B00:00')
+    naive = client.get('/api/balances?as_of=2026-10-01T10:00:00')
+
+    assert aware.status_code == 200
+    assert aware.get_json() == naive.get_json()
+    assert client.get('/reports?as_of=2026-10-01T10:00:00%2B00:00').status_code == 200
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import pytest
+from backup import backup_database, restore_database, restore_snapshot, write_snapshot
+
+def make_database(path, label, rows=100):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, label TEXT)')
+    conn.executemany('INSERT INTO items (label) VALUES (?)', [(label,)] * rows)
+    conn.commit()
+    conn.close()
+
+def open_with_pending_wal(path):
+    """A connection on path in WAL mode whose last commit is still only in the WAL, as on a live app."""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA wal_autocheckpoint = 0')
+    conn.execute("UPDATE items SET label = 'stale'")
+    conn.commit()
+    assert os.path.getsize(path + '-wal') > 0
+    return conn
+
+def labels(path):
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        return {label for label, in conn.execute('SELECT label FROM items')}
+    finally:
+        conn.close()
+
+def test_restore_over_database_with_pending_wal(tmp_path):
+    target = str(tmp_path / 'live.db')
+    backup = str(tmp_path / 'backup.db')
+    make_database(target, 'old')
+    make_database(backup, 'restored', rows=250)
+
+    live = open_with_pending_wal(target)
+    restore_database(backup, target)
+
+    # The open connection sees the restore, and nothing of the WAL survives it
+    assert {label for label, in live.execute('SELECT DISTINCT label FROM items')} == {'restored'}
+    live.close()
+    assert labels(target) == {'restored'}
+    assert sqlite3.connect(target).execute('SELECT COUNT(*) FROM items').fetchone()[0] == 250
+
+def test_backup_refuses_to_replace_live_database(tmp_path):
+    target = str(tmp_path / 'live.db')
+    source = str(tmp_path / 'source.db')
+    make_database(target, 'old')
+    make_database(source, 'new')
+
+    live = open_with_pending_wal(target)
+    with pytest.raises(RuntimeError):
+        backup_database(source, target)
+    live.close()
+    assert labels(target) == {'stale'}
+
+def test_snapshot_round_trip_over_database_with_pending_wal(app, tmp_path):
+    from main import db
+
+    snapshot = str(tmp_path / 'snapshot')
+    with app.app_context():
+        with db.engine.connect() as conn:
+            counts = write_snapshot(conn, snapshot, 'csv')
+
+    target = str(tmp_path / 'live.db')
+    make_database(target, 'old')
+    live = open_with_pending_wal(target)
+    restore_snapshot(snapshot, target)
+    live.close()
+
+    conn = sqlite3.connect(target)
+    try:
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'items' not in tables
+        for table_name, count in counts.items():
+            assert conn.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0] == count
+    finally:
+        conn.close()
+
+def set_data_version(path, version):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE data_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)')
+    conn.execute('INSERT INTO data_version (id, version) VALUES (1, ?)', (version,))
+    conn.commit()
+    conn.close()
+
+def test_restore_moves_data_version_past_both_databases(tmp_path):
+    target = str(tmp_path / 'live.db')
+    backup = str(tmp_path / 'backup.db')
+    make_database(target, 'old')
+    make_database(backup, 'restored')
+    set_data_version(target, 10)
+    set_data_version(backup, 3)
+
+    restore_database(backup, target)
+
+    # ETags issued for versions up to 10 must never match again
+    conn = sqlite3.connect(target)
+    assert conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0] == 11
+    conn.close()
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+def test_transaction_filters_convert_offsets_to_utc(app, client):
+    from models import TransactionLog
+
+    with app.app_context():
+        timestamps = sorted(log.timestamp for log in TransactionLog.query.limit(50))
+    middle = timestamps[len(timestamps) // 2]
+    local = (middle + timedelta(hours=2)).isoformat() + '+02:00'
+
+    naive = client.get('/api/transactions', query_string={'from': middle.isoformat(), 'limit': 500})
+    aware = client.get('/api/transactions', query_string={'from': local, 'limit': 500})
+
+    assert aware.status_code == 200
+    assert aware.get_json()['transactions'] == naive.get_json()['transactions']
+    assert client.get('/api/transactions', query_string={'to': 'yesterday'}).status_code == 400
@@ -0,0 +1,10 @@
+import pytest
+from migrations import QUERY_BUDGETS
+
+@pytest.mark.parametrize('path', sorted(QUERY_BUDGETS))
+def test_page_stays_within_query_budget(client, captured_selects, path):
+    with captured_selects() as statements:
+        response = client.get(path)
+
+    assert response.status_code == 200
+    assert len(statements) <= QUERY_BUDGETS[path], '\n'.join(' '.join(s.split()) for s in statements)
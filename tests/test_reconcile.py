@@ -0,0 +1,85 @@
+import pandas as pd
+from reconcile import apply_bulk, new_results, prepare_bulk
+
+def test_apply_bulk_rechains_accounts_changed_after_prepare(app):
+    from main import db
+    from maturities import check_maturities
+    from models import Account, Bank, TransactionLog
+    from rollups import check_rollups
+
+    with app.app_context():
+        edited, moved, rebanked = Account.query.filter(Account.end_date.isnot(None)).order_by(Account.id).limit(3)
+        removed = Account(account_name='Removed', account_number='REMOVED1', balance=10.0, account_type='isa',
+                          owner='a', savings='y', bank_name=rebanked.bank_name, bank_id=rebanked.bank_id)
+        db.session.add(removed)
+        db.session.commit()
+
+        df = pd.DataFrame({
+            'Account': [edited.account_number, edited.account_number, moved.account_number,
+                        rebanked.account_number, removed.account_number],
+            'bal': [100, 150, 200, 300, 400],
+        })
+        results = new_results()
+        plan = prepare_bulk(df, results)
+        db.session.rollback()
+
+        # Writes that land between the lookups and the write
+        edited.balance = 55
+        moved.owner = 'j' if moved.owner != 'j' else 'a'
+        db.session.get(Bank, rebanked.bank_id).frn = 'MOVED'
+        db.session.delete(db.session.get(Account, removed.id))
+        db.session.commit()
+
+        apply_bulk(plan, results, batch_id=None)
+        db.session.commit()
+
+        logs = TransactionLog.query.filter_by(account_id=edited.id, source="CSV upload").order_by(TransactionLog.id).all()
+        assert [(log.previous_balance, log.new_balance, log.change_amount) for log in logs] == [
+            (55.0, 100.0, 45.0), (100.0, 150.0, 50.0)
+        ]
+        assert results['updated'] == 4
+        assert results['not_found_accounts'] == ['REMOVED1']
+        assert db.session.get(Account, moved.id).balance == 200.0
+
+        with db.engine.connect() as conn:
+            assert check_rollups(conn) == []
+            assert check_maturities(conn) == []
+
+def test_ingest_csv_keeps_leading_zeros_in_all_numeric_chunks(app):
+    import io
+    from main import db
+    from models import Account
+    from reconcile import ingest_csv
+
+    with app.app_context():
+        bank = Account.query.first()
+        for number in ('007', '123'):
+            db.session.add(Account(account_name=f"Numeric {number}", account_number=number, balance=1.0,
+                                   account_type='isa', owner='a', savings='y', bank_name=bank.bank_name,
+                                   bank_id=bank.bank_id))
+        db.session.commit()
+
+        # The second chunk is all digits, which pandas would read as integers
+        stream = io.StringIO("Account,bal\nA-1,5\nB-2,5\n123,20.50\n007,30\n")
+        results = ingest_csv(stream, chunk_size=2)
+        db.session.commit()
+
+        assert results['updated'] == 2
+        assert results['not_found_accounts'] == ['A-1', 'B-2']
+        assert Account.query.filter_by(account_number='007').one().balance == 30.0
+
+def test_csv_with_utf8_bom_is_accepted(app, tmp_path):
+    from main import db
+    from models import Account
+    from reconcile import check_csv_header, ingest_csv
+
+    # As Excel saves "CSV UTF-8"
+    path = tmp_path / 'excel.csv'
+    path.write_bytes('Account,bal\r\nBOM-1,12.34\r\n'.encode('utf-8-sig'))
+    check_csv_header(str(path))
+
+    with app.app_context():
+        with open(path, 'rb') as f:
+            results = ingest_csv(f, chunk_size=10)
+        db.session.rollback()
+    assert results['not_found_accounts'] == ['BOM-1']
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+from startup import HEAVY_MODULES, time_import
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def test_import_main_defers_heavy_modules(scratch_env):
+    check = f"import main, sys; loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]; assert not loaded, loaded"
+    result = subprocess.run([sys.executable, '-c', check], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+def test_import_main_within_startup_budget(app, scratch_env):
+    # A loose guard against a large regression; deferring the heavy modules,
+    # checked above, is what keeps startup fast
+    seconds, heavy = time_import(ROOT, runs=5, best=True)
+    assert heavy == []
+    assert seconds * 1000 <= 2 * app.config['STARTUP_BUDGET_MS']
@@ -0,0 +1,29 @@
+import pytest
+import sqlalchemy as sa
+import synthetic
+from models import Account, TransactionLog, db
+
+def test_failed_load_puts_indexes_back(tmp_path, monkeypatch):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'load.db'}")
+    db.metadata.create_all(engine)
+    generate_chunk = synthetic.generate_chunk
+    calls = []
+
+    def fail_second_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("generation failed")
+        return generate_chunk(*args)
+
+    monkeypatch.setattr(synthetic, 'GENERATE_CHUNK', 10)
+    monkeypatch.setattr(synthetic, 'generate_chunk', fail_second_chunk)
+    with pytest.raises(RuntimeError):
+        synthetic.load_synthetic(engine, 2, 30, 2, batch_size=1)
+
+    inspector = sa.inspect(engine)
+    for table in (Account.__table__, TransactionLog.__table__):
+        assert {index.name for index in table.indexes} <= {ix['name'] for ix in inspector.get_indexes(table.name)}
+    with engine.connect() as conn:
+        # The first chunk was committed before the failure
+        assert conn.execute(sa.select(sa.func.count()).select_from(Account)).scalar() == 10
+    engine.dispose()
@@ -1,25 +1,41 @@
-import pandas as pd
-from datetime import datetime
-from io import StringIO
-from app import db
-from models import Account, Bank, TransactionLog
+import csv
+import io
+import json
+import zlib
+import sqlalchemy as sa
+import sqlalchemy.orm
+from datetime import date, datetime
+from models import db, Account, ArchivedTransactionLog, Bank, MonthlyBalanceSummary, TransactionLog, UploadBatch
+from money import parse_money
+from reconcile import CSV_DTYPES
 
-def process_csv_file(file):
+# Tables that can be exported, by the name used in URLs and on the CLI
+EXPORT_TABLES = {
+    'accounts': Account.__table__,
+    'banks': Bank.__table__,
+    'transaction_logs': TransactionLog.__table__,
+    'transaction_logs_archive': ArchivedTransactionLog.__table__,
+    'monthly_balance_summaries': MonthlyBalanceSummary.__table__,
+}
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+def process_csv_file(file, chunk_size=50000):
     """
     Process a CSV file containing account balance updates.
     
     The CSV should have two columns: Account,bal
+    The file is parsed straight from its stream, chunk_size rows at a time.
+    
+    Changes are recorded as an upload batch.
     
     Returns a dict with results of the processing.
     """
-    # Read the CSV file
-    content = file.read().decode('utf-8')
-    csv_data = pd.read_csv(StringIO(content))
-    
-    # Validate CSV format
-    required_columns = ['Account', 'bal']
-    if not all(col in csv_data.columns for col in required_columns):
-        raise ValueError("CSV must contain 'Account' and 'bal' columns")
+    import pandas as pd
+
+    batch = UploadBatch(filename=getattr(file, 'filename', None) or 'upload.csv', source="csv_upload")
+    db.session.add(batch)
+    db.session.flush()
     
     # Track statistics
     results = {
@@ -30,114 +46,231 @@ def process_csv_file(file):
         'error_accounts': []
     }
     
-    # Process each row in the CSV
-    for index, row in csv_data.iterrows():
-        account_name = row['Account']
-        new_balance = float(row['bal'])
-        
-        try:
-            # Find the account by name
-            account = Account.query.filter_by(account_name=account_name).first()
+    # Read the CSV file in chunks
+    with pd.read_csv(file, chunksize=chunk_size, dtype=CSV_DTYPES) as reader:
+        for csv_data in reader:
+            # Validate CSV format
+            required_columns = ['Account', 'bal']
+            if not all(col in csv_data.columns for col in required_columns):
+                raise ValueError("CSV must contain 'Account' and 'bal' columns")
             
-            if account:
-                # Update account balance and log the change
-                previous_balance = account.balance
-                account.balance = new_balance
-                
-                # Create transaction log
-                log = TransactionLog(
-                    account_id=account.id,
-                    previous_balance=previous_balance,
-                    new_balance=new_balance,
-                    change_amount=new_balance - previous_balance,
-                    source="csv_upload"
-                )
+            # Process each row in the chunk
+            for index, row in csv_data.iterrows():
+                account_name = row['Account']
+                new_balance = parse_money(row['bal'])
                 
-                db.session.add(log)
-                results['updated'] += 1
-            else:
-                # Account not found
-                results['not_found'] += 1
-                results['not_found_accounts'].append(account_name)
-        except Exception as e:
-            # Error processing this account
-            results['error'] += 1
-            results['error_accounts'].append({
-                'account': account_name,
-                'error': str(e)
-            })
+                try:
+                    # Find the account by name
+                    account = Account.query.filter_by(account_name=account_name).first()
+                    
+                    if account:
+                        # Update account balance and log the change
+                        previous_balance = account.balance
+                        account.balance = new_balance
+                        
+                        # Create transaction log
+                        log = TransactionLog(
+                            account_id=account.id,
+                            previous_balance=previous_balance,
+                            new_balance=new_balance,
+                            change_amount=new_balance - previous_balance,
+                            source="csv_upload",
+                            batch_id=batch.id
+                        )
+                        
+                        db.session.add(log)
+                        results['updated'] += 1
+                    else:
+                        # Account not found
+                        results['not_found'] += 1
+                        results['not_found_accounts'].append(account_name)
+                except Exception as e:
+                    # Error processing this account
+                    results['error'] += 1
+                    results['error_accounts'].append({
+                        'account': account_name,
+                        'error': str(e)
+                    })
+            
+            # Write the chunk out so its objects can be released
+            db.session.flush()
+    
+    batch.updated = results['updated']
+    batch.not_found = results['not_found']
+    batch.error = results['error']
+    batch.rows_processed = results['updated'] + results['not_found'] + results['error']
+    batch.not_found_accounts = results['not_found_accounts']
+    batch.error_accounts = results['error_accounts']
     
     # Commit all changes
     db.session.commit()
     
     return results
 
+def iter_table_rows(conn, table_name, batch_size=1000):
+    """
+    Yield every row of an export table as a dict, in primary key order.
+
+    Rows are fetched batch_size at a time through a streaming cursor, so
+    only one batch is held in memory however large the table is.
+    """
+    table = EXPORT_TABLES[table_name]
+    result = conn.execution_options(yield_per=batch_size).execute(
+        sa.select(table).order_by(*table.primary_key.columns)
+    )
+    for partition in result.mappings().partitions():
+        for row in partition:
+            yield dict(row)
+
 def backup_data():
     """
     Create a backup of all accounts data.
-    Returns a dictionary with account details.
+    Returns a list of dicts with account details.
     """
-    accounts = Account.query.all()
     backup = []
-    
-    for account in accounts:
-        account_data = {
-            'id': account.id,
-            'account_name': account.account_name,
-            'account_number': account.account_number,
-            'balance': account.balance,
-            'account_type': account.account_type,
-            'owner': account.owner,
-            'savings': account.savings,
-            'bank_name': account.bank_name
-        }
-        
-        if account.account_type != 'none':
-            account_data.update({
-                'interest_rate': account.interest_rate,
-                'start_date': account.start_date.strftime('%Y-%m-%d') if account.start_date else None,
-                'end_date': account.end_date.strftime('%Y-%m-%d') if account.end_date else None,
-                'interest_frequency': account.interest_frequency
-            })
-        
-        backup.append(account_data)
-    
+
+    with db.engine.connect() as conn:
+        for account in iter_table_rows(conn, 'accounts'):
+            account_data = {
+                'id': account['id'],
+                'account_name': account['account_name'],
+                'account_number': account['account_number'],
+                'balance': account['balance'],
+                'account_type': account['account_type'],
+                'owner': account['owner'],
+                'savings': account['savings'],
+                'bank_name': account['bank_name']
+            }
+
+            if account['account_type'] != 'none':
+                account_data.update({
+                    'interest_rate': account['interest_rate'],
+                    'start_date': account['start_date'].strftime('%Y-%m-%d') if account['start_date'] else None,
+                    'end_date': account['end_date'].strftime('%Y-%m-%d') if account['end_date'] else None,
+                    'interest_frequency': account['interest_frequency']
+                })
+
+            backup.append(account_data)
+
     return backup
 
-def get_account_snapshots():
+def _export_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def iter_export(conn, table_name, fmt='csv', compress=False, batch_size=1000):
     """
-    Get before/after snapshots of accounts that have been updated in the most recent CSV upload.
+    Yield an export table as CSV or NDJSON bytes, one chunk per batch of rows.
+
+    With compress the chunks form a single gzip stream. Memory stays flat:
+    each batch is encoded, compressed and handed on before the next one is
+    fetched.
     """
-    # Get the latest transaction logs from CSV uploads
-    latest_logs = TransactionLog.query.filter_by(source="csv_upload").order_by(
-        TransactionLog.timestamp.desc()
-    ).all()
-    
-    # Group by account and get the most recent log for each account
-    account_logs = {}
-    for log in latest_logs:
-        if log.account_id not in account_logs:
-            account_logs[log.account_id] = log
-    
-    # Build the snapshots
-    snapshots = []
-    for account_id, log in account_logs.items():
-        account = Account.query.get(account_id)
-        
-        if account:
-            snapshot = {
-                'account_name': account.account_name,
-                'account_number': account.account_number,
-                'bank_name': account.bank_name,
-                'before': {
-                    'balance': log.previous_balance,
-                    'timestamp': log.timestamp
-                },
-                'after': {
-                    'balance': log.new_balance,
-                    'change': log.change_amount
-                }
-            }
-            snapshots.append(snapshot)
-    
-    return snapshots
+    columns = [column.name for column in EXPORT_TABLES[table_name].columns]
+    yield from encode_rows(iter_table_rows(conn, table_name, batch_size), columns, fmt, compress, batch_size)
+
+def encode_rows(rows, columns, fmt='csv', compress=False, batch_size=1000):
+    """
+    Encode an iterable of row dicts as CSV or NDJSON bytes, yielding a chunk
+    every batch_size rows; see iter_export.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+
+    def take():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    count = 0
+    for row in rows:
+        if fmt == 'csv':
+            writer.writerow([_export_value(row[column]) for column in columns])
+        else:
+            buffer.write(json.dumps({column: _export_value(row[column]) for column in columns}))
+            buffer.write('\n')
+        count += 1
+        if count % batch_size == 0:
+            chunk = take()
+            if chunk:
+                yield chunk
+
+    chunk = take()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+def batch_summary(batch):
+    """Return the result counts and lists recorded for an upload batch."""
+    return {
+        'batch_id': batch.id,
+        'filename': batch.filename,
+        'updated': batch.updated,
+        'not_found': batch.not_found,
+        'error': batch.error,
+        'not_found_accounts': batch.not_found_accounts or [],
+        'error_accounts': batch.error_accounts or [],
+        'rows_processed': batch.rows_processed,
+        'peak_rss_mb': batch.peak_rss_mb
+    }
+
+def batch_snapshots_query(batch_id):
+    """
+    Build the select for an upload batch's logs, one per uploaded line in
+    file order, with the account each one changed loaded in the same query.
+    """
+    return sa.select(TransactionLog).join(TransactionLog.account).options(
+        sa.orm.contains_eager(TransactionLog.account)
+    ).where(
+        TransactionLog.batch_id == batch_id
+    ).order_by(TransactionLog.id)
+
+def snapshot_from_log(log):
+    """Shape a batch log the way the reports template expects."""
+    return {
+        'account_name': log.account.account_name,
+        'account_number': log.account.account_number,
+        'bank_name': log.account.bank_name,
+        'before': {
+            'balance': log.previous_balance,
+            'timestamp': log.timestamp
+        },
+        'after': {
+            'balance': log.new_balance,
+            'change': log.change_amount
+        }
+    }
+
+def get_account_snapshots(batch_id=None):
+    """
+    Get before/after snapshots of accounts that have been updated in an upload batch.
+
+    Defaults to the most recent batch. An account updated more than once in
+    the batch is reported with its last change.
+    """
+    if batch_id is None:
+        batch_id = db.session.execute(
+            sa.select(sa.func.max(UploadBatch.id))
+        ).scalar()
+        if batch_id is None:
+            return []
+
+    # Latest log per account in the batch, resolved in the same query
+    last_log_ids = sa.select(sa.func.max(TransactionLog.id)).where(
+        TransactionLog.batch_id == batch_id
+    ).group_by(TransactionLog.account_id)
+
+    logs = db.session.scalars(
+        batch_snapshots_query(batch_id).where(TransactionLog.id.in_(last_log_ids))
+    )
+    return [snapshot_from_log(log) for log in logs]
@@ -0,0 +1,75 @@
+import threading
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from models import DataVersion
+
+def current_version(conn):
+    """Return the committed data version, or 0 before the first write."""
+    version = conn.execute(sa.select(DataVersion.version).where(DataVersion.id == 1)).scalar()
+    return version or 0
+
+def bump_version(conn):
+    """Advance the data version inside the caller's transaction."""
+    result = conn.execute(
+        sa.update(DataVersion).where(DataVersion.id == 1).values(version=DataVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        conn.execute(sa.insert(DataVersion).values(id=1, version=1))
+
+@sa.event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info['data_changed'] = True
+
+@sa.event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info['data_changed'] = True
+
+@sa.event.listens_for(Session, 'before_commit')
+def _bump_on_commit(session):
+    # Flush first so pending changes are counted, then bump in the same
+    # transaction: every worker sees the new version exactly when it sees
+    # the data that caused it.
+    session.flush()
+    if session.info.pop('data_changed', False):
+        bump_version(session.connection())
+
+@sa.event.listens_for(Session, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('data_changed', None)
+
+class VersionedCache:
+    """
+    In-process cache of values computed for one data version.
+
+    Entries are only ever served for the version they were computed at, and
+    all of them are dropped as soon as a newer version is seen, so each
+    gunicorn worker stays correct without any cross-process invalidation.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._entries = {}
+
+    def get_or_compute(self, version, key, compute):
+        with self._lock:
+            if version == self._version and key in self._entries:
+                return self._entries[key]
+
+        value = compute()
+
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._version = version
+                self._entries = {}
+            if version == self._version and len(self._entries) < self.max_entries:
+                self._entries[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._entries = {}
@@ -0,0 +1,169 @@
+import fcntl
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+import sqlalchemy as sa
+from flask import current_app
+from logconfig import current_request_id, request_id_bound
+from metrics import counted_towards, current_request_metrics
+from models import db
+
+logger = logging.getLogger(__name__)
+
+class WriteRejected(Exception):
+    """Raised by a write function to refuse the write with a message for the user."""
+
+class WriteQueue:
+    """
+    The single writer of one worker process.
+
+    Write functions from every thread are queued and run one at a time on a
+    writer thread with its own app context and session. Whatever is queued
+    when the writer gets to it, up to group_max writes, runs as one group:
+    each write in its own savepoint, so one that raises is rolled back alone
+    and its exception goes to its caller, and then a single commit (and
+    fsync) for the whole group.
+
+    Groups from different worker processes take turns through an exclusive
+    lock on lock_path, if given, so SQLite writers wait for each other in
+    the kernel instead of failing with "database is locked". begin, if
+    given, is the statement that opens each group's transaction.
+    """
+
+    def __init__(self, app, group_max=64, lock_path=None, begin=None):
+        self.app = app
+        self.group_max = group_max
+        self.lock_path = lock_path
+        self.begin = begin
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _writer_queue(self):
+        # Started on first use, and again in each forked worker, which
+        # inherits the attributes but not the thread
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(target=self._run_writer, name='writer', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def run(self, fn, *args):
+        """
+        Run fn(*args) on the writer and return its result once it is
+        committed, or raise what it raised with its changes rolled back.
+
+        fn writes through db.session as usual but must not commit or roll
+        back, and should return plain values: ORM objects are expired by the
+        commit and belong to the writer's session.
+        """
+        if threading.current_thread() is self._thread:
+            # Called from a write already running on the writer
+            return fn(*args)
+        future = Future()
+        self._writer_queue().put((fn, args, current_request_metrics(), current_request_id(), future))
+        return future.result()
+
+    def _run_writer(self):
+        with self.app.app_context():
+            while True:
+                group = [self._queue.get()]
+                while len(group) < self.group_max:
+                    try:
+                        group.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._commit_group(group)
+
+    def _commit_group(self, group):
+        outcomes = []
+        try:
+            with self._file_lock():
+                if self.begin is not None:
+                    db.session.connection().exec_driver_sql(self.begin)
+                # A write on its own needs no savepoint: if it fails, the
+                # whole transaction is rolled back instead
+                alone = len(group) == 1
+                for fn, args, metrics, request_id, future in group:
+                    try:
+                        with counted_towards(metrics), request_id_bound(request_id), \
+                                nullcontext() if alone else db.session.begin_nested():
+                            result = fn(*args)
+                            db.session.flush()
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                    else:
+                        outcomes.append((future, result, None))
+                if alone and outcomes[0][2] is not None:
+                    db.session.rollback()
+                else:
+                    db.session.commit()
+        except Exception as e:
+            # Nothing in the group was written
+            logger.error("Committing a group of %d writes failed: %s", len(group), e, exc_info=True)
+            db.session.rollback()
+            outcomes = [(future, None, e) for *_, future in group]
+        finally:
+            db.session.close()
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    @contextmanager
+    def _file_lock(self):
+        if self.lock_path is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def run_write(fn, *args):
+    """Run fn(*args) on the current app's writer; see WriteQueue.run."""
+    return current_app.extensions['writes'].run(fn, *args)
+
+def _configure_sqlite(engine, busy_timeout_ms):
+    @sa.event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+        # Readers see the last commit instead of waiting for the writer
+        dbapi_connection.execute('PRAGMA journal_mode = WAL')
+
+def init_writes(app):
+    """
+    Give app its WriteQueue, which the write routes and upload jobs send
+    their changes through.
+
+    On SQLite the app's connections are also switched to WAL, with
+    SQLITE_BUSY_TIMEOUT_MS for writers outside the queue such as CLI
+    commands, and groups take turns across processes through the
+    WRITE_LOCK_FILE. Each group opens its transaction itself with BEGIN
+    IMMEDIATE: pysqlite would otherwise let the first SAVEPOINT start the
+    transaction and its RELEASE commit it, and taking the write lock up
+    front means a group never has to upgrade a read lock.
+    """
+    with app.app_context():
+        engine = db.engine
+    lock_path = None
+    begin = None
+    if engine.dialect.name == 'sqlite':
+        _configure_sqlite(engine, app.config['SQLITE_BUSY_TIMEOUT_MS'])
+        lock_path = app.config['WRITE_LOCK_FILE']
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        begin = 'BEGIN IMMEDIATE'
+
+    writes = WriteQueue(app, app.config['WRITE_GROUP_MAX'], lock_path, begin)
+    app.extensions['writes'] = writes
+    return writes